@@ -0,0 +1,25 @@
+"""ASGI profile: gunicorn managing uvicorn workers.
+
+    gunicorn -c gunicorn.asgi.conf.py project.asgi:application
+
+Each worker runs one event loop, so async views (project upload, delete and
+domain assignment) wait on the database, disk and storage without holding a
+thread, as does every middleware; synchronous views run on the worker's
+thread pool.
+It is gunicorn.conf.py with the ``asgi`` workload profile, one worker per
+CPU, as concurrency comes from the event loop rather than from processes and
+threads. Needs the uvicorn-worker package.
+"""
+import os
+
+from project import tuning
+
+# Hooks and settings shared with the WSGI profile
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "gunicorn.conf.py")) as _base:
+    exec(compile(_base.read(), _base.name, "exec"))
+
+
+_plan = tuning.plan_from_environment("asgi")
+worker_class = _plan.worker_class
+workers = _plan.workers
+threads = _plan.threads
@@ -1,11 +1,57 @@
-import multiprocessing
+import os
+
+from project import tuning
+
+# Workers, threads and the worker class follow the container's CPU quota and
+# memory limit and the GUNICORN_PROFILE workload; see project/tuning.py
+_plan = tuning.plan_from_environment()
 
 max_requests = 1000
 max_requests_jitter = 50
 log_file = "-"
 bind = "0.0.0.0:8000"
-workers = (multiprocessing.cpu_count() * 2) + 1
-
-threads = workers
+worker_class = _plan.worker_class
+workers = _plan.workers
+threads = _plan.threads
 
 timeout = 600
+
+# Load the app once in the master and fork workers from it: workers start
+# without importing Django and share its pages until they write to them.
+# Clients the app holds (storage, log writer, metrics flusher) are recreated
+# in each child by their os.register_at_fork handlers.
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() in ("1", "true", "yes")
+
+
+def _metrics():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "project.settings")
+    from project import metrics
+    return metrics
+
+
+def on_starting(server):
+    # Snapshots of a previous run would be counted as this one's
+    _metrics().reset_directory()
+
+
+def when_ready(server):
+    server.log.info("Tuned for the %s", tuning.describe(_plan))
+
+
+def pre_fork(server, worker):
+    # A database connection the master opened while loading the app would be
+    # shared by every child's socket
+    from django.apps import apps
+    if apps.ready:
+        from django.db import connections
+        connections.close_all()
+
+
+def post_worker_init(worker):
+    if _plan.max_rss_growth:
+        worker.rss_watchdog = tuning.RSSWatchdog(_plan.max_rss_growth)
+        worker.rss_watchdog.start()
+
+
+def child_exit(server, worker):
+    _metrics().mark_process_dead(worker.pid)
@@ -0,0 +1,129 @@
+"""Logging that keeps I/O off the request path.
+
+``BackgroundHandler`` formats a record on the thread that logs it and puts
+the line on a bounded queue; a writer thread of the process's own writes it
+to stderr. A full queue drops lines and counts them rather than making a
+request wait for the terminal or the App Service log collector.
+
+``SamplingFilter`` passes one record in ``rate`` and notes on it how many
+were skipped, for events such as per-file upload messages that are only
+interesting in aggregate.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+
+class BackgroundHandler(QueueHandler):
+    """Queues formatted lines for a writer thread started lazily in each
+    process, so forked workers get a thread of their own."""
+
+    def __init__(self, queue_size=10000, stream=None):
+        super().__init__(queue.Queue(queue_size))
+        self.target = logging.StreamHandler(stream or sys.stderr)
+        self.dropped = 0
+        self._listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # The parent's writer thread does not exist in the child; lines the
+        # parent had queued are its own to write
+        self.queue = queue.Queue(self.queue.maxsize)
+        self._listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._listener = QueueListener(self.queue, self.target)
+            self._listener.start()
+            self._pid = os.getpid()
+            atexit.register(self.stop)
+
+    def enqueue(self, record):
+        self._ensure_started()
+        # The count is not guarded by a lock, so it is approximate, which is
+        # all a report of lost lines needs
+        dropped = self.dropped
+        if dropped:
+            record.msg = f"{record.msg} [{dropped} log lines dropped]"
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+        else:
+            self.dropped -= dropped
+
+    def stop(self):
+        """Writes the lines still queued and stops the writer thread."""
+        listener, self._listener, self._pid = self._listener, None, None
+        if listener is not None:
+            listener.stop()
+
+    def close(self):
+        self.stop()
+        self.target.close()
+        super().close()
+
+
+class SamplingFilter(logging.Filter):
+    """Passes one record in ``rate``, adding ``(N more like it)`` to it."""
+
+    def __init__(self, rate=1):
+        super().__init__()
+        self.rate = max(1, int(rate))
+        self._skipped = 0
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if self.rate == 1:
+            return True
+        with self._lock:
+            self._skipped += 1
+            if self._skipped < self.rate:
+                return False
+            self._skipped = 0
+        record.msg = f"{record.msg} ({self.rate - 1} more like it)"
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with any ``extra`` fields of the record."""
+
+    _RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in self._RESERVED:
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def parse_levels(value):
+    """Parses ``"relecloud=DEBUG,django.db.backends=WARNING"`` into a
+    ``{logger: level}`` dict."""
+    levels = {}
+    for item in value.split(','):
+        name, _, level = item.strip().partition('=')
+        if name and level:
+            levels[name.strip()] = level.strip().upper()
+    return levels
@@ -0,0 +1,340 @@
+"""Request, storage and asset cache metrics in the Prometheus text format.
+
+Every process (each gunicorn worker and the job worker) records into its
+own in-memory registry and a background thread writes it to
+``METRICS_DIR/<pid>.json`` every ``METRICS_FLUSH_INTERVAL`` seconds.
+``MetricsMiddleware`` merges the snapshots of all processes, so a scrape of any
+worker reports the whole instance: counters and histograms are summed over
+every process that ever ran, gauges over the processes still alive. When
+gunicorn reaps a worker, ``mark_process_dead`` folds its snapshot into
+``archive.json`` so files do not pile up as workers are recycled.
+
+Latencies are histograms, so percentiles per route come from
+``histogram_quantile`` on the Prometheus side.
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+SIZE_BUCKETS = tuple(256 * 4 ** i for i in range(10))  # 256 B to 64 MiB
+ARCHIVE_NAME = 'archive.json'
+
+logger = logging.getLogger(__name__)
+
+# Storage time spent by the current request: [seconds, calls]
+_storage_time = ContextVar('storage_time', default=None)
+
+
+class Metric:
+    """A family of samples keyed by label values."""
+
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), value] for key, value in self._samples.items()]
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._samples[key] = self._samples.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """A per-process value; merged by summing over live processes."""
+
+    type = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._samples[key] = self._samples.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._samples[key] = value
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            # Counts per bucket (not cumulative), then the +Inf bucket, sum
+            sample = self._samples.get(key)
+            if sample is None:
+                sample = self._samples[key] = [0] * (len(self.buckets) + 2)
+            sample[bisect_left(self.buckets, value)] += 1
+            sample[-1] += value
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), list(value)] for key, value in self._samples.items()]
+
+
+REQUESTS = Counter('hoster_requests_total', 'HTTP requests handled.', ['route', 'method', 'status'])
+REQUEST_LATENCY = Histogram('hoster_request_duration_seconds', 'Time to produce a response.', ['route', 'method'])
+RESPONSE_SIZE = Histogram(
+    'hoster_response_size_bytes', 'Size of responses with a known length.', ['route'], buckets=SIZE_BUCKETS
+)
+IN_FLIGHT = Gauge('hoster_requests_in_flight', 'Requests being handled.')
+STORAGE_LATENCY = Histogram(
+    'hoster_storage_call_duration_seconds', 'Duration of calls to the storage service.', ['operation']
+)
+STORAGE_ERRORS = Counter('hoster_storage_call_errors_total', 'Failed calls to the storage service.', ['operation'])
+# Lookups in the asset cache by result: hit (memory), disk_hit, miss, or
+# coalesced into another request's miss
+ASSET_CACHE_LOOKUPS = Counter('hoster_asset_cache_lookups_total', 'Asset cache lookups.', ['result'])
+ASSET_CACHE_EVICTIONS = Counter('hoster_asset_cache_evictions_total', 'Asset cache entries evicted.', ['tier'])
+# Workers sharing a disk tier each count the entries they have seen
+ASSET_CACHE_BYTES = Gauge('hoster_asset_cache_bytes', 'Bytes held by the asset cache.', ['tier'])
+
+REGISTRY = [
+    REQUESTS, REQUEST_LATENCY, RESPONSE_SIZE, IN_FLIGHT, STORAGE_LATENCY, STORAGE_ERRORS,
+    ASSET_CACHE_LOOKUPS, ASSET_CACHE_EVICTIONS, ASSET_CACHE_BYTES,
+]
+
+
+@contextmanager
+def storage_call(operation):
+    """Times a call to the storage service, for the histogram and for the
+    current request's ``Server-Timing``."""
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STORAGE_ERRORS.inc(operation=operation)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STORAGE_LATENCY.observe(elapsed, operation=operation)
+        spent = _storage_time.get()
+        if spent is not None:
+            spent[0] += elapsed
+            spent[1] += 1
+
+
+def start_request():
+    """Starts collecting the storage time of the request on this context."""
+    _storage_time.set([0.0, 0])
+
+
+def request_storage_time():
+    """Returns the ``(seconds, calls)`` spent on storage by the current request."""
+    spent = _storage_time.get()
+    return tuple(spent) if spent is not None else (0.0, 0)
+
+
+# Snapshots
+
+def _snapshot():
+    return {
+        'pid': os.getpid(),
+        'metrics': {metric.name: metric.snapshot() for metric in REGISTRY},
+    }
+
+
+def _write_json(path, data):
+    directory = os.path.dirname(path)
+    with tempfile.NamedTemporaryFile('w', dir=directory, prefix='.tmp-', suffix='.json', delete=False) as file:
+        json.dump(data, file, separators=(',', ':'))
+    os.replace(file.name, path)
+
+
+def flush():
+    """Writes this process's snapshot to ``METRICS_DIR``."""
+    os.makedirs(settings.METRICS_DIR, exist_ok=True)
+    _write_json(os.path.join(settings.METRICS_DIR, f"{os.getpid()}.json"), _snapshot())
+
+
+class _Flusher:
+    """Flushes the process's metrics in the background, started lazily in
+    each process so that forked workers get a thread of their own."""
+
+    pid = None
+    lock = threading.Lock()
+
+    @classmethod
+    def ensure_started(cls):
+        if cls.pid == os.getpid() or settings.METRICS_FLUSH_INTERVAL <= 0:
+            return
+        with cls.lock:
+            if cls.pid == os.getpid():
+                return
+            cls.pid = os.getpid()
+            threading.Thread(target=cls.run, name='metrics-flush', daemon=True).start()
+
+    @classmethod
+    def run(cls):
+        pid = os.getpid()
+        while cls.pid == pid:
+            time.sleep(settings.METRICS_FLUSH_INTERVAL)
+            try:
+                flush()
+            except OSError as e:
+                logger.warning("Failed to write metrics: %s", e)
+
+    @classmethod
+    def reset(cls):
+        cls.lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_Flusher.reset)
+
+
+def start_flushing():
+    """Starts flushing this process's metrics every ``METRICS_FLUSH_INTERVAL``
+    seconds, unless it already does. Called by ``MetricsMiddleware`` on every
+    request and by ``manage.py runjobs`` when the job worker starts."""
+    _Flusher.ensure_started()
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _read_snapshots(directory):
+    for entry in os.scandir(directory):
+        if not entry.name.endswith('.json') or entry.name.startswith('.'):
+            continue
+        try:
+            with open(entry.path) as file:
+                yield entry.name, json.load(file)
+        except (OSError, ValueError):
+            # Removed or replaced while listing
+            continue
+
+
+def _merge(snapshots, include_gauges):
+    """Sums snapshots into ``{metric name: {label values: value}}``."""
+    types = {metric.name: metric.type for metric in REGISTRY}
+    merged = {metric.name: {} for metric in REGISTRY}
+    for snapshot in snapshots:
+        for name, samples in snapshot['metrics'].items():
+            if name not in merged or (types[name] == 'gauge' and not include_gauges(snapshot)):
+                continue
+            for key, value in samples:
+                key = tuple(key)
+                current = merged[name].get(key)
+                if current is None:
+                    merged[name][key] = value
+                elif isinstance(value, list):
+                    merged[name][key] = [a + b for a, b in zip(current, value)]
+                else:
+                    merged[name][key] = current + value
+    return merged
+
+
+def collect():
+    """Returns the merged metrics of every process of the instance."""
+    flush()
+    snapshots = [snapshot for _, snapshot in _read_snapshots(settings.METRICS_DIR)]
+    return _merge(snapshots, lambda snapshot: snapshot['pid'] is not None and _alive(snapshot['pid']))
+
+
+def reset_directory():
+    """Removes every snapshot. Called when gunicorn starts, before any
+    worker has recorded anything."""
+    os.makedirs(settings.METRICS_DIR, exist_ok=True)
+    for entry in os.scandir(settings.METRICS_DIR):
+        if entry.name.endswith('.json'):
+            os.remove(entry.path)
+
+
+def mark_process_dead(pid):
+    """Folds the counters and histograms of an exited process into the
+    archive and removes its snapshot. Called from gunicorn's ``child_exit``."""
+    path = os.path.join(settings.METRICS_DIR, f"{pid}.json")
+    try:
+        with open(path) as file:
+            snapshot = json.load(file)
+    except (OSError, ValueError):
+        return
+    archive_path = os.path.join(settings.METRICS_DIR, ARCHIVE_NAME)
+    try:
+        with open(archive_path) as file:
+            archive = json.load(file)
+    except (OSError, ValueError):
+        archive = {'pid': None, 'metrics': {}}
+    merged = _merge([archive, snapshot], lambda snapshot: False)
+    archive = {
+        'pid': None,
+        'metrics': {name: [[list(k), v] for k, v in samples.items()] for name, samples in merged.items()},
+    }
+    _write_json(archive_path, archive)
+    os.remove(path)
+
+
+# Exposition
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(merged):
+    """Renders merged metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        for key, value in sorted(merged[metric.name].items()):
+            if metric.type != 'histogram':
+                lines.append(f"{metric.name}{_labels(metric.labelnames, key)} {_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(metric.buckets + (float('inf'),), value[:-1]):
+                cumulative += count
+                labels = _labels(metric.labelnames, key, [('le', _number(bound))])
+                lines.append(f"{metric.name}_bucket{labels} {cumulative}")
+            lines.append(f"{metric.name}_sum{_labels(metric.labelnames, key)} {_number(value[-1])}")
+            lines.append(f"{metric.name}_count{_labels(metric.labelnames, key)} {cumulative}")
+    return '\n'.join(lines) + '\n'
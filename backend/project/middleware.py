@@ -1,22 +1,173 @@
-import os
-from django.http import JsonResponse
-from pathlib import Path
-from decouple import config, Config, RepositoryEnv
-
-BASE_DIR = Path(__file__).resolve().parent.parent.parent
-config = Config(RepositoryEnv(os.path.join(BASE_DIR, ".env")))
-IS_PRODUCTION = config('IS_PRODUCTION', default=False, cast=bool)
-env_file = '.env.production' if IS_PRODUCTION else '.env.development'
-config = Config(RepositoryEnv(os.path.join(BASE_DIR, env_file)))
-
-class FrontendAuthMiddleware:
+import ipaddress
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+from django.urls import Resolver404, resolve
+from whitenoise import middleware as whitenoise
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+class AsyncCapableMiddleware:
+    """Base of middleware that runs both ways: ``__call__`` under WSGI and
+    ``__acall__`` on the event loop under ASGI, as Django's own middleware
+    does. A single sync-only middleware would make Django hold a thread for
+    every request, however long an async view below it waits."""
+
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
 
-    def __call__(self, request):
-        print("host")
-        print(config("WEBSITE_HOSTNAME"))
-        allowed_origin = config("WEBSITE_HOSTNAME")
-        if request.META.get('HTTP_ORIGIN') != allowed_origin:
+
+class FrontendAuthMiddleware(AsyncCapableMiddleware):
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.allowed_origin = settings.WEBSITE_HOSTNAME
+        logger.info("Accepting API requests from %s", self.allowed_origin)
+
+    def reject(self, request):
+        # Files from the local storage backend are linked to directly, and
+        # browsers send no Origin header when following a link.
+        if request.path.startswith(settings.MEDIA_URL):
+            return None
+        if request.META.get('HTTP_ORIGIN') != self.allowed_origin:
             return JsonResponse({'error': 'Unauthorized origin'}, status=403)
-        return self.get_response(request)
+        return None
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return self.reject(request) or self.get_response(request)
+
+    async def __acall__(self, request):
+        return self.reject(request) or await self.get_response(request)
+
+
+class WhiteNoiseMiddleware(AsyncCapableMiddleware, whitenoise.WhiteNoiseMiddleware):
+    """WhiteNoise with an async path. Static files are looked up in memory
+    on the event loop, and only opening a file that matched goes to a
+    thread."""
+
+    def __init__(self, get_response):
+        whitenoise.WhiteNoiseMiddleware.__init__(self, get_response)
+        AsyncCapableMiddleware.__init__(self, get_response)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
+
+
+class MetricsMiddleware(AsyncCapableMiddleware):
+    """Records request metrics and serves them at ``METRICS_PATH``.
+
+    Placed first, so that it times everything below it and so that scrapes
+    need no origin. Scrapes are only answered for ``METRICS_ALLOWED_NETWORKS``.
+    Every response gets a ``Server-Timing`` header with the time spent in the
+    app and in storage calls.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.allowed_networks = [ipaddress.ip_network(network) for network in settings.METRICS_ALLOWED_NETWORKS]
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if request.path == settings.METRICS_PATH:
+            return self.metrics(request)
+
+        start = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.IN_FLIGHT.dec()
+        return self.finish(request, response, start)
+
+    async def __acall__(self, request):
+        if request.path == settings.METRICS_PATH:
+            # Reads every process's snapshot
+            return await sync_to_async(self.metrics)(request)
+
+        start = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.IN_FLIGHT.dec()
+        return self.finish(request, response, start)
+
+    @staticmethod
+    def start(request):
+        metrics.start_flushing()
+        metrics.start_request()
+        metrics.IN_FLIGHT.inc()
+        return time.perf_counter()
+
+    def finish(self, request, response, start):
+        elapsed = time.perf_counter() - start
+        route = self.route(request)
+        metrics.REQUESTS.inc(route=route, method=request.method, status=response.status_code)
+        metrics.REQUEST_LATENCY.observe(elapsed, route=route, method=request.method)
+        size = self.size(response)
+        if size is not None:
+            metrics.RESPONSE_SIZE.observe(size, route=route)
+
+        storage_seconds, storage_calls = metrics.request_storage_time()
+        timing = f"app;dur={elapsed * 1000:.1f}"
+        if storage_calls:
+            timing += f', storage;dur={storage_seconds * 1000:.1f};desc="{storage_calls} calls"'
+        response['Server-Timing'] = timing
+        return response
+
+    @staticmethod
+    def route(request):
+        """The URL name of the view that handled the request, used as the
+        route label so that label values stay bounded."""
+        if getattr(request, 'hosted_site', None) is not None:
+            return 'hosted_site'
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            # Answered by a middleware before the URL was resolved
+            try:
+                match = resolve(request.path_info)
+            except Resolver404:
+                return 'unmatched'
+        if not match.url_name:
+            return 'unmatched'
+        return match.view_name
+
+    @staticmethod
+    def size(response):
+        if response.has_header('Content-Length'):
+            return int(response['Content-Length'])
+        if not response.streaming:
+            return len(response.content)
+        return None
+
+    def metrics(self, request):
+        try:
+            address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+        except ValueError:
+            address = None
+        if address is None or not any(address in network for network in self.allowed_networks):
+            return HttpResponse('Forbidden', status=403, content_type='text/plain')
+        body = metrics.render(metrics.collect())
+        return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
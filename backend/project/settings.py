@@ -1,6 +1,10 @@
 import os
+import socket
 from pathlib import Path
-from decouple import Config, RepositoryEnv, config
+
+from decouple import Config, Csv, RepositoryEnv
+
+from .log import parse_levels
 
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
 BACKEND_DIR = Path(__file__).resolve().parent.parent
@@ -9,6 +13,8 @@ config = Config(RepositoryEnv(os.path.join(BASE_DIR, ".env")))
 
 IS_PRODUCTION = config('IS_PRODUCTION', default=False, cast=bool)
 DEBUG = config('DEBUG', default=True, cast=bool)
+# The frontend's origin, the only one the API accepts requests from
+WEBSITE_HOSTNAME = config("WEBSITE_HOSTNAME")
 
 # Determine whether we're in production, as this will affect many settings.
 if IS_PRODUCTION:
@@ -27,7 +33,7 @@ if not prod:
     DEBUG = True
     DEFAULT_SECRET = config("DEFAULT_SECRET", default="default-secret")
     CSRF_TRUSTED_ORIGINS = [
-        config("WEBSITE_HOSTNAME"),
+        WEBSITE_HOSTNAME,
     ]
     if config("CODESPACE_NAME"):
         CSRF_TRUSTED_ORIGINS.append(
@@ -42,20 +48,33 @@ else:
     DEBUG = False
     DEFAULT_SECRET = None
     CSRF_TRUSTED_ORIGINS = [
-        config("WEBSITE_HOSTNAME"),
+        WEBSITE_HOSTNAME,
     ]
 
 ALLOWED_HOSTS = [
-        config("WEBSITE_HOSTNAME"),
+        WEBSITE_HOSTNAME,
         "127.0.0.1"
     ]
 
 CORS_ALLOWED_ORIGINS = [
-        config("WEBSITE_HOSTNAME"),
+        WEBSITE_HOSTNAME,
     ]
 
 SECRET_KEY = config("SECRET_KEY", default=DEFAULT_SECRET)
 
+# Size of the blocks uploads are streamed to blob storage in. Peak memory per
+# in-flight upload is bounded by this value rather than by the file size.
+AZURE_UPLOAD_BLOCK_SIZE = config("AZURE_UPLOAD_BLOCK_SIZE", default=4 * 1024 * 1024, cast=int)
+# Number of files uploaded concurrently when deploying an archive or folder.
+STORAGE_UPLOAD_CONCURRENCY = config("STORAGE_UPLOAD_CONCURRENCY", default=8, cast=int)
+# Deploy archives to Azure with the asyncio Blob client (needs aiohttp),
+# with up to STORAGE_ASYNC_CONCURRENCY uploads in flight on one event loop.
+STORAGE_ASYNC_UPLOADS = config("STORAGE_ASYNC_UPLOADS", default=False, cast=bool)
+STORAGE_ASYNC_CONCURRENCY = config("STORAGE_ASYNC_CONCURRENCY", default=256, cast=int)
+# Seconds between background checks that the storage container is still
+# reachable. The storage client is created once per worker; 0 disables the check.
+STORAGE_HEALTH_CHECK_INTERVAL = config("STORAGE_HEALTH_CHECK_INTERVAL", default=60, cast=int)
+
 INSTALLED_APPS = [
     "django.contrib.admin",
     "django.contrib.auth",
@@ -70,8 +89,10 @@ INSTALLED_APPS = [
 
 
 MIDDLEWARE = [
+    "project.middleware.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
-    "whitenoise.middleware.WhiteNoiseMiddleware",
+    "relecloud.serving.HostedSiteMiddleware",
+    "project.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -158,19 +179,114 @@ STATIC_URL = "/static/"
 STATICFILES_DIRS = [BACKEND_DIR / "static"]
 STATIC_ROOT = BACKEND_DIR / "staticfiles"
 
+# Uploaded archives waiting for a deployment job (manage.py runjobs). Must be
+# on the same machine as the job worker.
+STAGING_ROOT = config("STAGING_ROOT", default=str(BACKEND_DIR / "staging"))
+# This instance's name, unique among the instances sharing the database: a
+# job whose archive is staged here is only claimed by this instance's worker
+INSTANCE_NAME = config("INSTANCE_NAME", default=socket.gethostname())
+DEPLOYMENT_JOB_POLL_INTERVAL = config("DEPLOYMENT_JOB_POLL_INTERVAL", default=2, cast=float)
+# Running jobs older than this are assumed abandoned and requeued when a worker starts
+DEPLOYMENT_JOB_TIMEOUT = config("DEPLOYMENT_JOB_TIMEOUT", default=3600, cast=int)
+# Inactive deployments kept per project for rollback; older ones are pruned
+# by the job worker
+DEPLOYMENT_RETENTION = config("DEPLOYMENT_RETENTION", default=5, cast=int)
+# Stored files younger than this many seconds are never deleted by
+# manage.py collectgarbage, orphaned or not; keep it well above
+# DEPLOYMENT_JOB_TIMEOUT
+GC_GRACE_PERIOD = config("GC_GRACE_PERIOD", default=24 * 3600, cast=int)
+
+# Resumable uploads (api/projects/uploads/): suggested and maximum chunk size,
+# maximum archive size, and seconds an idle session is kept before its
+# staging file is deleted
+UPLOAD_CHUNK_SIZE = config("UPLOAD_CHUNK_SIZE", default=8 * 1024 * 1024, cast=int)
+UPLOAD_MAX_CHUNK_SIZE = config("UPLOAD_MAX_CHUNK_SIZE", default=64 * 1024 * 1024, cast=int)
+UPLOAD_MAX_SIZE = config("UPLOAD_MAX_SIZE", default=10 * 1024 * 1024 * 1024, cast=int)
+UPLOAD_SESSION_TTL = config("UPLOAD_SESSION_TTL", default=24 * 3600, cast=int)
+
+# Per-worker cache of hostname -> hosted project lookups. Other workers see a
+# domain change once their cached entry is older than the TTL (seconds).
+DOMAIN_CACHE_SIZE = config("DOMAIN_CACHE_SIZE", default=10000, cast=int)
+DOMAIN_CACHE_TTL = config("DOMAIN_CACHE_TTL", default=30, cast=int)
+
+# Text files of at least this many bytes are also stored gzip- and
+# Brotli-compressed when a site is deployed (Brotli needs the brotli package)
+COMPRESS_MIN_SIZE = config("COMPRESS_MIN_SIZE", default=1024, cast=int)
+
+# Per-worker cache of hosted-site files read from storage: an in-memory tier
+# for small files and an on-disk tier, each with a byte budget and a maximum
+# entry size. A budget of 0 disables the tier.
+ASSET_CACHE_MEMORY_BYTES = config("ASSET_CACHE_MEMORY_BYTES", default=64 * 1024 * 1024, cast=int)
+ASSET_CACHE_MEMORY_ENTRY_MAX = config("ASSET_CACHE_MEMORY_ENTRY_MAX", default=1024 * 1024, cast=int)
+ASSET_CACHE_DIR = config("ASSET_CACHE_DIR", default=str(BACKEND_DIR / "asset-cache"))
+ASSET_CACHE_DISK_BYTES = config("ASSET_CACHE_DISK_BYTES", default=1024 * 1024 * 1024, cast=int)
+ASSET_CACHE_DISK_ENTRY_MAX = config("ASSET_CACHE_DISK_ENTRY_MAX", default=64 * 1024 * 1024, cast=int)
+
+# Parsed deployment manifests kept per worker. A manifest takes about 100
+# bytes per file of its site.
+MANIFEST_CACHE_SIZE = config("MANIFEST_CACHE_SIZE", default=64, cast=int)
+
+# Prometheus metrics, served at METRICS_PATH to the listed networks only.
+# Each process writes its metrics to METRICS_DIR every METRICS_FLUSH_INTERVAL
+# seconds; the directory must be shared by the processes of an instance and
+# is cleared when gunicorn starts.
+METRICS_PATH = "/metrics"
+METRICS_ALLOWED_NETWORKS = config("METRICS_ALLOWED_NETWORKS", default="127.0.0.0/8,::1/128", cast=Csv())
+METRICS_DIR = config("METRICS_DIR", default=str(BACKEND_DIR / "metrics"))
+METRICS_FLUSH_INTERVAL = config("METRICS_FLUSH_INTERVAL", default=5, cast=float)
+
+# Uploaded projects, when STORAGE_BACKEND is "local"
+MEDIA_URL = "/media/"
+MEDIA_ROOT = config("MEDIA_ROOT", default=str(BACKEND_DIR / "media"))
+
+# Logging. Lines are written by a background thread (project.log), so a
+# slow stderr never holds up a request. LOG_LEVELS sets the level of
+# individual loggers, e.g. "relecloud.storage=DEBUG,django.db.backends=INFO".
+# Per-file upload messages are logged at DEBUG, one in
+# LOG_FILE_EVENT_SAMPLE_RATE; every upload also logs an INFO summary.
+LOG_LEVEL = config("LOG_LEVEL", default="DEBUG" if DEBUG else "INFO")
+LOG_LEVELS = config("LOG_LEVELS", default="", cast=parse_levels)
+LOG_FORMAT = config("LOG_FORMAT", default="text")  # "text" or "json"
+LOG_QUEUE_SIZE = config("LOG_QUEUE_SIZE", default=10000, cast=int)
+LOG_FILE_EVENT_SAMPLE_RATE = config("LOG_FILE_EVENT_SAMPLE_RATE", default=100, cast=int)
+
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
+    "formatters": {
+        "text": {"format": "%(asctime)s %(levelname)s [%(process)d] %(name)s: %(message)s"},
+        "json": {"()": "project.log.JsonFormatter"},
+    },
+    "filters": {
+        "sample_file_events": {"()": "project.log.SamplingFilter", "rate": LOG_FILE_EVENT_SAMPLE_RATE},
+    },
     "handlers": {
         "console": {
-            "class": "logging.StreamHandler",
+            "class": "project.log.BackgroundHandler",
+            "queue_size": LOG_QUEUE_SIZE,
+            "formatter": LOG_FORMAT,
         },
     },
     "root": {
         "handlers": ["console"],
-        "level": "DEBUG",
+        "level": LOG_LEVEL,
+    },
+    "loggers": {
+        # Every SQL statement at DEBUG is too much even in development
+        "django.db.backends": {"level": "INFO"},
+        # The Azure SDK logs every request and response at INFO
+        "azure": {"level": "WARNING"},
+        "relecloud.storage.files": {"filters": ["sample_file_events"]},
     },
 }
+for name, level in LOG_LEVELS.items():
+    LOGGING["loggers"].setdefault(name, {})["level"] = level
+
+# Azure Monitor is configured when the application is created, if set
+APPLICATIONINSIGHTS_CONNECTION_STRING = config("APPLICATIONINSIGHTS_CONNECTION_STRING", default="")
+# Log how long creating the application took, by phase, and the modules that
+# took longest to import (project.startup)
+STARTUP_PROFILE = config("STARTUP_PROFILE", default=False, cast=bool)
 
 DJANGO_LOG_LEVEL = DEBUG
 DEBUG_PROPAGATE_EXCEPTIONS = DEBUG  # Enables VS Code debugger to break on raised exceptions
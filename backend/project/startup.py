@@ -0,0 +1,168 @@
+"""Creating the WSGI and ASGI applications, and timing it.
+
+``boot`` is what project/wsgi.py and project/asgi.py run: configure Azure
+Monitor if a connection string is set, create the application and load the
+URL configuration. Loading the URL configuration here rather than on the
+first request means that request does not pay for importing the views, and
+that with ``preload_app`` the master imports them once for every worker it
+forks.
+
+The Azure Monitor distribution and the Blob SDK are the slowest imports the
+app has, so they are imported only when they are used: the former here when
+a connection string is configured, the latter by ``StorageService`` when it
+creates the Azure backend.
+
+With ``STARTUP_PROFILE`` set, ``boot`` logs how long each phase took and the
+modules that took longest to import, the way ``python -X importtime`` does
+but from inside the worker that is starting.
+"""
+import importlib.abc
+import logging
+import sys
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class _TimedLoader:
+    """Wraps a module's loader to time its execution."""
+
+    def __init__(self, loader, name, profiler):
+        self.loader = loader
+        self.name = name
+        self.profiler = profiler
+
+    def __getattr__(self, name):
+        return getattr(self.loader, name)
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        self.profiler.enter()
+        start = time.perf_counter()
+        try:
+            self.loader.exec_module(module)
+        finally:
+            self.profiler.leave(self.name, time.perf_counter() - start)
+            # The module keeps its real loader
+            module.__loader__ = self.loader
+            if module.__spec__ is not None:
+                module.__spec__.loader = self.loader
+
+
+class ImportProfiler(importlib.abc.MetaPathFinder):
+    """Records, for every module imported while it is installed, the time
+    spent executing it with and without the modules it imported itself.
+
+    Install with ``with ImportProfiler() as profiler:``; ``phase`` times
+    named steps as well.
+    """
+
+    def __init__(self):
+        # name -> (self seconds, cumulative seconds)
+        self.modules = {}
+        self.phases = []
+        # Time spent in nested imports, one entry per import in progress
+        self._children = []
+
+    def __enter__(self):
+        sys.meta_path.insert(0, self)
+        return self
+
+    def __exit__(self, *args):
+        sys.meta_path.remove(self)
+
+    def find_spec(self, name, path=None, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+            spec.loader = _TimedLoader(spec.loader, name, self)
+        return spec
+
+    def enter(self):
+        self._children.append(0.0)
+
+    def leave(self, name, elapsed):
+        children = self._children.pop()
+        if self._children:
+            self._children[-1] += elapsed
+        self.modules[name] = (elapsed - children, elapsed)
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start))
+
+    def report(self, top=25):
+        total = sum(seconds for _, seconds in self.phases)
+        lines = [
+            f"Startup took {total * 1000:.0f} ms: "
+            + ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in self.phases),
+            f"{len(self.modules)} modules imported, slowest first (self / cumulative ms):",
+        ]
+        slowest = sorted(self.modules.items(), key=lambda item: item[1][0], reverse=True)[:top]
+        for name, (own, cumulative) in slowest:
+            lines.append(f"  {own * 1000:8.1f} {cumulative * 1000:8.1f}  {name}")
+        return "\n".join(lines)
+
+
+class _NoProfiler:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    @contextmanager
+    def phase(self, name):
+        yield
+
+
+def configure_telemetry():
+    """Sends traces, metrics and logs to Application Insights when
+    ``APPLICATIONINSIGHTS_CONNECTION_STRING`` is set."""
+    if not settings.APPLICATIONINSIGHTS_CONNECTION_STRING:
+        return
+    try:
+        from azure.monitor.opentelemetry import configure_azure_monitor
+        configure_azure_monitor(connection_string=settings.APPLICATIONINSIGHTS_CONNECTION_STRING)
+    except Exception as e:
+        logger.warning("Azure Monitor configuration failed: %s", e)
+
+
+def load_urlconf():
+    """Imports the URL configuration, and with it the views."""
+    from django.urls import get_resolver
+    get_resolver().url_patterns
+
+
+def boot(get_application):
+    """Creates the application with ``get_application`` (Django's
+    ``get_wsgi_application`` or ``get_asgi_application``) and returns it."""
+    start = time.perf_counter()
+    # Reading a setting imports the settings, so that phase is timed by hand
+    profiler = ImportProfiler() if settings.STARTUP_PROFILE else _NoProfiler()
+    profiler.phases = [('settings', time.perf_counter() - start)]
+    with profiler:
+        with profiler.phase('telemetry'):
+            configure_telemetry()
+        with profiler.phase('application'):
+            application = get_application()
+        with profiler.phase('urlconf'):
+            load_urlconf()
+    if settings.STARTUP_PROFILE:
+        logger.info(profiler.report())
+    return application
@@ -0,0 +1,201 @@
+"""Worker sizing for gunicorn from the container's limits.
+
+``multiprocessing.cpu_count()`` reports the host's cores, not the CPU quota
+of the container, and knows nothing about its memory limit: on a 16-core
+host a 1-core, 1.75 GB App Service S1 instance would get 33 workers of 33
+threads each. ``plan`` reads the cgroup (v2 or v1) CPU quota and memory
+limit and sizes workers and threads for a declared workload profile:
+
+``uploads``
+    Threaded workers with many threads; requests mostly wait on clients
+    sending archives and on Blob storage.
+``api``
+    More processes with few threads each, for short API and hosted-site
+    requests.
+``asgi``
+    One uvicorn worker per CPU; concurrency comes from the event loop.
+
+The worker count is then lowered until every worker fits its memory
+allowance, and each worker may grow by what is left of its share of the
+limit before ``RSSWatchdog`` recycles it.
+
+Loaded by gunicorn.conf.py before Django is configured, so it reads its
+options from the environment rather than from settings.
+"""
+import logging
+import math
+import os
+import signal
+import threading
+from collections import namedtuple
+
+from decouple import config
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+CGROUP_ROOT = "/sys/fs/cgroup"
+# cgroup v1 reports "no limit" as a very large number rather than "max"
+UNLIMITED = 1 << 60
+
+# worker_mb: footprint of a worker with the app loaded; thread_mb: what a
+# request in flight may add on top (upload buffers, compression, responses)
+Profile = namedtuple(
+    'Profile', ['worker_class', 'workers_per_cpu', 'extra_workers', 'threads', 'worker_mb', 'thread_mb']
+)
+
+PROFILES = {
+    'uploads': Profile('gthread', 1, 1, 16, 160, 24),
+    'api': Profile('gthread', 2, 1, 4, 160, 8),
+    'asgi': Profile('uvicorn_worker.UvicornWorker', 1, 0, 1, 200, 0),
+}
+
+Plan = namedtuple('Plan', ['profile', 'worker_class', 'workers', 'threads', 'cpus', 'memory', 'max_rss_growth'])
+
+
+def _read(path):
+    try:
+        with open(path) as file:
+            return file.read().strip()
+    except OSError:
+        return None
+
+
+def cpu_limit(root=CGROUP_ROOT):
+    """CPUs this process may use: the cgroup quota rounded up, or the CPUs
+    it is allowed to run on when there is no quota."""
+    try:
+        available = len(os.sched_getaffinity(0))
+    except AttributeError:
+        available = os.cpu_count() or 1
+
+    quota = period = None
+    v2 = _read(os.path.join(root, "cpu.max"))
+    if v2:
+        quota, _, period = v2.partition(" ")
+    else:
+        quota = _read(os.path.join(root, "cpu", "cpu.cfs_quota_us"))
+        period = _read(os.path.join(root, "cpu", "cpu.cfs_period_us"))
+    try:
+        quota, period = int(quota), int(period)
+    except (TypeError, ValueError):
+        # "max", -1 or no cgroup CPU controller at all
+        return available
+    if quota <= 0 or period <= 0:
+        return available
+    return max(1, min(available, math.ceil(quota / period)))
+
+
+def memory_limit(root=CGROUP_ROOT):
+    """Bytes of memory this process's cgroup may use, or the machine's
+    physical memory when the cgroup sets no limit."""
+    physical = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    for path in (os.path.join(root, "memory.max"), os.path.join(root, "memory", "memory.limit_in_bytes")):
+        value = _read(path)
+        if value is None:
+            continue
+        try:
+            limit = int(value)
+        except ValueError:
+            # "max"
+            return physical
+        return physical if limit >= UNLIMITED else min(limit, physical)
+    return physical
+
+
+def plan(profile_name, cpus, memory, memory_fraction=0.8, workers=None, threads=None, max_rss_growth=None):
+    """Sizes gunicorn for ``profile_name`` on ``cpus`` CPUs and ``memory``
+    bytes. ``workers``, ``threads`` and ``max_rss_growth`` (MiB, 0 to
+    disable recycling) override the computed values."""
+    try:
+        profile = PROFILES[profile_name]
+    except KeyError:
+        raise ValueError(f"Unknown workload profile {profile_name!r}, expected one of {', '.join(PROFILES)}")
+
+    threads = max(1, threads or profile.threads)
+    # The preloaded master holds a copy of the app as well
+    budget = memory * memory_fraction / MB - profile.worker_mb
+    per_worker = profile.worker_mb + threads * profile.thread_mb
+    if not workers:
+        workers = max(1, profile.workers_per_cpu * cpus + profile.extra_workers)
+        fits = int(budget // per_worker)
+        if fits < workers:
+            workers = max(1, fits)
+            if fits < 1 and profile.thread_mb:
+                # Not even one worker fits: keep one with fewer threads
+                threads = max(1, int((budget - profile.worker_mb) // profile.thread_mb))
+
+    if max_rss_growth is None:
+        # What is left of the worker's share once its app is loaded
+        max_rss_growth = max(64, int(budget / workers - profile.worker_mb))
+    return Plan(profile_name, profile.worker_class, workers, threads, cpus, memory, max_rss_growth * MB)
+
+
+def plan_from_environment(profile_name=None):
+    """``plan`` for this container, with the options read from the
+    environment: ``GUNICORN_PROFILE``, ``GUNICORN_MEMORY_FRACTION``,
+    ``WEB_CONCURRENCY`` (workers), ``GUNICORN_THREADS`` and
+    ``GUNICORN_MAX_RSS_GROWTH_MB``."""
+    max_rss_growth = config("GUNICORN_MAX_RSS_GROWTH_MB", default="")
+    return plan(
+        profile_name or config("GUNICORN_PROFILE", default="uploads"),
+        cpu_limit(),
+        memory_limit(),
+        memory_fraction=config("GUNICORN_MEMORY_FRACTION", default=0.8, cast=float),
+        workers=config("WEB_CONCURRENCY", default=0, cast=int),
+        threads=config("GUNICORN_THREADS", default=0, cast=int),
+        max_rss_growth=int(max_rss_growth) if max_rss_growth else None,
+    )
+
+
+def current_rss():
+    """Resident set size of this process in bytes."""
+    statm = _read("/proc/self/statm")
+    if statm:
+        return int(statm.split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    # Not Linux: the peak is the best there is
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class RSSWatchdog(threading.Thread):
+    """Stops the worker gracefully once its RSS has grown by more than
+    ``max_growth`` bytes since the watchdog started.
+
+    The worker is sent SIGTERM, which both threaded and uvicorn workers
+    handle by finishing the requests in flight and exiting; the arbiter then
+    forks a fresh one. This bounds fragmentation and slow leaks by memory
+    rather than by a request count that fits neither small API calls nor
+    large uploads.
+    """
+
+    def __init__(self, max_growth, interval=10, rss=current_rss):
+        super().__init__(name="rss-watchdog", daemon=True)
+        self.max_growth = max_growth
+        self.interval = interval
+        self.rss = rss
+        self.baseline = rss()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            growth = self.rss() - self.baseline
+            if growth > self.max_growth:
+                logger.warning(
+                    "Worker %d grew by %d MiB (limit %d MiB), recycling it",
+                    os.getpid(), growth // MB, self.max_growth // MB,
+                )
+                os.kill(os.getpid(), signal.SIGTERM)
+                return
+
+    def stop(self):
+        self.stopped.set()
+
+
+def describe(tuned):
+    return (
+        f"{tuned.profile} profile on {tuned.cpus} CPU(s) and {tuned.memory // MB} MiB: "
+        f"{tuned.workers} {tuned.worker_class} worker(s) x {tuned.threads} thread(s), "
+        f"recycled after {tuned.max_rss_growth // MB} MiB of growth"
+    )
+
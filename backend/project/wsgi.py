@@ -7,21 +7,17 @@ For more information on this file, see
 https://docs.djangoproject.com/en/3.1/howto/deployment/wsgi/
 """
 
+import logging
 import os
-from decouple import config
-from azure.monitor.opentelemetry import configure_azure_monitor
+
 from django.core.wsgi import get_wsgi_application
+from project import startup
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "project.settings")
+logger = logging.getLogger(__name__)
 
 try:
-    if config("APPLICATIONINSIGHTS_CONNECTION_STRING", default=""):
-        configure_azure_monitor()
-except Exception as e:
-    print(f"Azure Monitor configuration failed: {e}")
-
-try:
-    application = get_wsgi_application()
+    application = startup.boot(get_wsgi_application)
 except Exception as e:
-    print(f"Failed to load WSGI application: {e}")
-    raise
\ No newline at end of file
+    logger.critical("Failed to load WSGI application: %s", e)
+    raise
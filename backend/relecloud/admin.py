@@ -4,3 +4,6 @@ from . import models
 
 # Register your models here.
 admin.site.register(models.Project)
+admin.site.register(models.DeploymentJob)
+admin.site.register(models.Deployment)
+admin.site.register(models.UploadSession)
@@ -0,0 +1,111 @@
+"""Reading tar archives as a forward-only stream.
+
+A ZIP archive is read from its central directory at the end, so it must be
+complete and seekable before the first file can be extracted. A tar archive,
+plain or compressed as a whole, lists every member just before its content,
+so it can be decoded as it is read, from a staged file or straight from a
+request body, and each file uploaded while the rest is still arriving.
+
+``.tar``, ``.tar.gz`` (``.tgz``) and ``.tar.zst`` (``.tzst``) archives are
+recognised by their names. Zstandard needs the optional ``zstandard``
+package. An archive that cannot be decoded raises ``InvalidArchive``, which
+tells the sender's mistakes apart from failures to store the files.
+"""
+import shutil
+import tarfile
+import tempfile
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Archive name suffix -> compression, in the order they are matched
+TAR_SUFFIXES = [
+    ('.tar', ''),
+    ('.tar.gz', 'gz'),
+    ('.tgz', 'gz'),
+    ('.tar.zst', 'zst'),
+    ('.tzst', 'zst'),
+]
+
+
+class InvalidArchive(ValueError):
+    """Raised when an archive cannot be decoded as the kind it is named as."""
+
+
+def tar_compression(file_name):
+    """Returns the compression of a tar archive named ``file_name``: ``''``,
+    ``'gz'`` or ``'zst'``; ``None`` if it is not named like a tar archive."""
+    lowered = file_name.lower()
+    for suffix, compression in TAR_SUFFIXES:
+        if lowered.endswith(suffix):
+            return compression
+    return None
+
+
+def open_tar(stream, compression):
+    """Opens a tar archive for reading ``stream`` once from the start.
+
+    Members must be read in order, as iterating over the archive returns
+    them; nothing is seeked, so ``stream`` only needs ``read``.
+    """
+    if compression == 'zst':
+        if zstandard is None:
+            raise InvalidArchive("Zstandard archives need the zstandard package")
+        stream = zstandard.ZstdDecompressor().stream_reader(stream, closefd=False)
+    # In stream mode tarfile reads its own gzip stream
+    return tarfile.open(fileobj=stream, mode='r|gz' if compression == 'gz' else 'r|')
+
+
+def member_path(member):
+    """The path of a member within the site: ``./index.html``, as ``tar -C
+    site .`` writes it, is ``index.html``."""
+    path = member.name
+    while path.startswith('./'):
+        path = path[2:]
+    return path.lstrip('/')
+
+
+class _Unclosed:
+    """A file that ``with`` leaves open, so it can be opened again."""
+
+    def __init__(self, file):
+        self._file = file
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def close(self):
+        pass
+
+
+class BufferedMember:
+    """The content of one member, copied out of the archive so the archive
+    can be read on while the member is uploaded.
+
+    Up to ``memory_max`` bytes are kept in memory, larger members in an
+    anonymous temporary file. ``open()`` returns the content from its start,
+    as many times as needed but one reader at a time; ``close()`` frees it.
+    """
+
+    def __init__(self, tar, member, memory_max, block_size):
+        self._file = tempfile.SpooledTemporaryFile(max_size=memory_max)
+        try:
+            shutil.copyfileobj(tar.extractfile(member), self._file, block_size)
+        except BaseException:
+            self._file.close()
+            raise
+
+    def open(self):
+        self._file.seek(0)
+        return _Unclosed(self._file)
+
+    def close(self):
+        self._file.close()
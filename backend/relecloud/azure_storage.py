@@ -0,0 +1,180 @@
+"""Azure Blob Storage backend.
+
+Kept apart from ``storage`` so that the Blob SDK, which takes longer to
+import than the rest of the app together, is only imported by a process
+that uses it: ``StorageService`` imports this module when it creates the
+backend, not when the URL configuration is loaded.
+"""
+import mimetypes
+
+import requests
+from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError, ServiceRequestError
+from azure.storage.blob import BlobServiceClient, ContentSettings
+from django.conf import settings
+from project import metrics
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .storage import BlobStat, ListedBlob, StorageBackend, logger
+
+
+def _http_session(pool_size):
+    """Requests session for the Blob client, with enough pooled connections
+    for every upload thread to keep its own keep-alive connection."""
+    session = requests.Session()
+    # The SDK runs its own retry policy, so urllib3 must not retry as well
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=pool_size,
+        max_retries=Retry(total=False, redirect=False, raise_on_status=False),
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+class AzureStorageBackend(StorageBackend):
+    def __init__(self):
+        super().__init__()
+        try:
+            # Blobs larger than one block are sent as a sequence of staged
+            # blocks, so an upload never holds more than one block in memory.
+            self.client = BlobServiceClient.from_connection_string(
+                settings.AZURE_STORAGE_CONNECTION_STRING, 
+                max_single_put_size=self.block_size,
+                max_block_size=self.block_size,
+                session=_http_session(settings.STORAGE_UPLOAD_CONCURRENCY),
+            )
+            self.container_name = settings.AZURE_CONTAINER_NAME
+            logger.info("Using Azure Storage container %s", self.container_name)
+        except Exception as e:
+            raise ValueError(f"Failed to initialize storage client: {str(e)}")
+        # Verify container exists
+        self.check_health()
+
+    def check_health(self):
+        """Raises ``ValueError`` unless the configured container is reachable."""
+        try:
+            with metrics.storage_call('check_health'):
+                self.client.get_container_client(self.container_name).get_container_properties()
+        except ResourceNotFoundError:
+            raise ValueError(f"Container {self.container_name} not found")
+        except Exception as e:
+            raise ValueError(f"Failed to initialize storage client: {str(e)}")
+
+    def _exists(self, file_name):
+        with metrics.storage_call('exists'):
+            return self.client.get_blob_client(container=self.container_name, blob=file_name).exists()
+
+    def delete(self, file_name):
+        """Deletes a blob; a blob that does not exist is ignored."""
+        try:
+            with metrics.storage_call('delete'):
+                self.client.get_blob_client(container=self.container_name, blob=file_name).delete_blob()
+        except ResourceNotFoundError:
+            pass
+        except Exception as e:
+            raise ValueError(f"Failed to delete {file_name}: {str(e)}")
+
+    def delete_batch(self, names):
+        """Deletes up to 256 blobs with one batch request; blobs that do
+        not exist are ignored."""
+        if not names:
+            return
+        try:
+            with metrics.storage_call('delete_batch'):
+                responses = list(self.client.get_container_client(self.container_name).delete_blobs(
+                    *names, raise_on_any_failure=False
+                ))
+        except Exception as e:
+            raise ValueError(f"Failed to delete {len(names)} blobs: {str(e)}")
+        failed = [name for name, response in zip(names, responses) if response.status_code not in (202, 404)]
+        if failed:
+            raise ValueError(f"Failed to delete {len(failed)} of {len(names)} blobs, first {failed[0]}")
+
+    def list_pages(self, prefix, marker=None, page_size=StorageBackend.DELETE_BATCH_SIZE):
+        """Yields ``(blobs, marker)`` pages of the blobs under ``prefix``;
+        a page's marker is the service's continuation token."""
+        pages = self.client.get_container_client(self.container_name).list_blobs(
+            name_starts_with=prefix, results_per_page=page_size
+        ).by_page(continuation_token=marker)
+        while True:
+            try:
+                with metrics.storage_call('list'):
+                    page = next(pages, None)
+                    if page is None:
+                        return
+                    blobs = [ListedBlob(blob.name, blob.size, blob.last_modified) for blob in page]
+            except Exception as e:
+                raise ValueError(f"Failed to list {prefix}: {str(e)}")
+            yield blobs, pages.continuation_token
+
+    def stat(self, file_name):
+        try:
+            with metrics.storage_call('stat'):
+                properties = self.client.get_blob_client(
+                    container=self.container_name, blob=file_name
+                ).get_blob_properties()
+        except ResourceNotFoundError:
+            raise FileNotFoundError(file_name)
+        except Exception as e:
+            raise ValueError(f"Failed to read properties of {file_name}: {str(e)}")
+        return BlobStat(
+            properties.size, properties.last_modified, properties.content_settings.content_type, properties.etag
+        )
+
+    def stream(self, file_name, offset=0, length=None):
+        """Yields a blob, or a range of it, as it is downloaded.
+
+        The first piece is requested before the generator is returned, so a
+        missing blob raises here rather than halfway through a response; that
+        request is what the ``stream`` storage metric times.
+        """
+        try:
+            with metrics.storage_call('stream'):
+                downloader = self.client.get_blob_client(
+                    container=self.container_name, blob=file_name
+                ).download_blob(offset=offset, length=length, max_concurrency=1)
+        except ResourceNotFoundError:
+            raise FileNotFoundError(file_name)
+        except Exception as e:
+            raise ValueError(f"Failed to download {file_name}: {str(e)}")
+        return downloader.chunks()
+
+    def _upload_file(self, file, file_name, length=None, content_type=None, content_encoding=None):
+        """Uploads an individual file to Azure Blob Storage.
+
+        ``file`` may be any readable file-like object; it is consumed in
+        ``block_size`` pieces rather than read into memory up front.
+        """
+        try:
+            blob_client = self.client.get_blob_client(
+                container=self.container_name, 
+                blob=file_name
+            )
+
+            # Determine MIME type
+            mime_type = content_type or mimetypes.guess_type(file_name)[0]
+            if not mime_type:
+                mime_type = 'application/octet-stream'  # Default fallback
+
+            content_settings = ContentSettings(content_type=mime_type, content_encoding=content_encoding)
+
+            # Upload the file
+            with metrics.storage_call('upload'):
+                blob_client.upload_blob(
+                    file,
+                    length=length,
+                    overwrite=True,
+                    content_settings=content_settings,
+                    max_concurrency=1,
+                )
+
+            return file_name
+        
+        except ResourceExistsError:
+            raise ValueError(f"File {file_name} already exists")
+        except ServiceRequestError:
+            raise ValueError("Failed to connect to Azure Storage")
+        except Exception as e:
+            raise ValueError(f"Failed to upload file: {str(e)}")
@@ -0,0 +1,100 @@
+"""Deleting what a deleted project stored.
+
+Deleting a project only removes its rows and queues a ``CleanupJob`` for
+its prefix, ``projects/<project id>/``, so the DELETE request returns at
+once. The job worker then lists the prefix a page of ``DELETE_BATCH_SIZE``
+names at a time, on a thread of its own that stays ``LIST_AHEAD`` pages
+ahead, and deletes each page with one batch request. The job records its
+progress after every page, so an interrupted cleanup resumes where it
+stopped.
+
+Content-addressed objects under ``objects/`` may be shared with other
+projects and are left for garbage collection.
+"""
+import logging
+import queue
+import threading
+
+from .models import CleanupJob
+
+logger = logging.getLogger(__name__)
+
+# Pages listed ahead of the one being deleted
+LIST_AHEAD = 4
+
+
+def project_prefix(project_id):
+    return f"projects/{project_id}/"
+
+
+def enqueue_cleanup(prefix):
+    return CleanupJob.objects.create(prefix=prefix)
+
+
+class _ListAhead:
+    """Iterates over ``pages`` on a background thread, up to ``depth``
+    pages ahead of the consumer. Errors are raised in the consumer."""
+
+    _DONE = object()
+
+    def __init__(self, pages, depth):
+        self._queue = queue.Queue(depth)
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(pages,), name="cleanup-list", daemon=True)
+        self._thread.start()
+
+    def _put(self, item):
+        # Gives up once the consumer has stopped, rather than blocking forever
+        while not self._stopped.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _run(self, pages):
+        try:
+            for page in pages:
+                if not self._put(page):
+                    return
+        except BaseException as e:
+            self._put(e)
+        else:
+            self._put(self._DONE)
+
+    def __iter__(self):
+        try:
+            while True:
+                item = self._queue.get()
+                if item is self._DONE:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            self._stopped.set()
+
+
+def list_ahead(storage_backend, prefix, marker=None, depth=LIST_AHEAD):
+    """Yields the ``list_pages`` of ``prefix`` from ``marker``, pages of
+    ``DELETE_BATCH_SIZE`` names with the marker after each, listed on a
+    background thread up to ``depth`` pages ahead."""
+    return iter(_ListAhead(storage_backend.list_pages(prefix, marker, storage_backend.DELETE_BATCH_SIZE), depth))
+
+
+def delete_prefix(storage_backend, prefix, marker=None, progress=None):
+    """Deletes everything stored under ``prefix``, listing from ``marker``.
+
+    ``progress(count, marker)`` is called after each page is deleted with
+    the number of names it held and the marker listing continues from,
+    ``None`` after the last page. Returns the number of names deleted.
+    """
+    deleted = 0
+    for blobs, marker in list_ahead(storage_backend, prefix, marker):
+        names = [blob.name for blob in blobs]
+        storage_backend.delete_batch(names)
+        deleted += len(names)
+        if progress is not None:
+            progress(len(names), marker)
+    return deleted
@@ -0,0 +1,101 @@
+"""Precompressed variants of hosted-site files.
+
+When a site is deployed, text files of at least ``COMPRESS_MIN_SIZE`` bytes
+are also stored compressed with every available encoding, next to the
+original object as ``objects/<digest>.<suffix>``. Serving picks a variant
+from the request's ``Accept-Encoding`` with ``negotiate``, so compression
+costs CPU once per deploy rather than once per request.
+
+Brotli needs the optional ``brotli`` package; without it only gzip variants
+are made.
+"""
+import tempfile
+import zlib
+
+from django.conf import settings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def _gzip():
+    # wbits=31 writes a gzip header and trailer instead of a raw zlib stream
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 31)
+    return compressor.compress, compressor.flush
+
+
+def _brotli():
+    compressor = brotli.Compressor(quality=11)
+    return compressor.process, compressor.finish
+
+
+# Content-Encoding -> (object name suffix, compressor factory), in order of
+# preference when a client accepts several equally
+ENCODINGS = {'br': ('br', _brotli), 'gzip': ('gz', _gzip)}
+if brotli is None:
+    del ENCODINGS['br']
+
+COMPRESSIBLE_TYPES = {
+    'application/javascript',
+    'application/json',
+    'application/manifest+json',
+    'application/wasm',
+    'application/xml',
+    'image/svg+xml',
+    'image/x-icon',
+    'image/vnd.microsoft.icon',
+    'font/ttf',
+    'font/otf',
+}
+
+
+def is_compressible(content_type, size):
+    """Whether a file is worth storing precompressed."""
+    if content_type is None or size < settings.COMPRESS_MIN_SIZE:
+        return False
+    return content_type.startswith('text/') or content_type in COMPRESSIBLE_TYPES
+
+
+def variant_name(object_name, encoding):
+    return f"{object_name}.{ENCODINGS[encoding][0]}"
+
+
+def compress(file, encoding, block_size):
+    """Compresses a file-like object and returns the result as a temporary
+    file positioned at its start, together with its size. Only
+    ``block_size`` bytes of the input are held in memory at a time."""
+    process, finish = ENCODINGS[encoding][1]()
+    output = tempfile.SpooledTemporaryFile(max_size=block_size)
+    while chunk := file.read(block_size):
+        output.write(process(chunk))
+    output.write(finish())
+    size = output.tell()
+    output.seek(0)
+    return output, size
+
+
+def negotiate(accept_encoding, available):
+    """Returns the encoding of ``available`` to serve for an
+    ``Accept-Encoding`` header, or ``None`` for the identity encoding."""
+    if not accept_encoding or not available:
+        return None
+    weights = {}
+    for item in accept_encoding.split(','):
+        coding, _, params = item.strip().partition(';')
+        weight = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                continue
+        weights[coding.strip().lower()] = weight
+    best, best_weight = None, 0.0
+    for encoding in ENCODINGS:
+        if encoding in available:
+            weight = weights.get(encoding, weights.get('*', 0.0))
+            if weight > best_weight:
+                best, best_weight = encoding, weight
+    return best
@@ -0,0 +1,130 @@
+"""Versioned deployments of a project's site.
+
+Each successful ``DeploymentJob`` stores its files under a prefix of its
+own, ``projects/<project id>/deployments/<deployment id>``, and records a
+``Deployment``. Nothing under a prefix is written again, so visitors never
+see a mix of two versions, and activating another deployment (a rollback,
+say) is a single update of the project row.
+
+The job worker prunes all but the newest ``DEPLOYMENT_RETENTION`` inactive
+deployments of a project after each deploy.
+"""
+import logging
+import uuid
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from . import domains, garbage
+from .models import Deployment, Project
+from .storage import StorageBackend, StorageService
+
+logger = logging.getLogger(__name__)
+
+
+def deployment_prefix(project_id, deployment_id):
+    return f"projects/{project_id}/deployments/{deployment_id.hex}"
+
+
+def _upload(job, archive, prefix, storage_backend):
+    if job.is_zip and settings.STORAGE_ASYNC_UPLOADS and settings.STORAGE_BACKEND == 'azure':
+        # Imported here: the asyncio client needs aiohttp, which is optional
+        from .aio_storage import upload_zip
+        return upload_zip(archive, prefix)
+    return storage_backend.upload_file(archive, job.file_name, job.is_zip, folder_name=prefix)
+
+
+def deploy(job, archive):
+    """Uploads a job's archive as a new deployment of its project and
+    activates it. Returns the ``Deployment``.
+
+    If a garbage collection deleted objects while the archive was uploaded,
+    the objects the deployment lists are checked and, when any is missing,
+    the archive is uploaded again; a stream that cannot be read again fails
+    the deploy instead.
+    """
+    deployment_id = uuid.uuid4()
+    prefix = deployment_prefix(job.project_id, deployment_id)
+    storage_backend = StorageService.get_storage_backend()
+    started = timezone.now()
+    garbage.forget_collected_objects(storage_backend)
+    file_name = _upload(job, archive, prefix, storage_backend)
+
+    deployment = Deployment(id=deployment_id, project_id=job.project_id, job=job, prefix=prefix, file=file_name)
+    manifest = None
+    if file_name.endswith('/' + StorageBackend.MANIFEST_NAME):
+        manifest = storage_backend.read_manifest(file_name)
+        deployment.manifest_size = storage_backend.stat(file_name).size
+        deployment.file_count = len(manifest)
+        deployment.total_size = manifest.total_size
+    else:
+        deployment.file_count = 1
+        deployment.total_size = storage_backend.stat(file_name).size
+    # Recorded before it is checked, so a collection from now on keeps its
+    # objects
+    deployment.save()
+
+    while manifest is not None and garbage.objects_collected_since(started):
+        missing = garbage.missing_objects(storage_backend, manifest)
+        if not missing:
+            break
+        if not (hasattr(archive, 'seekable') and archive.seekable()):
+            deployment.delete()
+            raise ValueError(f"{len(missing)} objects were garbage collected during the deploy; deploy again")
+        logger.warning("Uploading %s again: %d objects were garbage collected during the deploy", prefix, len(missing))
+        started = timezone.now()
+        storage_backend.forget_objects()
+        archive.seek(0)
+        _upload(job, archive, prefix, storage_backend)
+
+    activate(job.project_id, deployment)
+    return deployment
+
+
+def activate(project_id, deployment):
+    """Makes ``deployment`` the one served for its project.
+
+    Returns ``False`` if the project or the deployment no longer exists.
+    """
+    try:
+        # One conditional UPDATE: it only matches while the deployment still
+        # belongs to the project, and it waits for a concurrent
+        # prune_deployments to release the project row
+        with transaction.atomic():
+            updated = Project.objects.filter(pk=project_id, deployments=deployment).update(
+                active_deployment=deployment, file=deployment.file
+            )
+    except IntegrityError:
+        # Pruned between the subquery and the update
+        return False
+    domains.invalidate()
+    return bool(updated)
+
+
+def prune_deployments(project_id, keep=None):
+    """Deletes all but the newest ``keep`` inactive deployments of a project,
+    rows first and then their stored files. Returns the number deleted.
+
+    The objects they used are shared between deployments and are left for
+    garbage collection.
+    """
+    keep = settings.DEPLOYMENT_RETENTION if keep is None else keep
+    with transaction.atomic():
+        project = Project.objects.select_for_update().filter(pk=project_id).first()
+        if project is None:
+            return 0
+        stale = list(
+            Deployment.objects.filter(project_id=project_id)
+            .exclude(pk=project.active_deployment_id)
+            .order_by('-created_at')[keep:]
+        )
+        Deployment.objects.filter(pk__in=[deployment.pk for deployment in stale]).delete()
+
+    storage_backend = StorageService.get_storage_backend()
+    for deployment in stale:
+        try:
+            storage_backend.delete(deployment.file)
+        except ValueError as e:
+            logger.warning("Failed to delete %s: %s", deployment.file, e)
+    return len(stale)
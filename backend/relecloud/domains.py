@@ -0,0 +1,212 @@
+"""Resolution of request hostnames to hosted projects.
+
+Project domains are stored normalized (lowercase ASCII, no port or trailing
+dot) under a unique index. A domain may be a wildcard such as
+``*.example.com``, which matches any subdomain of ``example.com`` that has
+no more specific entry of its own. IP addresses and single-label names
+cannot be assigned, and neither can the app's own hosts (``ALLOWED_HOSTS``
+and ``WEBSITE_HOSTNAME``) or wildcards covering them, which
+``assignable_domain`` checks: the API would stop answering at them.
+
+Resolving a host is the first step of every hosted-site request, so results
+(including misses) are kept in a per-worker LRU cache for
+``DOMAIN_CACHE_TTL`` seconds. Changing or deleting a project's domain, or
+activating a deployment, clears the cache of the process that made the
+change; other workers pick the change up when their entries expire.
+"""
+import ipaddress
+import re
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from urllib.parse import urlsplit
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .models import Project
+from .storage import StorageBackend
+
+# ``manifest`` is the stored name of the active deployment's manifest, or
+# ``None`` if the project has nothing to serve; ``manifest_size`` is ``None``
+# when the manifest is not known to be immutable
+ResolvedSite = namedtuple('ResolvedSite', ['project_id', 'manifest', 'manifest_size'])
+
+_LABEL = re.compile(r'^(?!-)[a-z0-9-]{1,63}(?<!-)$')
+
+
+def normalize_domain(value):
+    """Returns ``value`` as it is stored and looked up, or raises ``ValueError``.
+
+    Accepts ``Host`` header values (with a port) as well as internationalized
+    names, which are converted to their IDNA form.
+    """
+    domain = (value or '').strip().lower()
+    if domain.startswith('['):
+        raise ValueError('IP address literals cannot be assigned')
+    domain = domain.rsplit(':', 1)[0] if domain.count(':') == 1 else domain
+    domain = domain.rstrip('.')
+    wildcard = domain.startswith('*.')
+    if wildcard:
+        domain = domain[2:]
+    try:
+        ipaddress.ip_address(domain)
+    except ValueError:
+        pass
+    else:
+        raise ValueError('IP addresses cannot be assigned')
+    try:
+        domain = domain.encode('idna').decode('ascii')
+    except UnicodeError:
+        raise ValueError(f'Invalid domain {value!r}')
+    labels = domain.split('.')
+    if len(domain) > 253 or not all(_LABEL.match(label) for label in labels):
+        raise ValueError(f'Invalid domain {value!r}')
+    if wildcard and len(labels) < 2:
+        raise ValueError('Wildcards must cover a domain with at least two labels')
+    if len(labels) < 2:
+        raise ValueError('Domains must have at least two labels')
+    return f'*.{domain}' if wildcard else domain
+
+
+def _app_hosts():
+    """The app's own hosts, normalized as far as they can be: the entries of
+    ``ALLOWED_HOSTS`` (``.example.com`` covers its subdomains too) and the
+    host of ``WEBSITE_HOSTNAME``, which may be an origin."""
+    for value in [*settings.ALLOWED_HOSTS, settings.WEBSITE_HOSTNAME]:
+        value = (value or '').strip().lower()
+        if '://' in value:
+            value = urlsplit(value).hostname or ''
+        value = value.rsplit(':', 1)[0] if value.count(':') == 1 else value
+        value = value.rstrip('.')
+        if value and value != '*':
+            yield value
+
+
+def _covers(pattern, host):
+    if pattern.startswith('.'):
+        return host == pattern[1:] or host.endswith(pattern)
+    return host == pattern
+
+
+def is_app_host(host):
+    """Whether the normalized ``host`` is one of the app's own."""
+    return any(_covers(pattern, host) for pattern in _app_hosts())
+
+
+def assignable_domain(value):
+    """``normalize_domain``, also rejecting the app's own hosts and
+    wildcards that cover one of them."""
+    domain = normalize_domain(value)
+    name = domain.removeprefix('*.')
+    for pattern in _app_hosts():
+        if _covers(pattern, name) or (domain != name and pattern.lstrip('.').endswith('.' + name)):
+            raise ValueError(f'{domain} is a host of this app')
+    return domain
+
+
+def candidate_domains(host):
+    """Domains that can match ``host``, most specific first: the host itself,
+    then a wildcard for each parent domain with at least two labels."""
+    labels = host.split('.')
+    return [host] + ['*.' + '.'.join(labels[i:]) for i in range(1, len(labels) - 1)]
+
+
+class DomainCache:
+    """Thread-safe LRU of host -> ``ResolvedSite`` (or ``None`` for a miss)
+    with a time to live."""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, host):
+        """Returns ``(found, site)``."""
+        with self._lock:
+            entry = self._entries.get(host)
+            if entry is None:
+                return False, None
+            site, expires = entry
+            if expires < time.monotonic():
+                del self._entries[host]
+                return False, None
+            self._entries.move_to_end(host)
+            return True, site
+
+    def set(self, host, site):
+        with self._lock:
+            self._entries[host] = (site, time.monotonic() + self.ttl)
+            self._entries.move_to_end(host)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+cache = DomainCache(settings.DOMAIN_CACHE_SIZE, settings.DOMAIN_CACHE_TTL)
+
+
+def _site(project):
+    manifest = project['active_deployment__file']
+    if not manifest or not manifest.endswith('/' + StorageBackend.MANIFEST_NAME):
+        # Not deployed yet, or a single file
+        return ResolvedSite(project['id'], None, None)
+    return ResolvedSite(project['id'], manifest, project['active_deployment__manifest_size'])
+
+
+def _cached(host):
+    """Returns ``(host, found, site)``: the normalized host and its cached
+    resolution; ``host`` is ``None`` if it is not a valid domain."""
+    try:
+        host = normalize_domain(host)
+    except ValueError:
+        return None, True, None
+    if is_app_host(host):
+        # The API's, even if a project was given it before that was refused
+        return host, True, None
+    found, site = cache.get(host)
+    return host, found, site
+
+
+def _lookup(host):
+    candidates = candidate_domains(host)
+    matches = {
+        project['domain']: project
+        for project in Project.objects.filter(domain__in=candidates).values(
+            'id', 'domain', 'active_deployment__file', 'active_deployment__manifest_size'
+        )
+    }
+    site = None
+    for domain in candidates:
+        if domain in matches:
+            project = matches[domain]
+            site = _site(project)
+            break
+    cache.set(host, site)
+    return site
+
+
+def resolve_host(host):
+    """Returns the ``ResolvedSite`` serving ``host``, or ``None``."""
+    host, found, site = _cached(host)
+    if found:
+        return site
+    return _lookup(host)
+
+
+async def aresolve_host(host):
+    """Async ``resolve_host``: a cached host costs no thread, a miss reads
+    the database in one."""
+    host, found, site = _cached(host)
+    if found:
+        return site
+    return await sync_to_async(_lookup)(host)
+
+
+def invalidate():
+    """Drops every cached resolution of this worker."""
+    cache.clear()
@@ -0,0 +1,281 @@
+"""Deleting stored files that nothing references.
+
+Uploads that fail part way, and projects deleted before cleanups existed,
+leave files behind that no ``Deployment`` references. ``collect`` lists the
+whole container a page at a time, on a thread that stays ``LIST_AHEAD``
+pages ahead as cleanups do, and deletes in batches every file that is
+
+* orphaned: an object under ``objects/`` (or one of its precompressed
+  variants) whose digest no deployment's manifest lists, or any other file
+  that is neither a project's or deployment's ``file`` nor under a
+  deployment's prefix, nor a chunk of an upload session under ``uploads/``,
+  which expire with their session (see ``uploads``); and
+* older than ``GC_GRACE_PERIOD``, so what a deployment in progress has
+  stored before recording itself is left alone.
+
+What is referenced is read from the database and the manifests when a
+collection starts, and only the deployments recorded since are read again
+before each batch of objects is deleted: a digest takes about 100 bytes of
+memory, and the listing is never held beyond a few pages and a batch of
+orphans.
+
+A deployment in progress may also rely on an old orphaned object it found
+already stored. Before deleting a batch of objects a collection therefore
+records ``objects_collected_at`` and a lease, ``collecting_until``, on its
+``GarbageCollection``, reads the deployments recorded since it last read
+them, and keeps the objects they list. Once a deploy has recorded its
+``Deployment`` it waits out any lease and, if objects were collected since
+it started, checks that its objects are still stored before activating
+(``objects_collected_since``, ``missing_objects``). Either the collection
+sees the deployment or the deployment sees the collection. Job workers
+also forget which objects they remember as stored once a collection has
+deleted objects (``forget_collected_objects``).
+
+``manage.py collectgarbage`` runs a collection, and records its progress in
+a ``GarbageCollection`` after every batch so an interrupted run resumes
+where it stopped.
+"""
+import logging
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+
+from . import compression
+from .cleanup import list_ahead
+from .models import Deployment, GarbageCollection, Project
+from .storage import StorageBackend
+from .uploads import UPLOADS_PREFIX
+
+logger = logging.getLogger(__name__)
+
+# What a collection keeps: stored names, deployment prefixes and object
+# digests, as of read_at
+References = namedtuple('References', ['files', 'prefixes', 'digests', 'read_at'])
+# Running totals of a collection
+Collection = namedtuple(
+    'Collection', ['scanned', 'orphaned', 'orphaned_bytes', 'deleted', 'deleted_bytes', 'objects_deleted', 'deferred']
+)
+
+# Longest a batch of objects may take to delete; deploys wait for an
+# unfinished batch at most this long
+BATCH_LEASE = timedelta(minutes=5)
+# Deployments created this long before references were last read are read
+# again, in case their rows were committed after
+REFRESH_MARGIN = timedelta(minutes=5)
+# Seconds between checks of a batch being deleted
+LEASE_POLL_INTERVAL = 0.5
+
+# When this process last saw a collection delete objects
+_objects_collected_at = None
+
+
+def _read_manifests(storage_backend, manifests, digests):
+    # A missing or unreadable manifest raises: without its digests no object
+    # could safely be deleted
+    with ThreadPoolExecutor(max_workers=max(1, settings.STORAGE_UPLOAD_CONCURRENCY)) as executor:
+        for manifest in executor.map(storage_backend.read_manifest, manifests):
+            digests |= manifest.digests()
+
+
+def _add_deployments(storage_backend, refs, deployments):
+    manifests = []
+    for prefix, file in deployments.values_list('prefix', 'file').iterator():
+        if prefix in refs.prefixes:
+            continue
+        refs.prefixes.add(prefix)
+        refs.files.add(file)
+        if file.endswith('/' + StorageBackend.MANIFEST_NAME):
+            manifests.append(file)
+    _read_manifests(storage_backend, manifests, refs.digests)
+
+
+def references(storage_backend):
+    """Returns the ``References`` of every project and deployment, reading
+    the deployments' manifests ``STORAGE_UPLOAD_CONCURRENCY`` at a time."""
+    read_at = timezone.now()
+    files = set(Project.objects.exclude(file='').values_list('file', flat=True))
+    refs = References(files, set(), set(), read_at)
+    _add_deployments(storage_backend, refs, Deployment.objects.all())
+    return refs
+
+
+def refresh(storage_backend, refs):
+    """Returns ``refs`` with the deployments created since they were read."""
+    read_at = timezone.now()
+    _add_deployments(storage_backend, refs, Deployment.objects.filter(created_at__gte=refs.read_at - REFRESH_MARGIN))
+    return refs._replace(read_at=read_at)
+
+
+def is_referenced(name, refs):
+    if name.startswith(StorageBackend.OBJECTS_PREFIX):
+        # objects/<digest>, objects/<digest>.gz and objects/<digest>.br
+        digest = name[len(StorageBackend.OBJECTS_PREFIX):].partition('.')[0]
+        return digest in refs.digests
+    if name in refs.files or name.startswith(UPLOADS_PREFIX):
+        return True
+    parts = name.split('/')
+    return any('/'.join(parts[:i]) in refs.prefixes for i in range(1, len(parts)))
+
+
+def _delete_batches(storage_backend, blobs, deadline=None):
+    for start in range(0, len(blobs), storage_backend.DELETE_BATCH_SIZE):
+        if deadline is not None and timezone.now() >= deadline:
+            raise ValueError("Deleting a batch of objects took longer than its lease")
+        storage_backend.delete_batch([blob.name for blob in blobs[start:start + storage_backend.DELETE_BATCH_SIZE]])
+
+
+def _delete_leased(storage_backend, blobs, refs, run):
+    """Deletes the orphans ``blobs``, objects among them, under ``run``'s
+    lease. Returns the references read again and the blobs deleted."""
+    start = timezone.now()
+    GarbageCollection.objects.filter(pk=run.pk).update(collecting_until=start + BATCH_LEASE, objects_collected_at=start)
+    try:
+        # A deployment recorded before the lease was taken is read here; one
+        # recorded after it checks its objects once the lease is released
+        refs = refresh(storage_backend, refs)
+        blobs = [blob for blob in blobs if not is_referenced(blob.name, refs)]
+        _delete_batches(storage_backend, blobs, start + BATCH_LEASE)
+    finally:
+        GarbageCollection.objects.filter(pk=run.pk).update(collecting_until=None, objects_collected_at=timezone.now())
+    return refs, blobs
+
+
+def collect(storage_backend, grace=None, marker=None, dry_run=False, progress=None, orphan=None, run=None):
+    """Deletes the orphaned files older than ``grace`` seconds, listing
+    from ``marker``. Returns the ``Collection``.
+
+    ``orphan(blob)`` is called with the ``ListedBlob`` of every orphan
+    found; with ``dry_run`` nothing is deleted. ``progress(collection,
+    marker)`` is called after every page with the totals so far and the
+    marker up to which every orphan has been dealt with, ``None`` after the
+    last page. Objects are only deleted under the lease of ``run``, a
+    ``GarbageCollection``; without one they are counted as deferred.
+    """
+    grace = settings.GC_GRACE_PERIOD if grace is None else grace
+    cutoff = timezone.now() - timedelta(seconds=grace)
+    refs = references(storage_backend)
+    logger.info(
+        "Collecting garbage older than %s: %d deployments reference %d objects",
+        cutoff, len(refs.prefixes), len(refs.digests),
+    )
+    totals = dict.fromkeys(Collection._fields, 0)
+    pending = []
+
+    def delete_pending():
+        nonlocal refs
+        if not dry_run:
+            objects = sum(blob.name.startswith(StorageBackend.OBJECTS_PREFIX) for blob in pending)
+            if objects and run is not None:
+                refs, deleted = _delete_leased(storage_backend, pending, refs, run)
+            else:
+                if objects:
+                    totals['deferred'] += objects
+                deleted = [blob for blob in pending if not blob.name.startswith(StorageBackend.OBJECTS_PREFIX)]
+                _delete_batches(storage_backend, deleted)
+            totals['deleted'] += len(deleted)
+            totals['deleted_bytes'] += sum(blob.size for blob in deleted)
+            totals['objects_deleted'] += sum(blob.name.startswith(StorageBackend.OBJECTS_PREFIX) for blob in deleted)
+        pending.clear()
+
+    checkpoint = marker
+    for blobs, marker in list_ahead(storage_backend, '', marker):
+        totals['scanned'] += len(blobs)
+        for blob in blobs:
+            if blob.last_modified >= cutoff or is_referenced(blob.name, refs):
+                continue
+            totals['orphaned'] += 1
+            totals['orphaned_bytes'] += blob.size
+            if orphan is not None:
+                orphan(blob)
+            pending.append(blob)
+        # Orphans are deleted a full batch at a time, and the checkpoint only
+        # moves past pages whose orphans are deleted
+        if len(pending) >= storage_backend.DELETE_BATCH_SIZE or marker is None:
+            delete_pending()
+        if not pending:
+            checkpoint = marker
+        if progress is not None:
+            progress(Collection(**totals), checkpoint)
+    return Collection(**totals)
+
+
+def run_collection(storage_backend, grace=None, restart=False, progress=None):
+    """Runs ``collect``, resuming the last unfinished ``GarbageCollection``
+    unless ``restart`` is set, and records its progress. Returns the
+    ``GarbageCollection`` and this run's ``Collection``."""
+    unfinished = GarbageCollection.objects.filter(finished_at__isnull=True)
+    if restart:
+        unfinished.update(finished_at=timezone.now())
+    run = unfinished.order_by('-id').first() or GarbageCollection.objects.create()
+    if run.marker:
+        logger.info("Resuming garbage collection %s after %s", run.pk, run.marker)
+    start = {'scanned': run.scanned, 'deleted': run.deleted, 'deleted_bytes': run.deleted_bytes}
+
+    def record(collection, marker):
+        fields = {
+            'marker': marker or '',
+            'scanned': start['scanned'] + collection.scanned,
+            'deleted': start['deleted'] + collection.deleted,
+            'deleted_bytes': start['deleted_bytes'] + collection.deleted_bytes,
+        }
+        GarbageCollection.objects.filter(pk=run.pk).update(**fields)
+        for name, value in fields.items():
+            setattr(run, name, value)
+        if progress is not None:
+            progress(collection, marker)
+
+    collection = collect(storage_backend, grace, run.marker or None, progress=record, run=run)
+    run.finished_at = timezone.now()
+    GarbageCollection.objects.filter(pk=run.pk).update(finished_at=run.finished_at)
+    logger.info(
+        "Garbage collection %s deleted %d of %d files, %d bytes; %d objects deferred",
+        run.pk, run.deleted, run.scanned, run.deleted_bytes, collection.deferred,
+    )
+    return run, collection
+
+
+def forget_collected_objects(storage_backend):
+    """Makes ``storage_backend`` forget which objects are stored if a
+    collection has deleted objects since this process last checked."""
+    global _objects_collected_at
+    collected_at = GarbageCollection.objects.aggregate(latest=Max('objects_collected_at'))['latest']
+    if collected_at != _objects_collected_at:
+        storage_backend.forget_objects()
+        _objects_collected_at = collected_at
+
+
+def objects_collected_since(started):
+    """Returns whether a collection has deleted objects since ``started``,
+    waiting for a batch being deleted to finish first."""
+    runs = GarbageCollection.objects.all()
+    # An expired lease was left by a collector that stopped, or gave up
+    while runs.filter(collecting_until__gt=timezone.now()).exists():
+        time.sleep(LEASE_POLL_INTERVAL)
+    collected_at = runs.aggregate(latest=Max('objects_collected_at'))['latest']
+    return collected_at is not None and collected_at >= started
+
+
+def _stored(storage_backend, name):
+    try:
+        storage_backend.stat(name)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def missing_objects(storage_backend, manifest):
+    """Returns the names of the objects ``manifest`` lists that are not
+    stored, checking ``STORAGE_UPLOAD_CONCURRENCY`` at a time."""
+    names = []
+    for entry in manifest:
+        name = f"{StorageBackend.OBJECTS_PREFIX}{entry.digest}"
+        names.append(name)
+        names.extend(compression.variant_name(name, encoding) for encoding in entry.encodings)
+    with ThreadPoolExecutor(max_workers=max(1, settings.STORAGE_UPLOAD_CONCURRENCY)) as executor:
+        stored = list(executor.map(lambda name: _stored(storage_backend, name), names))
+    return [name for name, exists in zip(names, stored) if not exists]
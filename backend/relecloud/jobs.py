@@ -0,0 +1,208 @@
+"""Background deployment jobs.
+
+``upload_project`` only stages the uploaded archive on local disk and queues a
+``DeploymentJob``. Extracting the archive and uploading its files happens in
+a separate worker process, ``manage.py runjobs``, so the request returns as
+soon as the archive is on disk and gunicorn workers stay free for API
+traffic. Every instance runs a worker against the shared queue, and a job
+is only claimed by the worker of the instance its archive is staged on
+(``INSTANCE_NAME``); the chunks of a resumable upload are in storage, so its
+job is claimed by any worker (see ``uploads``). The same worker runs the ``CleanupJob`` queued when a project is
+deleted (see ``cleanup``), once no deployment is waiting.
+
+Tar archives can instead be deployed while their upload is still arriving
+(``deploy_stream``), since they are decoded front to back (see ``archives``).
+"""
+import logging
+import os
+import shutil
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from . import uploads
+from .cleanup import delete_prefix, enqueue_cleanup, project_prefix
+from .deployments import deploy, prune_deployments
+from .models import CleanupJob, DeploymentJob, Project
+from .storage import StorageService
+
+logger = logging.getLogger(__name__)
+
+# Seconds between sweeps for abandoned upload sessions
+SESSION_EXPIRY_INTERVAL = 600
+
+
+def stage_upload(uploaded_file):
+    """Moves an uploaded file into ``STAGING_ROOT`` and returns its path."""
+    os.makedirs(settings.STAGING_ROOT, exist_ok=True)
+    name = os.path.basename(uploaded_file.name)
+    path = os.path.join(settings.STAGING_ROOT, f"{uuid.uuid4().hex}-{name}")
+    if hasattr(uploaded_file, 'temporary_file_path'):
+        # Large uploads are already spooled to disk by Django; rename instead
+        # of copying them again. Django ignores the missing file on close.
+        shutil.move(uploaded_file.temporary_file_path(), path)
+    else:
+        with open(path, 'wb') as staged:
+            for chunk in uploaded_file.chunks():
+                staged.write(chunk)
+    return path
+
+
+def enqueue_deployment(project, archive_path, file_name, is_zip, upload=None):
+    """Queues the deployment of a staged archive, or of a completed upload
+    session, whose chunks any instance can read."""
+    if upload is not None:
+        return DeploymentJob.objects.create(project=project, upload=upload, file_name=file_name, is_zip=is_zip)
+    return DeploymentJob.objects.create(
+        project=project, archive=archive_path, host=settings.INSTANCE_NAME, file_name=file_name, is_zip=is_zip
+    )
+
+
+def _update_job(job, **fields):
+    # Updates by primary key, so a job whose project was deleted meanwhile
+    # is not written back into the table
+    type(job).objects.filter(pk=job.pk).update(**fields)
+    for name, value in fields.items():
+        setattr(job, name, value)
+
+
+def claim_next_job(model=DeploymentJob):
+    """Marks the oldest queued job of ``model`` (``DeploymentJob`` or
+    ``CleanupJob``) as running and returns it.
+
+    The status change is a conditional update, so two workers polling the
+    same database can never claim the same job. Deployment jobs are only
+    claimed on the instance their archive is staged on; those of upload
+    sessions, and those queued before jobs recorded it, have no host and are
+    claimed anywhere.
+    """
+    queued = model.objects.filter(status=model.QUEUED)
+    if model is DeploymentJob:
+        queued = queued.filter(host__in=[settings.INSTANCE_NAME, ''])
+    for job in queued.order_by('id')[:10]:
+        claimed = model.objects.filter(pk=job.pk, status=model.QUEUED).update(
+            status=model.RUNNING, started_at=timezone.now()
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+    return None
+
+
+def requeue_stale_jobs():
+    """Requeues jobs left running by a worker that died mid-job. A cleanup
+    resumes from the last page it recorded."""
+    cutoff = timezone.now() - timedelta(seconds=settings.DEPLOYMENT_JOB_TIMEOUT)
+    return sum(
+        model.objects.filter(status=model.RUNNING, started_at__lt=cutoff).update(
+            status=model.QUEUED, started_at=None
+        )
+        for model in (DeploymentJob, CleanupJob)
+    )
+
+
+def run_job(job, archive=None, raise_errors=False):
+    """Uploads the job's staged archive or upload session, or ``archive``
+    when one is given, and records the outcome. With ``raise_errors`` a
+    failure is raised again once recorded."""
+    logger.info("Running deployment job %s for project %s", job.pk, job.project_id)
+    try:
+        if archive is None and job.upload_id is not None:
+            with uploads.assemble(job.upload) as assembled:
+                deploy(job, assembled)
+        elif archive is None:
+            with open(job.archive, 'rb') as staged:
+                deploy(job, staged)
+        else:
+            deploy(job, archive)
+    except Exception as e:
+        logger.error("Deployment job %s failed: %s", job.pk, e)
+        _update_job(job, status=DeploymentJob.FAILED, error=str(e), finished_at=timezone.now())
+        if not Project.objects.filter(pk=job.project_id).exists():
+            # Deleted while deploying, possibly after its cleanup ran: what
+            # the job stored would be left behind
+            enqueue_cleanup(project_prefix(job.project_id))
+        if raise_errors:
+            raise
+    else:
+        _update_job(job, status=DeploymentJob.SUCCEEDED, finished_at=timezone.now())
+    finally:
+        if job.upload_id is not None:
+            try:
+                uploads.discard_session(job.upload_id)
+            except Exception as e:
+                # Expired with its chunks later
+                logger.error("Failed to discard upload %s: %s", job.upload_id, e)
+        try:
+            if job.archive:
+                os.remove(job.archive)
+        except FileNotFoundError:
+            pass
+    return job
+
+
+def deploy_stream(project, stream, file_name):
+    """Deploys a tar archive as it is read from ``stream``, typically the
+    body of the request uploading it, in the calling thread rather than in
+    the worker. Returns the job, succeeded or failed.
+
+    Nothing is staged, so if the process dies mid-deploy the job cannot be
+    retried: the worker that requeues it finds no archive and fails it.
+    """
+    job = DeploymentJob.objects.create(
+        project=project, archive='', host=settings.INSTANCE_NAME, file_name=file_name,
+        status=DeploymentJob.RUNNING, started_at=timezone.now(),
+    )
+    try:
+        run_job(job, stream, raise_errors=True)
+    except Exception as e:
+        return job, e
+    prune_deployments(job.project_id)
+    return job, None
+
+
+def run_cleanup_job(job):
+    """Deletes what is stored under the job's prefix, recording progress
+    after every page, and records the outcome."""
+    logger.info("Running cleanup job %s for %s", job.pk, job.prefix)
+
+    def progress(count, marker):
+        _update_job(job, deleted=job.deleted + count, marker=marker or '')
+
+    try:
+        delete_prefix(StorageService.get_storage_backend(), job.prefix, job.marker or None, progress)
+    except Exception as e:
+        logger.error("Cleanup job %s failed: %s", job.pk, e)
+        _update_job(job, status=CleanupJob.FAILED, error=str(e), finished_at=timezone.now())
+    else:
+        logger.info("Cleanup job %s deleted %d files under %s", job.pk, job.deleted, job.prefix)
+        _update_job(job, status=CleanupJob.SUCCEEDED, finished_at=timezone.now())
+    return job
+
+
+def run_worker(poll_interval=None, once=False):
+    """Runs queued jobs until interrupted, or until the queue is empty if
+    ``once`` is set. Abandoned upload sessions are expired along the way."""
+    poll_interval = settings.DEPLOYMENT_JOB_POLL_INTERVAL if poll_interval is None else poll_interval
+    requeue_stale_jobs()
+    next_expiry = 0
+    while True:
+        close_old_connections()
+        if time.monotonic() >= next_expiry:
+            uploads.expire_sessions()
+            next_expiry = time.monotonic() + SESSION_EXPIRY_INTERVAL
+        job = claim_next_job()
+        if job is not None:
+            run_job(job)
+            if job.status == DeploymentJob.SUCCEEDED:
+                prune_deployments(job.project_id)
+        elif (cleanup_job := claim_next_job(CleanupJob)) is not None:
+            run_cleanup_job(cleanup_job)
+        elif once:
+            return
+        else:
+            time.sleep(poll_interval)
@@ -0,0 +1,72 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from relecloud.garbage import collect, run_collection
+from relecloud.storage import StorageService
+
+
+def _size(count):
+    for unit in ("B", "KB", "MB", "GB"):
+        if count < 1024:
+            return f"{count:.0f} {unit}"
+        count /= 1024
+    return f"{count:.1f} TB"
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes stored files that no project or deployment references and that are older than the "
+        "grace period. An interrupted collection resumes where it stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="List the orphaned files without deleting them.")
+        parser.add_argument("--grace", type=int, help="Seconds a file is kept, orphaned or not (GC_GRACE_PERIOD).")
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Start from the beginning rather than resume an unfinished collection.",
+        )
+        parser.add_argument(
+            "--report-interval", type=float, default=10, help="Seconds between progress reports (default 10)."
+        )
+
+    def handle(self, *args, **options):
+        storage_backend = StorageService.get_storage_backend()
+        start = time.monotonic()
+        next_report = start + options["report_interval"]
+
+        def report(collection, marker=None, final=False):
+            nonlocal next_report
+            now = time.monotonic()
+            if not final and now < next_report:
+                return
+            next_report = now + options["report_interval"]
+            elapsed = max(now - start, 1e-9)
+            line = (
+                f"Scanned {collection.scanned} files ({collection.scanned / elapsed:.0f}/s), "
+                f"{collection.orphaned} orphaned ({_size(collection.orphaned_bytes)})"
+            )
+            if not options["dry_run"]:
+                line += (
+                    f", {collection.deleted} deleted ({collection.deleted / elapsed:.0f}/s, "
+                    f"{_size(collection.deleted_bytes)}), {collection.deferred} objects deferred"
+                )
+            self.stdout.write(f"{line} in {elapsed:.1f}s")
+
+        def orphan(blob):
+            self.stdout.write(f"{blob.name}\t{blob.size}\t{blob.last_modified:%Y-%m-%d %H:%M:%S}")
+
+        try:
+            if options["dry_run"]:
+                collection = collect(storage_backend, options["grace"], dry_run=True, progress=report, orphan=orphan)
+            else:
+                run, collection = run_collection(storage_backend, options["grace"], options["restart"], report)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Garbage collection failed: {e}")
+
+        report(collection, final=True)
+        if not options["dry_run"]:
+            self.stdout.write(
+                f"Collection {run.pk}: {run.deleted} of {run.scanned} files deleted, {_size(run.deleted_bytes)}"
+            )
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from project import metrics
+from relecloud.jobs import run_worker
+
+
+class Command(BaseCommand):
+    help = "Runs queued deployment jobs: extracts staged archives and uploads them to storage."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Exit once the queue is empty.")
+        parser.add_argument("--poll-interval", type=float, help="Seconds to wait between polls of an empty queue.")
+
+    def handle(self, *args, **options):
+        # Deploys and cleanups make the storage calls, so their latencies are
+        # only exported if the worker writes its metrics too
+        metrics.start_flushing()
+        try:
+            run_worker(poll_interval=options["poll_interval"], once=options["once"])
+        finally:
+            metrics.flush()
@@ -0,0 +1,171 @@
+"""Per-deployment file manifests.
+
+A manifest lists every file of a deployment with its size, SHA-256 digest,
+content type and the sizes of its precompressed variants; the file's blob is
+the content-addressed object ``objects/<digest>``. It is written once, when
+the deployment is uploaded, and stored next to it as ``manifest.bin``.
+
+The format is built for sites with hundreds of thousands of files: entries
+are sorted by path and stored column by column, so loading a manifest is a
+handful of ``array.frombytes`` calls rather than one object per file, and a
+path is found by binary search over the sorted paths.
+
+Layout, little-endian::
+
+    b"HMF1" | u32 count | f64 created | u32 len | content types, "\\n"-joined
+    u32 len | paths, UTF-8, concatenated in sorted order
+    u32[count + 1] path offsets | u64[count] sizes | 32 bytes[count] digests
+    u16[count] content type numbers | u64[count] size per encoding, 0 if absent
+"""
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+
+MAGIC = b'HMF1'
+# Variant encodings, in the order their sizes are stored. Fixed so manifests
+# read the same whether or not Brotli is available.
+ENCODINGS = ('br', 'gzip')
+DEFAULT_CONTENT_TYPE = 'application/octet-stream'
+
+Entry = namedtuple('Entry', ['path', 'size', 'digest', 'content_type', 'encodings'])
+Entry.__doc__ = """A file of a deployment. ``digest`` is the hex SHA-256 of
+the file and ``encodings`` maps each stored variant's encoding to its size."""
+
+_HEADER = struct.Struct('<4sId')
+_LENGTH = struct.Struct('<I')
+
+
+def _array(typecode, data=b''):
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def _array_bytes(values):
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+class Manifest:
+    """The files of one deployment, looked up by path."""
+
+    def __init__(self, created, content_types, paths, offsets, sizes, digests, type_numbers, encoded_sizes):
+        self.created = created
+        self._content_types = content_types
+        self._paths = paths
+        self._offsets = offsets
+        self._sizes = sizes
+        self._digests = digests
+        self._type_numbers = type_numbers
+        self._encoded_sizes = encoded_sizes
+
+    @classmethod
+    def build(cls, entries, created):
+        """Builds a manifest from ``Entry`` tuples in any order."""
+        entries = sorted(entries, key=lambda entry: entry.path)
+        content_types = {}
+        paths = bytearray()
+        offsets, sizes, type_numbers = array('I', [0]), array('Q'), array('H')
+        digests = bytearray()
+        encoded_sizes = {encoding: array('Q') for encoding in ENCODINGS}
+        for entry in entries:
+            paths += entry.path.encode()
+            offsets.append(len(paths))
+            sizes.append(entry.size)
+            digests += bytes.fromhex(entry.digest)
+            content_type = entry.content_type or DEFAULT_CONTENT_TYPE
+            type_numbers.append(content_types.setdefault(content_type, len(content_types)))
+            for encoding in ENCODINGS:
+                encoded_sizes[encoding].append(entry.encodings.get(encoding, 0))
+        return cls(
+            created, list(content_types), bytes(paths), offsets, sizes, bytes(digests), type_numbers,
+            [encoded_sizes[encoding] for encoding in ENCODINGS],
+        )
+
+    def to_bytes(self):
+        content_types = '\n'.join(self._content_types).encode()
+        parts = [
+            _HEADER.pack(MAGIC, len(self), self.created),
+            _LENGTH.pack(len(content_types)), content_types,
+            _LENGTH.pack(len(self._paths)), self._paths,
+            _array_bytes(self._offsets), _array_bytes(self._sizes), self._digests,
+            _array_bytes(self._type_numbers),
+        ]
+        parts += [_array_bytes(sizes) for sizes in self._encoded_sizes]
+        return b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Parses a manifest written by ``to_bytes``; raises ``ValueError``
+        if ``data`` is not one."""
+        try:
+            data = memoryview(data)
+            magic, count, created = _HEADER.unpack_from(data)
+            if magic != MAGIC:
+                raise ValueError("Not a deployment manifest")
+            position = _HEADER.size
+
+            def take(length):
+                nonlocal position
+                if position + length > len(data):
+                    raise ValueError("Truncated deployment manifest")
+                position += length
+                return data[position - length:position]
+
+            def take_sized():
+                length, = _LENGTH.unpack(take(_LENGTH.size))
+                return bytes(take(length))
+
+            content_types = take_sized()
+            content_types = content_types.decode().split('\n') if content_types else []
+            paths = take_sized()
+            offsets = _array('I', take(4 * (count + 1)))
+            sizes = _array('Q', take(8 * count))
+            digests = bytes(take(32 * count))
+            type_numbers = _array('H', take(2 * count))
+            encoded_sizes = [_array('Q', take(8 * count)) for _ in ENCODINGS]
+        except struct.error as e:
+            raise ValueError(f"Invalid deployment manifest: {str(e)}")
+        return cls(created, content_types, paths, offsets, sizes, digests, type_numbers, encoded_sizes)
+
+    def __len__(self):
+        return len(self._sizes)
+
+    def _path(self, i):
+        return self._paths[self._offsets[i]:self._offsets[i + 1]].decode()
+
+    def _entry(self, i):
+        encodings = {
+            encoding: sizes[i] for encoding, sizes in zip(ENCODINGS, self._encoded_sizes) if sizes[i]
+        }
+        return Entry(
+            self._path(i), self._sizes[i], self._digests[32 * i:32 * (i + 1)].hex(),
+            self._content_types[self._type_numbers[i]], encodings,
+        )
+
+    def lookup(self, path):
+        """Returns the ``Entry`` of ``path``, or ``None``."""
+        i = bisect_left(range(len(self)), path, key=self._path)
+        if i < len(self) and self._path(i) == path:
+            return self._entry(i)
+        return None
+
+    def __contains__(self, path):
+        return self.lookup(path) is not None
+
+    def __iter__(self):
+        return (self._entry(i) for i in range(len(self)))
+
+    @property
+    def total_size(self):
+        return sum(self._sizes)
+
+    def digests(self):
+        """The digests of every object the deployment uses, variants excluded."""
+        return {self._digests[32 * i:32 * (i + 1)].hex() for i in range(len(self))}
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("relecloud", "0007_project_remove_cruise_destinations_and_more"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="project",
+            name="file",
+            field=models.CharField(max_length=500),
+        ),
+        migrations.CreateModel(
+            name="DeploymentJob",
+            fields=[
+                ("id", models.AutoField(primary_key=True, serialize=False)),
+                ("status", models.CharField(
+                    choices=[
+                        ("queued", "Queued"), ("running", "Running"), ("succeeded", "Succeeded"), ("failed", "Failed"),
+                    ],
+                    default="queued", max_length=16,
+                )),
+                ("archive", models.CharField(max_length=500)),
+                ("file_name", models.CharField(max_length=255)),
+                ("is_zip", models.BooleanField(default=False)),
+                ("error", models.TextField(blank=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("started_at", models.DateTimeField(blank=True, null=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+                ("project", models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE, related_name="jobs", to="relecloud.project",
+                )),
+            ],
+            options={
+                "indexes": [models.Index(fields=["status", "id"], name="deploymentjob_status_idx")],
+            },
+        ),
+    ]
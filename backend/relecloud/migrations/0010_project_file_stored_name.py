@@ -0,0 +1,31 @@
+from urllib.parse import unquote, urlparse
+
+from django.conf import settings
+from django.db import migrations
+
+
+def urls_to_stored_names(apps, schema_editor):
+    """Project.file used to hold the SAS URL returned at upload time; it now
+    holds the stored name and URLs are made when projects are read."""
+    Project = apps.get_model("relecloud", "Project")
+    for project in Project.objects.exclude(file=""):
+        if project.file.startswith(("http://", "https://")):
+            # https://<account>.blob.core.windows.net/<container>/<blob name>?<sas>
+            path = unquote(urlparse(project.file).path).lstrip("/")
+            name = path.split("/", 1)[1] if "/" in path else path
+        elif project.file.startswith(settings.MEDIA_URL):
+            name = unquote(project.file[len(settings.MEDIA_URL):])
+        else:
+            continue
+        Project.objects.filter(pk=project.pk).update(file=name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("relecloud", "0009_uploadsession"),
+    ]
+
+    operations = [
+        migrations.RunPython(urls_to_stored_names, migrations.RunPython.noop),
+    ]
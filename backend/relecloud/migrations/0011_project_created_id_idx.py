@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("relecloud", "0010_project_file_stored_name"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="project",
+            index=models.Index(fields=["created_at", "id"], name="project_created_id_idx"),
+        ),
+    ]
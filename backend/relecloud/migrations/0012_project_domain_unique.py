@@ -0,0 +1,35 @@
+from django.db import migrations, models
+
+
+def normalize_domains(apps, schema_editor):
+    """Domains were saved as entered, and uploads used to store the
+    placeholder "domain". Normalize what can be served and clear the rest so
+    the unique index can be built; the first project keeps a duplicate."""
+    Project = apps.get_model("relecloud", "Project")
+    seen = set()
+    for project in Project.objects.exclude(domain=None).order_by("id"):
+        domain = project.domain.strip().lower().rstrip(".")
+        if domain.count(":") == 1:
+            domain = domain.rsplit(":", 1)[0]
+        if "." not in domain or domain in seen:
+            domain = None
+        else:
+            seen.add(domain)
+        if domain != project.domain:
+            Project.objects.filter(pk=project.pk).update(domain=domain)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("relecloud", "0011_project_created_id_idx"),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_domains, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="project",
+            name="domain",
+            field=models.CharField(blank=True, max_length=255, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:09
+
+import uuid
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def record_current_deployments(apps, schema_editor):
+    """Existing projects get a Deployment for what Project.file points at."""
+    Project = apps.get_model("relecloud", "Project")
+    Deployment = apps.get_model("relecloud", "Deployment")
+    for project in Project.objects.exclude(file=""):
+        prefix = project.file.rpartition("/")[0] or project.file
+        deployment = Deployment.objects.create(project=project, prefix=prefix, file=project.file)
+        Project.objects.filter(pk=project.pk).update(active_deployment=deployment)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("relecloud", "0012_project_domain_unique"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Deployment",
+            fields=[
+                ("id", models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ("prefix", models.CharField(max_length=500)),
+                ("file", models.CharField(max_length=500)),
+                ("manifest_size", models.BigIntegerField(blank=True, null=True)),
+                ("file_count", models.IntegerField(default=0)),
+                ("total_size", models.BigIntegerField(default=0)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("job", models.ForeignKey(
+                    blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name="+",
+                    to="relecloud.deploymentjob",
+                )),
+                ("project", models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE, related_name="deployments", to="relecloud.project",
+                )),
+            ],
+        ),
+        migrations.AddField(
+            model_name="project",
+            name="active_deployment",
+            field=models.ForeignKey(
+                blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name="+",
+                to="relecloud.deployment",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="deployment",
+            index=models.Index(fields=["project", "created_at"], name="deployment_project_idx"),
+        ),
+        migrations.RunPython(record_current_deployments, migrations.RunPython.noop),
+    ]
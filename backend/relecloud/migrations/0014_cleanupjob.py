@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('relecloud', '0013_deployment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CleanupJob',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('prefix', models.CharField(max_length=500)),
+                ('status', models.CharField(
+                    choices=[
+                        ('queued', 'Queued'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed'),
+                    ],
+                    default='queued', max_length=16,
+                )),
+                ('marker', models.TextField(blank=True)),
+                ('deleted', models.IntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'id'], name='cleanupjob_status_idx')],
+            },
+        ),
+    ]
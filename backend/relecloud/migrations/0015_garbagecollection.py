@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('relecloud', '0014_cleanupjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GarbageCollection',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('marker', models.TextField(blank=True)),
+                ('scanned', models.BigIntegerField(default=0)),
+                ('deleted', models.BigIntegerField(default=0)),
+                ('deleted_bytes', models.BigIntegerField(default=0)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('objects_collected_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('relecloud', '0015_garbagecollection'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='garbagecollection',
+            name='collecting_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
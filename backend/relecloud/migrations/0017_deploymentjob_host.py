@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('relecloud', '0016_garbagecollection_collecting_until'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deploymentjob',
+            name='host',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('relecloud', '0017_deploymentjob_host'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deploymentjob',
+            name='upload',
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name='+',
+                to='relecloud.uploadsession',
+            ),
+        ),
+    ]
@@ -1,13 +1,176 @@
 # models.py
+import uuid
+
 from django.db import models
 
+
 class Project(models.Model):
     id = models.AutoField(primary_key=True)
     name = models.CharField(max_length=255)
     description = models.TextField()
-    domain = models.CharField(max_length=255, blank=True, null=True)
+    # Normalized by relecloud.domains.normalize_domain; may be a wildcard
+    domain = models.CharField(max_length=255, blank=True, null=True, unique=True)
+    # Stored name of the active deployment's manifest (or single file), kept
+    # in step with active_deployment
     file = models.CharField(max_length=500)
+    active_deployment = models.ForeignKey(
+        'Deployment', on_delete=models.SET_NULL, blank=True, null=True, related_name='+'
+    )
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # Keyset pagination of the project list seeks on this index
+        indexes = [models.Index(fields=['created_at', 'id'], name='project_created_id_idx')]
+
     def __str__(self):
         return self.name
+
+class DeploymentJob(models.Model):
+    """Extraction and upload of a staged archive, run by ``manage.py runjobs``."""
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    id = models.AutoField(primary_key=True)
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='jobs')
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED)
+    # Staged upload on the local disk of the instance that received it
+    archive = models.CharField(max_length=500)
+    # INSTANCE_NAME of that instance, whose worker alone runs the job
+    host = models.CharField(max_length=255, blank=True)
+    # Or the completed upload session whose stored chunks are the archive
+    upload = models.ForeignKey('UploadSession', on_delete=models.SET_NULL, blank=True, null=True, related_name='+')
+    file_name = models.CharField(max_length=255)
+    is_zip = models.BooleanField(default=False)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'id'], name='deploymentjob_status_idx')]
+
+    def __str__(self):
+        return f"{self.project_id}: {self.file_name} ({self.status})"
+
+class CleanupJob(models.Model):
+    """Deletion of everything stored under a prefix, run by ``manage.py runjobs``.
+
+    Blobs are listed and deleted a page at a time; after each page ``marker``
+    records where listing continues, so a cleanup interrupted by a worker
+    restart resumes there rather than listing from the start again.
+    """
+
+    QUEUED = DeploymentJob.QUEUED
+    RUNNING = DeploymentJob.RUNNING
+    SUCCEEDED = DeploymentJob.SUCCEEDED
+    FAILED = DeploymentJob.FAILED
+    STATUS_CHOICES = DeploymentJob.STATUS_CHOICES
+
+    id = models.AutoField(primary_key=True)
+    prefix = models.CharField(max_length=500)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED)
+    # Listing position after the last deleted page; empty to start
+    marker = models.TextField(blank=True)
+    deleted = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'id'], name='cleanupjob_status_idx')]
+
+    def __str__(self):
+        return f"{self.prefix} ({self.status}, {self.deleted} deleted)"
+
+class GarbageCollection(models.Model):
+    """A run of ``manage.py collectgarbage``, which deletes stored files no
+    deployment references (see ``gc``).
+
+    The run records its progress after every batch it deletes, so one that
+    is interrupted resumes from ``marker`` rather than listing the whole
+    container again.
+    """
+
+    id = models.AutoField(primary_key=True)
+    # Listing position after the last deleted batch; empty to start
+    marker = models.TextField(blank=True)
+    scanned = models.BigIntegerField(default=0)
+    deleted = models.BigIntegerField(default=0)
+    deleted_bytes = models.BigIntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    # When the run last started or finished deleting objects/; job workers
+    # then forget which objects they remember as stored, and deploys that
+    # started before check that their objects are still there
+    objects_collected_at = models.DateTimeField(blank=True, null=True)
+    # Set while the run deletes a batch of objects/, until which deploys
+    # wait before checking their objects
+    collecting_until = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.started_at:%Y-%m-%d %H:%M}: {self.deleted} of {self.scanned} deleted"
+
+class Deployment(models.Model):
+    """One uploaded version of a project's site.
+
+    Every deployment is stored under its own prefix and never modified, so a
+    project switches or rolls back between deployments by pointing
+    ``Project.active_deployment`` at another one.
+    """
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='deployments')
+    job = models.ForeignKey(DeploymentJob, on_delete=models.SET_NULL, blank=True, null=True, related_name='+')
+    # Storage prefix (without a trailing slash) of everything the deployment
+    # stored besides the shared objects/
+    prefix = models.CharField(max_length=500)
+    # Stored name of the manifest, or of the file for single-file uploads
+    file = models.CharField(max_length=500)
+    # Size of the manifest; unknown for deployments made before manifests
+    # were immutable
+    manifest_size = models.BigIntegerField(blank=True, null=True)
+    file_count = models.IntegerField(default=0)
+    total_size = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['project', 'created_at'], name='deployment_project_idx')]
+
+    def __str__(self):
+        return f"{self.project_id}: {self.prefix}"
+
+class UploadSession(models.Model):
+    """A resumable, chunked upload of an archive.
+
+    Chunks are stored as they arrive, each under ``uploads/<id>/`` in the
+    storage backend; ``offset`` is the number of contiguous bytes received
+    so far, which is where a client resumes after a dropped connection.
+    """
+
+    OPEN = 'open'
+    COMPLETE = 'complete'
+    STATUS_CHOICES = [
+        (OPEN, 'Open'),
+        (COMPLETE, 'Complete'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    file_name = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=OPEN)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.file_name} ({self.offset}/{self.size})"
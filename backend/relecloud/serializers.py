@@ -1,8 +1,24 @@
 # serializers.py
 from rest_framework import serializers
+
 from .models import Project
 
+
 class ProjectSerializer(serializers.ModelSerializer):
+    # Where the active deployment is served, from the project's domain
+    url = serializers.SerializerMethodField()
+
     class Meta:
         model = Project
-        fields = '__all__'
+        # Project.file is the internal name of the active deployment's
+        # manifest; clients get active_deployment and url instead
+        exclude = ['file']
+
+    def get_url(self, instance):
+        # Hosted sites are served by Host header, so no storage is involved;
+        # a wildcard domain has no single URL
+        if instance.active_deployment_id is None or not instance.domain or instance.domain.startswith('*.'):
+            return None
+        request = self.context.get('request')
+        scheme = request.scheme if request is not None else 'https'
+        return f"{scheme}://{instance.domain}/"
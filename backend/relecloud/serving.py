@@ -0,0 +1,233 @@
+"""Serving of hosted sites by Host header.
+
+``HostedSiteMiddleware`` resolves the request's host with
+``domains.resolve_host`` and hands requests for hosted domains to
+``serve_site``; everything else, including every request to the app's own
+hosts, continues to the API.
+
+A site's files are content-addressed objects listed in the active
+deployment's manifest, so the object's digest is a strong ETag and its size
+is known without asking storage: conditional requests that match are
+answered with 304, and other requests only read the file itself.
+Files are read through the process's ``AssetCache``; files too large for it
+are streamed from storage piece by piece. Single byte ranges are honoured
+either way, so seeking in media only transfers the requested bytes. Files
+deployed with precompressed variants are served in the encoding the client
+prefers, each encoding being a representation with its own ETag.
+"""
+import logging
+import re
+from functools import lru_cache, partial
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotAllowed, StreamingHttpResponse
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+from project.middleware import AsyncCapableMiddleware
+
+from . import compression, domains
+from .manifest import Manifest
+from .storage import StorageBackend, StorageService, iter_file
+
+INDEX_DOCUMENT = 'index.html'
+# Browsers revalidate on every use; a matching ETag makes that a 304
+CACHE_CONTROL = 'public, no-cache'
+
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+logger = logging.getLogger(__name__)
+
+
+class HostedSiteMiddleware(AsyncCapableMiddleware):
+    """Answers requests for hosted domains before the API middleware runs.
+
+    Placed right after ``SecurityMiddleware``: hosted sites need neither
+    sessions nor CSRF, and their visitors send no API ``Origin``. Under
+    ASGI, hosts in the domain cache are resolved on the event loop; only a
+    cache miss and serving a hosted file, which read the database and
+    storage, go to a thread.
+    """
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        # The raw header, since hosted domains are not in ALLOWED_HOSTS
+        site = domains.resolve_host(request.META.get('HTTP_HOST', ''))
+        if site is None:
+            return self.get_response(request)
+        # Lets MetricsMiddleware label the request
+        request.hosted_site = site
+        return serve_site(request, site, request.path)
+
+    async def __acall__(self, request):
+        site = await domains.aresolve_host(request.META.get('HTTP_HOST', ''))
+        if site is None:
+            return await self.get_response(request)
+        request.hosted_site = site
+        return await sync_to_async(serve_site)(request, site, request.path)
+
+
+def _lookup(manifest, path):
+    """Returns the manifest ``Entry`` a request path is served from, or ``None``."""
+    path = path.lstrip('/')
+    if path == '' or path.endswith('/'):
+        return manifest.lookup(path + INDEX_DOCUMENT)
+    # /docs serves docs/index.html
+    return manifest.lookup(path) or manifest.lookup(f"{path}/{INDEX_DOCUMENT}")
+
+
+@lru_cache(maxsize=settings.MANIFEST_CACHE_SIZE)
+def _load_manifest(manifest_name, etag, size):
+    """Returns a parsed manifest. Manifests are parsed once per version and
+    worker; the bytes come through the ``AssetCache``."""
+    storage_backend = StorageService.get_storage_backend()
+    file = StorageService.get_asset_cache().open(
+        manifest_name, etag, size, partial(storage_backend.stream, manifest_name)
+    )
+    if file is None:
+        return storage_backend.read_manifest(manifest_name)
+    with file:
+        try:
+            return Manifest.from_bytes(file.read())
+        except ValueError as e:
+            raise ValueError(f"Invalid manifest {manifest_name}: {str(e)}")
+
+
+def _read_manifest(storage_backend, site):
+    """Returns the manifest of the site's active deployment.
+
+    Manifests of deployments are immutable and their size is recorded, so
+    this costs no round trip once the manifest is cached; older manifests
+    are revalidated against storage.
+    """
+    if site.manifest_size is not None:
+        return _load_manifest(site.manifest, site.manifest, site.manifest_size)
+    stat = storage_backend.stat(site.manifest)
+    return _load_manifest(site.manifest, stat.etag, stat.size)
+
+
+def _body(file, offset, length, block_size):
+    with file:
+        yield from iter_file(file, offset, length, block_size)
+
+
+def _not_modified(request, etag, last_modified):
+    """Whether the client's copy is current. ``If-None-Match`` takes
+    precedence over ``If-Modified-Since`` when both are sent (RFC 9110 13.2.2).
+    ``last_modified`` is a timestamp."""
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        etags = parse_etags(if_none_match)
+        # Weak comparison: W/"x" matches "x"
+        return '*' in etags or etag in [tag.removeprefix('W/') for tag in etags]
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return if_modified_since is not None and int(last_modified) <= if_modified_since
+
+
+def parse_range(header, size):
+    """Returns the ``(offset, length)`` of a single-range ``Range`` header.
+
+    Returns ``None`` when the header should be ignored, which is the case for
+    malformed and multi-range headers, and raises ``ValueError`` when the
+    range cannot be satisfied.
+    """
+    match = _RANGE.match(header.replace(' ', ''))
+    if match is None:
+        return None
+    first, last = match.groups()
+    if first:
+        first = int(first)
+        if last and int(last) < first:
+            return None
+        if first >= size:
+            _unsatisfiable()
+        last = min(int(last), size - 1) if last else size - 1
+        return first, last - first + 1
+    if not last:
+        return None
+    # bytes=-N is the last N bytes
+    length = min(int(last), size)
+    if length == 0:
+        _unsatisfiable()
+    return size - length, length
+
+
+def _unsatisfiable():
+    raise ValueError('Range not satisfiable')
+
+
+def serve_site(request, site, path):
+    """Serves ``path`` of the hosted site ``site`` from storage."""
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'HEAD'])
+    if site.manifest is None:
+        return HttpResponse('Site is not deployed yet', status=404, content_type='text/plain')
+
+    storage_backend = StorageService.get_storage_backend()
+    try:
+        manifest = _read_manifest(storage_backend, site)
+    except FileNotFoundError:
+        manifest = None
+    except ValueError as e:
+        logger.error("Failed to read manifest of project %s: %s", site.project_id, e)
+        return HttpResponse('Storage unavailable', status=502, content_type='text/plain')
+    entry = _lookup(manifest, path) if manifest is not None else None
+    if entry is None:
+        return HttpResponse('Not found', status=404, content_type='text/plain')
+
+    object_name = StorageBackend.OBJECTS_PREFIX + entry.digest
+    size = entry.size
+    headers = {'Cache-Control': CACHE_CONTROL}
+    encoding = None
+    if entry.encodings:
+        headers['Vary'] = 'Accept-Encoding'
+        encoding = compression.negotiate(request.META.get('HTTP_ACCEPT_ENCODING'), entry.encodings)
+    if encoding is not None:
+        object_name = compression.variant_name(object_name, encoding)
+        size = entry.encodings[encoding]
+        headers['Content-Encoding'] = encoding
+        etag = quote_etag(f"{entry.digest}-{encoding}")
+    else:
+        etag = quote_etag(entry.digest)
+    headers['ETag'] = etag
+    # Files have no modification time of their own; they are as old as the
+    # deployment they were published in
+    headers['Last-Modified'] = http_date(manifest.created)
+    if _not_modified(request, etag, manifest.created):
+        return HttpResponse(status=304, headers=headers)
+
+    headers['Accept-Ranges'] = 'bytes'
+    offset, length, status = 0, size, 200
+    range_header = request.META.get('HTTP_RANGE')
+    if_range = request.META.get('HTTP_IF_RANGE')
+    # A stale If-Range means the client wants the whole, current file
+    if range_header and (if_range is None or if_range == etag):
+        try:
+            requested = parse_range(range_header, size)
+        except ValueError:
+            headers['Content-Range'] = f'bytes */{size}'
+            return HttpResponse(status=416, headers=headers)
+        if requested is not None:
+            offset, length = requested
+            status = 206
+            headers['Content-Range'] = f'bytes {offset}-{offset + length - 1}/{size}'
+
+    content_type = entry.content_type
+    if request.method == 'HEAD' or length == 0:
+        response = HttpResponse(status=status, content_type=content_type, headers=headers)
+    else:
+        try:
+            cache = StorageService.get_asset_cache()
+            file = cache.open(object_name, etag, size, partial(storage_backend.stream, object_name))
+            if file is not None:
+                body = _body(file, offset, length, storage_backend.block_size)
+            else:
+                body = storage_backend.stream(object_name, offset, length)
+        except FileNotFoundError:
+            return HttpResponse('Not found', status=404, content_type='text/plain')
+        except ValueError as e:
+            logger.error("Failed to download %s: %s", object_name, e)
+            return HttpResponse('Storage unavailable', status=502, content_type='text/plain')
+        response = StreamingHttpResponse(body, status=status, content_type=content_type, headers=headers)
+    response['Content-Length'] = str(length)
+    return response
@@ -1,128 +1,853 @@
-from django.conf import settings
+import hashlib
+import logging
 import mimetypes
-import zipfile
 import os
-import mimetypes
+import shutil
+import stat as stat_module
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+from collections import OrderedDict, namedtuple
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import UTC, datetime
+from functools import partial
 from io import BytesIO
-from datetime import datetime, timedelta
 
-from azure.storage.blob import BlobServiceClient, ContentSettings
-from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError, ServiceRequestError
-from azure.storage.blob import generate_blob_sas, BlobSasPermissions
+from django.conf import settings
+from project import metrics
+
+from . import archives, compression
+from .manifest import Entry, Manifest
+
+logger = logging.getLogger(__name__)
+# One message per file of a deployment; sampled, see LOG_FILE_EVENT_SAMPLE_RATE
+file_logger = logging.getLogger(__name__ + '.files')
+
+# What serving a stored file needs to know without reading it
+BlobStat = namedtuple('BlobStat', ['size', 'last_modified', 'content_type', 'etag'])
+# One entry of a listing
+ListedBlob = namedtuple('ListedBlob', ['name', 'size', 'last_modified'])
+
+
+def iter_file(file, offset=0, length=None, block_size=64 * 1024):
+    """Yields ``length`` bytes of ``file`` from ``offset`` (all of the rest
+    if ``length`` is ``None``) in pieces of at most ``block_size``."""
+    file.seek(offset)
+    remaining = length
+    while remaining is None or remaining > 0:
+        chunk = file.read(block_size if remaining is None else min(block_size, remaining))
+        if not chunk:
+            return
+        if remaining is not None:
+            remaining -= len(chunk)
+        yield chunk
+
+
+def hash_file(file, block_size):
+    """Returns the SHA-256 hex digest and size of a file-like object."""
+    digest = hashlib.sha256()
+    size = 0
+    while chunk := file.read(block_size):
+        digest.update(chunk)
+        size += len(chunk)
+    return digest.hexdigest(), size
+
+
+class UploadFailed(ValueError):
+    """Raised by ``UploadEngine.run`` when one or more uploads failed.
+
+    ``results`` holds the uploads that completed before the run was stopped,
+    ``errors`` maps each failed name to its exception.
+    """
+
+    def __init__(self, results, errors):
+        self.results = results
+        self.errors = errors
+        name, error = next(iter(errors.items()))
+        super().__init__(f"{len(errors)} upload(s) failed, first was {name}: {error}")
+
+
+class UploadEngine:
+    """Runs many small uploads concurrently on a bounded thread pool.
+
+    Tasks are pulled lazily from the iterable passed to ``run`` so that at
+    most ``2 * max_workers`` of them are queued at any time. As soon as one
+    task fails no further tasks are started, queued ones are cancelled and
+    ``UploadFailed`` is raised once the in-flight ones have finished.
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max(1, max_workers or settings.STORAGE_UPLOAD_CONCURRENCY)
+
+    def run(self, tasks):
+        """Runs ``(name, callable)`` pairs and returns ``{name: result}``."""
+        results = {}
+        errors = {}
+        pending = {}
+
+        def collect(done):
+            for future in done:
+                name = pending.pop(future)
+                if future.cancelled():
+                    continue
+                error = future.exception()
+                if error is not None:
+                    errors[name] = error
+                else:
+                    results[name] = future.result()
+
+        with ThreadPoolExecutor(self.max_workers, thread_name_prefix="upload") as executor:
+            for name, task in tasks:
+                if len(pending) >= 2 * self.max_workers:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+                if errors:
+                    break
+                pending[executor.submit(task)] = name
+            if errors:
+                for future in pending:
+                    future.cancel()
+            collect(wait(pending).done)
+
+        if errors:
+            raise UploadFailed(results, errors)
+        return results
+
+
+class ObjectStore:
+    """The content-addressed ``objects/`` store, shared by ``StorageBackend``
+    and the asyncio ``AsyncAzureStorageBackend`` so that both store a file
+    the same way.
+
+    ``_object_steps`` decides what storing one file takes: hashing it,
+    skipping an object that is already stored, and compressing and
+    uploading its variants. It is a generator that yields each step as
+    ``(method name, args)`` and is sent the step's result; ``_run_steps``
+    calls the methods, the async backend awaits them. A
+    ``FileNotFoundError`` raised by a step is thrown back into the
+    generator.
+
+    Backends implement the storage steps, ``_exists(file_name)``,
+    ``stat(file_name)`` and ``_upload_opened(open_file, file_name, size,
+    content_type=None, content_encoding=None)``; ``_hash_opened`` and
+    ``_compress_opened`` only read the file.
+    """
+
+    OBJECTS_PREFIX = 'objects/'
+    # Number of objects remembered as stored, with their sizes, so repeated
+    # deploys skip the existence check. The mapping is cleared when full
+    # rather than evicted one by one; forgetting an object only costs a round
+    # trip.
+    MAX_KNOWN_OBJECTS = 100_000
 
-class AzureStorageBackend:
     def __init__(self):
-        try:
-            print('azure storage connection string')
-            print (settings.AZURE_STORAGE_CONNECTION_STRING)
-            self.client = BlobServiceClient.from_connection_string(
-                settings.AZURE_STORAGE_CONNECTION_STRING, 
-            )
-            self.container_name = settings.AZURE_CONTAINER_NAME
-            self.account_name = settings.AZURE_STORAGE_ACCOUNT_NAME
-            self.account_key = settings.AZURE_STORAGE_ACCOUNT_KEY
-            
-            print(self.container_name)
-            # Verify container exists
-            self.client.get_container_client(settings.AZURE_CONTAINER_NAME).get_container_properties()
-        except ResourceNotFoundError:
-            raise ValueError(f"Container {self.container_name} not found")
-        except Exception as e:
-            raise ValueError(f"Failed to initialize storage client: {str(e)}")
+        self.block_size = settings.AZURE_UPLOAD_BLOCK_SIZE
+        # objects/ name without the prefix -> size
+        self._known_objects = {}
 
-    def _upload_file(self, file, file_name):
-        """Uploads an individual file to Azure Blob Storage."""
-        try:
-            blob_client = self.client.get_blob_client(
-                container=self.container_name, 
-                blob=file_name
-            )
+    def forget_objects(self):
+        """Forgets which objects are stored, after some were deleted."""
+        self._known_objects.clear()
+
+    def _remember(self, name, size):
+        if len(self._known_objects) >= self.MAX_KNOWN_OBJECTS:
+            self._known_objects.clear()
+        self._known_objects[name] = size
+
+    def _hash_opened(self, open_file):
+        with open_file() as file:
+            return hash_file(file, self.block_size)
+
+    def _compress_opened(self, open_file, encoding):
+        with open_file() as file:
+            return compression.compress(file, encoding, self.block_size)
+
+    def _object_steps(self, open_file, path):
+        """The steps of storing the file ``open_file()`` opens as an object,
+        with its precompressed variants; returns its manifest ``Entry``.
+        ``path`` is the file's path within the site."""
+        digest, size = yield '_hash_opened', (open_file,)
+        object_name = f"{self.OBJECTS_PREFIX}{digest}"
+        content_type, _ = mimetypes.guess_type(path)
+        if digest in self._known_objects or (yield '_exists', (object_name,)):
+            file_logger.debug("File unchanged: %s", path)
+        else:
+            yield '_upload_opened', (open_file, object_name, size, content_type)
+            file_logger.debug("File uploaded: %s", path)
+        self._remember(digest, size)
+
+        encodings = {}
+        if not compression.is_compressible(content_type, size):
+            return Entry(path, size, digest, content_type, encodings)
+        for encoding in compression.ENCODINGS:
+            variant_name = compression.variant_name(object_name, encoding)
+            known_name = variant_name[len(self.OBJECTS_PREFIX):]
+            encoded_size = self._known_objects.get(known_name)
+            if encoded_size is None:
+                try:
+                    encoded_size = (yield 'stat', (variant_name,)).size
+                except FileNotFoundError:
+                    compressed, encoded_size = yield '_compress_opened', (open_file, encoding)
+                    if encoded_size >= size:
+                        # Not worth storing
+                        compressed.close()
+                        continue
+                    yield '_upload_opened', (lambda: compressed, variant_name, encoded_size, content_type, encoding)
+                self._remember(known_name, encoded_size)
+            encodings[encoding] = encoded_size
+        return Entry(path, size, digest, content_type, encodings)
 
-            # Determine MIME type
-            mime_type, _ = mimetypes.guess_type(file_name)
-            if not mime_type:
-                mime_type = 'application/octet-stream'  # Default fallback
+    def _run_steps(self, steps):
+        """Runs the steps of ``_object_steps`` one after the other and
+        returns its result."""
+        send, value = steps.send, None
+        while True:
+            try:
+                name, args = send(value)
+            except StopIteration as stop:
+                return stop.value
+            try:
+                send, value = steps.send, getattr(self, name)(*args)
+            except FileNotFoundError as e:
+                send, value = steps.throw, e
 
-            content_settings = ContentSettings(content_type=mime_type)
 
-            # Upload the file
-            blob_client.upload_blob(file, overwrite=True, content_settings=content_settings)
+class StorageBackend(ObjectStore):
+    """Folder and archive deployment shared by all storage backends.
 
-            # Generate SAS token
-            sas_token = generate_blob_sas(
-                account_name=self.account_name,
-                container_name=self.container_name,
-                blob_name=file_name,
-                account_key=self.account_key,
-                permission=BlobSasPermissions(read=True),
-                expiry=datetime.utcnow() + timedelta(hours=1)
+    Files extracted from a folder or archive are stored content-addressed,
+    under ``objects/<sha256>``, and an object is only uploaded if no object
+    with the same digest exists yet. Redeploying a site therefore only
+    transfers the files that changed. The site's files are listed, with their
+    digests, sizes and content types, by a ``Manifest`` stored next to the
+    deployment.
+
+    Compressible files are also stored precompressed, as
+    ``objects/<digest>.gz`` and ``objects/<digest>.br`` (see
+    ``compression``); the manifest records which variants exist.
+
+    Uploads return the stored name, not a URL: stored files are only read
+    through the app (see ``serving``), never linked to directly.
+
+    Subclasses implement ``_upload_file(file, file_name, length=None,
+    content_type=None, content_encoding=None)``, which stores one file-like object under
+    ``file_name`` and returns that name, ``_exists(file_name)``,
+    ``delete(file_name)`` and ``check_health()``. For
+    serving they implement ``stat(file_name)``, returning a ``BlobStat``,
+    and ``stream(file_name, offset=0, length=None)``, yielding the requested
+    bytes in pieces of at most ``block_size``. Both raise ``FileNotFoundError`` for a missing file
+    and ``ValueError`` for any other failure. For cleanups and garbage
+    collection they implement ``list_pages(prefix, marker=None,
+    page_size=DELETE_BATCH_SIZE)``, yielding the files under a prefix, as
+    ``ListedBlob``s in name order, a page at a time with the marker listing
+    continues from (``None`` after the last page), and may override
+    ``delete_batch(names)`` with a bulk delete.
+    """
+
+    MANIFEST_NAME = 'manifest.bin'
+    # Most names deleted by one delete_batch call; the limit of a Blob batch
+    # request
+    DELETE_BATCH_SIZE = 256
+    # Tar members up to this size are buffered in memory while they are
+    # uploaded, larger ones in a temporary file
+    TAR_MEMBER_MEMORY_MAX = 1024 * 1024
+
+    def read(self, file_name):
+        """Returns the whole content of a small stored file."""
+        return b''.join(self.stream(file_name))
+
+    def delete_batch(self, names):
+        """Deletes up to ``DELETE_BATCH_SIZE`` stored files; missing files
+        are ignored."""
+        for name in names:
+            self.delete(name)
+
+    def read_manifest(self, manifest_name):
+        """Returns the ``Manifest`` stored by ``_upload_manifest``."""
+        try:
+            return Manifest.from_bytes(self.read(manifest_name))
+        except ValueError as e:
+            raise ValueError(f"Invalid manifest {manifest_name}: {str(e)}")
+
+    def _upload_object(self, open_file, path):
+        """Stores the file ``open_file()`` opens as a content-addressed object,
+        with its precompressed variants, and returns its manifest ``Entry``.
+        ``path`` is the file's path within the site."""
+        return self._run_steps(self._object_steps(open_file, path))
+
+    def _upload_opened(self, open_file, file_name, size, content_type=None, content_encoding=None):
+        with open_file() as file:
+            return self._upload_file(
+                file, file_name, length=size, content_type=content_type, content_encoding=content_encoding
             )
 
-            # Return URL with SAS token
-            url = f"{blob_client.url}?{sas_token}"
-            return url
-        
-        except ResourceExistsError:
-            raise ValueError(f"File {file_name} already exists")
-        except ServiceRequestError:
-            raise ValueError("Failed to connect to Azure Storage")
-        except Exception as e:
-            raise ValueError(f"Failed to upload file: {str(e)}")
+    @staticmethod
+    def _log_upload(entries, folder_name):
+        logger.info(
+            "Uploaded %d files, %d bytes, to %s",
+            len(entries), sum(entry.size for entry in entries.values()), folder_name,
+        )
+
+    def _upload_manifest(self, entries, folder_name):
+        """Stores the manifest of a deployment and returns its name."""
+        manifest = Manifest.build(entries, time.time()).to_bytes()
+        return self._upload_file(BytesIO(manifest), f"{folder_name}/{self.MANIFEST_NAME}", length=len(manifest))
 
     def _upload_folder(self, folder_path, folder_name):
-        """Uploads a folder (including subdirectories) to Azure Blob Storage."""
-        try:
+        """Uploads a folder (including subdirectories) to storage."""
+
+        def tasks():
             # Walk through the folder
             for root, _, files in os.walk(folder_path):
                 for file_name in files:
                     # Get the relative path of the file
-                    relative_path = os.path.relpath(os.path.join(root, file_name), folder_path)
-                    # Upload file
-                    with open(os.path.join(root, file_name), 'rb') as file:
-                        file_url = self._upload_file(file, f"{folder_name}/{relative_path}")
-                        print(f"File uploaded: {file_url}")
+                    file_path = os.path.join(root, file_name)
+                    path = os.path.relpath(file_path, folder_path).replace(os.sep, '/')
+                    yield path, partial(self._upload_object, partial(open, file_path, 'rb'), path)
+
+        try:
+            entries = UploadEngine().run(tasks())
+            self._log_upload(entries, folder_name)
+            return self._upload_manifest(entries.values(), folder_name)
         except Exception as e:
             raise ValueError(f"Failed to upload folder {folder_name}: {str(e)}")
 
     def _upload_zip(self, zip_file, folder_name):
-        """Unzips and uploads files from a ZIP archive to Azure Blob Storage."""
+        """Unzips and uploads files from a ZIP archive to storage."""
         try:
             with zipfile.ZipFile(zip_file, 'r') as zip_ref:
-                # Iterate over each file in the ZIP archive
-                for zip_file_name in zip_ref.namelist():
-                    # Handle directories in the ZIP by creating a corresponding folder in the container
-                    if zip_file_name.endswith('/'):
-                        continue  # Skip directories
-                    file_content = zip_ref.read(zip_file_name)
-                    file_url = self._upload_file(BytesIO(file_content), f"{folder_name}/{zip_file_name}")
-                    print(f"File uploaded from ZIP: {file_url}")
+                def tasks():
+                    # Iterate over each file in the ZIP archive
+                    for member in zip_ref.infolist():
+                        if member.is_dir():
+                            continue  # Skip directories
+                        # Members are streamed straight out of the archive
+                        # instead of being decompressed into memory first
+                        open_member = partial(zip_ref.open, member)
+                        yield member.filename, partial(self._upload_object, open_member, member.filename)
+
+                # ZipFile serialises reads of the underlying file, so members
+                # can be opened and streamed from several threads at once.
+                # Variants are compressed on the same threads.
+                entries = UploadEngine().run(tasks())
+            self._log_upload(entries, folder_name)
+            return self._upload_manifest(entries.values(), folder_name)
         except zipfile.BadZipFile:
             raise ValueError("Provided file is not a valid ZIP file.")
         except Exception as e:
             raise ValueError(f"Failed to upload ZIP contents: {str(e)}")
 
-    def upload_file(self, file, file_name, is_zip=False):
-        """Uploads a file (or folder/ZIP) to Azure Blob Storage."""
+    def _upload_tar(self, stream, compression, folder_name):
+        """Uploads the files of a tar archive while reading it once, front to
+        back, from ``stream`` (see ``archives``).
+
+        Each member is copied out of the archive and handed to the upload
+        threads, and the next one read while it is uploaded; the upload
+        engine's bounded queue keeps the reader at most a few members ahead.
+        """
+        def upload(member, path):
+            try:
+                return self._upload_object(member.open, path)
+            finally:
+                member.close()
+
         try:
+            with archives.open_tar(stream, compression) as tar:
+                def tasks():
+                    for member in tar:
+                        if not member.isfile():
+                            continue  # Directories, links and devices
+                        path = archives.member_path(member)
+                        buffered = archives.BufferedMember(tar, member, self.TAR_MEMBER_MEMORY_MAX, self.block_size)
+                        yield path, partial(upload, buffered, path)
+
+                entries = UploadEngine().run(tasks())
+            self._log_upload(entries, folder_name)
+            return self._upload_manifest(entries.values(), folder_name)
+        except tarfile.TarError:
+            raise archives.InvalidArchive("Provided file is not a valid tar archive.")
+        except archives.InvalidArchive:
+            raise
+        except Exception as e:
+            raise ValueError(f"Failed to upload tar contents: {str(e)}")
+
+    def upload_file(self, file, file_name, is_zip=False, folder_name=None):
+        """Uploads a file (or folder/ZIP) to storage.
+
+        Everything but the content-addressed objects is stored under
+        ``folder_name``, which defaults to ``file_name`` for folders and
+        archives and to the top level for single files. Returns the stored
+        name of the uploaded file or, for folders and archives, of their
+        manifest. Tar archives are recognised by ``file_name`` and only read
+        forward, so ``file`` may be a stream.
+        """
+        try:
+            tar_compression = archives.tar_compression(file_name)
             if is_zip:
                 # If it's a zip file, unzip and upload
-                self._upload_zip(file, file_name)
+                return self._upload_zip(file, folder_name or file_name)
+            elif tar_compression is not None:
+                return self._upload_tar(file, tar_compression, folder_name or file_name)
             elif os.path.isdir(file_name):
                 # If it's a directory, upload the entire folder
-                self._upload_folder(file_name, file_name)
+                return self._upload_folder(file_name, folder_name or file_name)
             else:
                 # If it's a single file, upload it directly
+                if folder_name:
+                    file_name = f"{folder_name}/{os.path.basename(file_name)}"
                 return self._upload_file(file, file_name)
+        except archives.InvalidArchive:
+            raise
         except Exception as e:
             raise ValueError(f"Failed to upload: {str(e)}")
 
+
+class LocalStorageBackend(StorageBackend):
+    """Stores files under ``MEDIA_ROOT`` on the local filesystem.
+
+    Meant for development, CI, benchmarks and single-node deployments. Files
+    are written to a temporary name next to their destination and renamed
+    into place, so readers never see a partially written file. They are
+    served from ``MEDIA_URL`` by ``views.serve_file``.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.root = os.path.realpath(settings.MEDIA_ROOT)
+        self.check_health()
+
+    def check_health(self):
+        """Raises ``ValueError`` unless ``MEDIA_ROOT`` is a writable directory."""
+        try:
+            os.makedirs(self.root, exist_ok=True)
+        except OSError as e:
+            raise ValueError(f"Failed to initialize local storage: {str(e)}")
+        if not os.access(self.root, os.W_OK):
+            raise ValueError(f"Local storage root {self.root} is not writable")
+
+    def path(self, file_name):
+        """Returns the filesystem path of ``file_name``, refusing names that
+        would resolve outside the storage root."""
+        path = os.path.realpath(os.path.join(self.root, file_name))
+        if os.path.commonpath([self.root, path]) != self.root or path == self.root:
+            raise ValueError(f"Invalid file name {file_name}")
+        return path
+
+    def open(self, file_name):
+        return open(self.path(file_name), 'rb')
+
+    def _exists(self, file_name):
+        return os.path.exists(self.path(file_name))
+
+    def delete(self, file_name):
+        """Deletes a file, and the directories it leaves empty."""
+        path = self.path(file_name)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        directory = os.path.dirname(path)
+        while directory != self.root:
+            try:
+                os.rmdir(directory)
+            except OSError:
+                break
+            directory = os.path.dirname(directory)
+
+    def stat(self, file_name):
+        result = os.stat(self.path(file_name))
+        if not stat_module.S_ISREG(result.st_mode):
+            raise FileNotFoundError(file_name)
+        last_modified = datetime.fromtimestamp(result.st_mtime, UTC)
+        etag = f'"{result.st_mtime_ns:x}-{result.st_size:x}"'
+        return BlobStat(result.st_size, last_modified, None, etag)
+
+    def stream(self, file_name, offset=0, length=None):
+        file = self.open(file_name)
+
+        def chunks():
+            with file:
+                yield from iter_file(file, offset, length, self.block_size)
+
+        # Opened eagerly so a missing file raises here
+        return chunks()
+
+    def list_pages(self, prefix, marker=None, page_size=StorageBackend.DELETE_BATCH_SIZE):
+        """Yields ``(blobs, marker)`` pages of the files under ``prefix``, in
+        name order after ``marker``; a page's marker is its last name."""
+        top = os.path.join(self.root, prefix)
+        # The prefix may end within a directory name, as blob prefixes can
+        directory = top if prefix.endswith('/') else os.path.dirname(top)
+        names = []
+        for dirpath, dirnames, filenames in os.walk(directory):
+            relative = os.path.relpath(dirpath, self.root)
+            for filename in filenames:
+                name = filename if relative == '.' else f"{relative}/{filename}".replace(os.sep, '/')
+                if name.startswith(prefix) and (marker is None or name > marker):
+                    names.append(name)
+        names.sort()
+        for start in range(0, len(names), page_size):
+            page = names[start:start + page_size]
+            blobs = []
+            for name in page:
+                try:
+                    result = os.stat(os.path.join(self.root, name))
+                except FileNotFoundError:
+                    continue
+                blobs.append(ListedBlob(name, result.st_size, datetime.fromtimestamp(result.st_mtime, UTC)))
+            yield blobs, (page[-1] if start + page_size < len(names) else None)
+
+    def _upload_file(self, file, file_name, length=None, content_type=None, content_encoding=None):
+        """Writes an individual file into the storage root atomically."""
+        try:
+            path = self.path(file_name)
+            directory = os.path.dirname(path)
+            os.makedirs(directory, exist_ok=True)
+            temp = tempfile.NamedTemporaryFile(dir=directory, prefix='.upload-', delete=False)
+            try:
+                with temp:
+                    shutil.copyfileobj(file, temp, self.block_size)
+                os.replace(temp.name, path)
+            except BaseException:
+                os.unlink(temp.name)
+                raise
+            return file_name
+        except Exception as e:
+            raise ValueError(f"Failed to upload file: {str(e)}")
+
+
+class AssetCache:
+    """Two-tier read cache for stored files, in front of a storage backend.
+
+    Entries are keyed by blob name and ETag, so a file that is replaced in
+    storage is simply a different entry; for content-addressed objects the
+    digest is the ETag and entries never go stale. The first tier keeps
+    files of up to ``memory_entry_max`` bytes in memory, least recently used
+    first, within ``memory_bytes``. The second keeps files of up to
+    ``disk_entry_max`` bytes under ``directory`` within ``disk_bytes``. A
+    budget of zero disables its tier.
+
+    The directory may be shared by the workers of a host. Each process
+    enforces the disk budget over the entries it has seen, and a file another
+    process evicted is treated as a miss. Concurrent misses for the same entry
+    are coalesced into one fetch, whose result every waiter shares.
+    """
+
+    def __init__(self, memory_bytes, memory_entry_max, directory, disk_bytes, disk_entry_max):
+        self.memory_bytes = memory_bytes
+        self.memory_entry_max = memory_entry_max if memory_bytes > 0 else 0
+        self.directory = directory
+        self.disk_bytes = disk_bytes if directory else 0
+        self.disk_entry_max = disk_entry_max if self.disk_bytes > 0 else 0
+        # (name, etag) -> bytes
+        self._memory = OrderedDict()
+        self._memory_used = 0
+        # file name -> (blob name or None if found on disk at startup, size)
+        self._disk = OrderedDict()
+        self._disk_used = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = self.disk_hits = self.misses = self.coalesced = self.evictions = 0
+        if self.disk_bytes:
+            self._scan()
+
+    def _scan(self):
+        """Adopts the entries already on disk, oldest first."""
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.startswith('.'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, file_name, size in sorted(entries):
+            self._disk[file_name] = (None, size)
+            self._disk_used += size
+        metrics.ASSET_CACHE_BYTES.inc(self._disk_used, tier='disk')
+        self._evict_disk()
+
+    def _disk_name(self, key):
+        name, etag = key
+        return hashlib.sha256(f"{name}\0{etag}".encode()).hexdigest()
+
+    def cacheable(self, size):
+        return size <= self.memory_entry_max or size <= min(self.disk_entry_max, self.disk_bytes)
+
+    def open(self, name, etag, size, fetch):
+        """Returns a seekable binary file with the content of ``name`` at
+        version ``etag``, or ``None`` when ``size`` is too large to cache.
+
+        ``fetch()`` returns the content as an iterable of byte strings and is
+        only called on a miss.
+        """
+        if not self.cacheable(size):
+            return None
+        key = (name, etag)
+        while True:
+            with self._lock:
+                data = self._memory.get(key)
+                if data is not None:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    metrics.ASSET_CACHE_LOOKUPS.inc(result='hit')
+                    return BytesIO(data)
+                file_name = self._disk_name(key)
+                if file_name in self._disk:
+                    self._disk.move_to_end(file_name)
+                    on_disk = True
+                else:
+                    on_disk = False
+                    future = self._inflight.get(key)
+                    leader = future is None
+                    if leader:
+                        future = self._inflight[key] = Future()
+                        self.misses += 1
+                        metrics.ASSET_CACHE_LOOKUPS.inc(result='miss')
+                    else:
+                        self.coalesced += 1
+                        metrics.ASSET_CACHE_LOOKUPS.inc(result='coalesced')
+            if on_disk:
+                file = self._open_disk(file_name, key, size)
+                if file is not None:
+                    return file
+                continue
+            if leader:
+                try:
+                    future.set_result(self._fill(key, file_name, size, fetch))
+                except BaseException as e:
+                    future.set_exception(e)
+                    raise
+                finally:
+                    with self._lock:
+                        del self._inflight[key]
+            return self._reopen(future.result(), key, file_name)
+
+    def _open_disk(self, file_name, key, size):
+        try:
+            file = open(os.path.join(self.directory, file_name), 'rb')
+        except FileNotFoundError:
+            # Evicted by another process
+            with self._lock:
+                self._forget_disk(file_name)
+            return None
+        with self._lock:
+            self.disk_hits += 1
+            metrics.ASSET_CACHE_LOOKUPS.inc(result='disk_hit')
+            self._disk[file_name] = (key[0], size)
+        if size <= self.memory_entry_max:
+            data = file.read()
+            file.close()
+            self._store_memory(key, data)
+            return BytesIO(data)
+        return file
+
+    def _reopen(self, filled, key, file_name):
+        """Gives a waiter on a fill its own file object."""
+        if isinstance(filled, bytes):
+            return BytesIO(filled)
+        try:
+            return open(os.path.join(self.directory, file_name), 'rb')
+        except FileNotFoundError:
+            # Already evicted again; the caller reads from storage
+            return None
+
+    def _fill(self, key, file_name, size, fetch):
+        """Fetches an entry into the cache; returns its content if it was
+        small enough to keep in memory and ``None`` if it is on disk only."""
+        if size <= self.memory_entry_max:
+            data = b''.join(fetch())
+            self._store_memory(key, data)
+            if self.disk_entry_max:
+                self._store_disk(key, file_name, [data], len(data))
+            return data
+        self._store_disk(key, file_name, fetch(), size)
+        return None
+
+    def _store_memory(self, key, data):
+        with self._lock:
+            if key in self._memory:
+                return
+            self._memory[key] = data
+            self._memory_used += len(data)
+            metrics.ASSET_CACHE_BYTES.inc(len(data), tier='memory')
+            while self._memory_used > self.memory_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_used -= len(evicted)
+                self.evictions += 1
+                metrics.ASSET_CACHE_BYTES.dec(len(evicted), tier='memory')
+                metrics.ASSET_CACHE_EVICTIONS.inc(tier='memory')
+
+    def _store_disk(self, key, file_name, chunks, size):
+        temp = tempfile.NamedTemporaryFile(dir=self.directory, prefix='.fill-', delete=False)
+        try:
+            with temp:
+                for chunk in chunks:
+                    temp.write(chunk)
+            os.replace(temp.name, os.path.join(self.directory, file_name))
+        except BaseException:
+            os.unlink(temp.name)
+            raise
+        with self._lock:
+            self._forget_disk(file_name)
+            self._disk[file_name] = (key[0], size)
+            self._disk_used += size
+            metrics.ASSET_CACHE_BYTES.inc(size, tier='disk')
+            evicted = self._evict_disk()
+        for name in evicted:
+            try:
+                os.unlink(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+    def _evict_disk(self):
+        evicted = []
+        while self._disk_used > self.disk_bytes:
+            file_name, (_, size) = self._disk.popitem(last=False)
+            self._disk_used -= size
+            self.evictions += 1
+            metrics.ASSET_CACHE_BYTES.dec(size, tier='disk')
+            metrics.ASSET_CACHE_EVICTIONS.inc(tier='disk')
+            evicted.append(file_name)
+        return evicted
+
+    def _forget_disk(self, file_name):
+        entry = self._disk.pop(file_name, None)
+        if entry is not None:
+            self._disk_used -= entry[1]
+            metrics.ASSET_CACHE_BYTES.dec(entry[1], tier='disk')
+
+    def invalidate(self, prefix):
+        """Drops the entries of every blob whose name starts with ``prefix``."""
+        with self._lock:
+            for key in [key for key in self._memory if key[0].startswith(prefix)]:
+                size = len(self._memory.pop(key))
+                self._memory_used -= size
+                metrics.ASSET_CACHE_BYTES.dec(size, tier='memory')
+            stale = [file_name for file_name, (name, _) in self._disk.items() if name and name.startswith(prefix)]
+            for file_name in stale:
+                self._forget_disk(file_name)
+        for file_name in stale:
+            try:
+                os.unlink(os.path.join(self.directory, file_name))
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'evictions': self.evictions,
+                'memory_bytes': self._memory_used,
+                'disk_bytes': self._disk_used,
+            }
+
+
 class StorageService:
+    """Hands out the storage backend of the current process.
+
+    The backend is created on first use and then shared by every request the
+    worker serves, so its HTTP connections stay warm and the container is
+    validated once instead of on every upload. A background thread re-checks
+    the container every ``STORAGE_HEALTH_CHECK_INTERVAL`` seconds and drops
+    the backend when the check fails, so the next request builds a new one.
+    """
+
+    _backend = None
+    _asset_cache = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_storage_backend(cls):
+        backend = cls._backend
+        if backend is None:
+            with cls._lock:
+                if cls._backend is None:
+                    cls._backend = cls._create_backend()
+                    cls._start_health_check(cls._backend)
+                backend = cls._backend
+        return backend
+
+    @classmethod
+    def get_asset_cache(cls):
+        """Returns the ``AssetCache`` of the current process."""
+        cache = cls._asset_cache
+        if cache is None:
+            with cls._lock:
+                if cls._asset_cache is None:
+                    cls._asset_cache = AssetCache(
+                        settings.ASSET_CACHE_MEMORY_BYTES,
+                        settings.ASSET_CACHE_MEMORY_ENTRY_MAX,
+                        settings.ASSET_CACHE_DIR,
+                        settings.ASSET_CACHE_DISK_BYTES,
+                        settings.ASSET_CACHE_DISK_ENTRY_MAX,
+                    )
+                cache = cls._asset_cache
+        return cache
+
     @staticmethod
-    def get_storage_backend():
+    def _create_backend():
         try:
             if settings.STORAGE_BACKEND == 'azure':
+                # Imports the Blob SDK, so only once the backend is needed
+                from .azure_storage import AzureStorageBackend
                 return AzureStorageBackend()
+            elif settings.STORAGE_BACKEND == 'local':
+                return LocalStorageBackend()
             else:
                 raise NotImplementedError("Unsupported storage backend")
         except Exception as e:
-            raise ValueError(f"Failed to initialize storage service: {str(e)}")
\ No newline at end of file
+            raise ValueError(f"Failed to initialize storage service: {str(e)}")
+
+    @classmethod
+    def reset(cls):
+        """Forgets the cached backend and asset cache.
+
+        Called in every forked child: the parent's client shares its sockets
+        with the child, and its lock may have been held by a parent thread at
+        the time of the fork.
+        """
+        cls._backend = None
+        cls._asset_cache = None
+        cls._lock = threading.Lock()
+        for tier in ('memory', 'disk'):
+            metrics.ASSET_CACHE_BYTES.set(0, tier=tier)
+
+    @classmethod
+    def _start_health_check(cls, backend):
+        if settings.STORAGE_HEALTH_CHECK_INTERVAL <= 0:
+            return
+        thread = threading.Thread(
+            target=cls._run_health_check,
+            args=(backend, settings.STORAGE_HEALTH_CHECK_INTERVAL),
+            name="storage-health-check",
+            daemon=True,
+        )
+        thread.start()
+
+    @classmethod
+    def _run_health_check(cls, backend, interval):
+        # Stops once the backend it watches has been replaced or dropped
+        while cls._backend is backend:
+            time.sleep(interval)
+            if not cls._check_health(backend):
+                return
+
+    @classmethod
+    def _check_health(cls, backend):
+        """Checks ``backend`` and drops it if it is unhealthy."""
+        try:
+            backend.check_health()
+            return True
+        except Exception as e:
+            logger.error("Storage health check failed: %s", e)
+            with cls._lock:
+                if cls._backend is backend:
+                    cls._backend = None
+            return False
+
+
+os.register_at_fork(after_in_child=StorageService.reset)
@@ -0,0 +1,203 @@
+"""Resumable chunked uploads.
+
+A client creates an ``UploadSession`` for an archive of known size, PUTs the
+archive in chunks at explicit offsets and finally completes the session,
+which hands the archive to a deployment job much like a regular upload.
+
+Chunks are streamed from the request straight into storage, each as a file
+of its own under ``uploads/<session id>/`` named by its offset, so every
+instance sees every chunk whichever instance received it, and nothing
+depends on the client's requests reaching the same one. A failed chunk can
+be retried on its own, and a dropped connection resumes from the session's
+``offset``. The job worker that deploys the upload assembles the chunks
+into a staged archive (``assemble``) and then deletes them.
+"""
+import logging
+import os
+import tempfile
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .cleanup import delete_prefix
+from .models import DeploymentJob, UploadSession
+from .storage import StorageService
+
+logger = logging.getLogger(__name__)
+
+# Where the chunks of sessions are stored, each session under its id
+UPLOADS_PREFIX = 'uploads/'
+
+class ChunkError(ValueError):
+    """A chunk that cannot be accepted at its offset. ``status`` is the HTTP
+    status to answer with."""
+
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+
+def chunk_prefix(session_id):
+    """The storage prefix the chunks of a session are stored under."""
+    return f"{UPLOADS_PREFIX}{session_id}/"
+
+
+def _chunk_offset(name):
+    return int(name.rsplit('/', 1)[1].split('-', 1)[0])
+
+
+class _ChunkBody:
+    """Reads at most ``length`` bytes of a request body, counting them."""
+
+    def __init__(self, stream, length):
+        self._stream = stream
+        self._remaining = length
+        self.received = 0
+
+    def read(self, size=-1):
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._stream.read(min(size, settings.AZURE_UPLOAD_BLOCK_SIZE)) if size else b''
+        self._remaining -= len(data)
+        self.received += len(data)
+        return data
+
+
+def _get_session(session_id):
+    try:
+        return UploadSession.objects.get(pk=session_id)
+    except UploadSession.DoesNotExist:
+        raise ChunkError("Upload not found, it may have expired", 404)
+
+
+def create_session(file_name, size):
+    if size < 0 or size > settings.UPLOAD_MAX_SIZE:
+        raise ChunkError(f"Upload size must be between 0 and {settings.UPLOAD_MAX_SIZE} bytes", 413)
+    return UploadSession.objects.create(file_name=os.path.basename(file_name), size=size)
+
+
+def write_chunk(session_id, offset, stream, length):
+    """Stores ``length`` bytes from ``stream`` as the chunk of the session at
+    ``offset`` and returns the updated session.
+
+    A chunk may overlap bytes that were already received, so retrying a
+    chunk whose response got lost is harmless, but it may not leave a gap.
+
+    The body is read with no transaction open, however slowly the client
+    sends it; ``offset`` is then advanced with a conditional update, so
+    concurrent chunks of a session never move it backwards.
+    """
+    if length > settings.UPLOAD_MAX_CHUNK_SIZE:
+        raise ChunkError(f"Chunks may be at most {settings.UPLOAD_MAX_CHUNK_SIZE} bytes", 413)
+    session = _get_session(session_id)
+    if session.status != UploadSession.OPEN:
+        raise ChunkError("Upload is already complete", 409)
+    if offset > session.offset:
+        raise ChunkError(f"Expected a chunk at offset {session.offset} or before", 409)
+    if offset + length > session.size:
+        raise ChunkError("Chunk extends past the declared upload size", 416)
+
+    # Named by offset, so chunks list in order, and unique, so a retried
+    # chunk never replaces one whose bytes were already counted
+    body = _ChunkBody(stream, length)
+    name = f"{chunk_prefix(session.id)}{offset:020d}-{uuid.uuid4().hex}"
+    try:
+        StorageService.get_storage_backend().upload_file(body, name)
+    except ValueError as e:
+        logger.error("Failed to store chunk %s: %s", name, e)
+        raise ChunkError("Failed to store the chunk", 500)
+
+    # Only the bytes that actually arrived count, a truncated body leaves the
+    # session resumable from where it stopped. The offset only grows, so the
+    # chunk stays contiguous with it while another chunk moves it on.
+    received = offset + body.received
+    while session.offset < received:
+        updated = UploadSession.objects.filter(
+            pk=session.pk, status=UploadSession.OPEN, offset=session.offset
+        ).update(offset=received, updated_at=timezone.now())
+        if updated:
+            session.offset = received
+            break
+        try:
+            session.refresh_from_db()
+        except UploadSession.DoesNotExist:
+            raise ChunkError("Upload not found, it may have expired", 404)
+        if session.status != UploadSession.OPEN:
+            raise ChunkError("Upload is already complete", 409)
+    if body.received < length:
+        raise ChunkError("Request body ended before the chunk was complete", 400)
+    return session
+
+
+def complete_session(session_id):
+    """Closes a fully received session and returns it; its chunks are left
+    for the deployment job to assemble."""
+    with transaction.atomic():
+        try:
+            session = UploadSession.objects.select_for_update().get(pk=session_id)
+        except UploadSession.DoesNotExist:
+            raise ChunkError("Upload not found, it may have expired", 404)
+        if session.status != UploadSession.OPEN:
+            raise ChunkError("Upload is already complete", 409)
+        if session.offset != session.size:
+            raise ChunkError(f"Upload is incomplete, received {session.offset} of {session.size} bytes", 409)
+        session.status = UploadSession.COMPLETE
+        session.save(update_fields=['status', 'updated_at'])
+    return session
+
+
+def assemble(session):
+    """Returns the session's archive, assembled from its stored chunks into
+    an anonymous file in ``STAGING_ROOT`` and positioned at its start.
+
+    Chunks are read in offset order, each from where the archive assembled
+    so far ends, so overlapping retries are only copied once.
+    """
+    storage_backend = StorageService.get_storage_backend()
+    os.makedirs(settings.STAGING_ROOT, exist_ok=True)
+    archive = tempfile.TemporaryFile(dir=settings.STAGING_ROOT)
+    try:
+        end = 0
+        for blobs, _ in storage_backend.list_pages(chunk_prefix(session.id)):
+            for blob in blobs:
+                offset = _chunk_offset(blob.name)
+                if offset > end:
+                    break
+                if offset + blob.size <= end:
+                    continue
+                for data in storage_backend.stream(blob.name, end - offset):
+                    archive.write(data)
+                end = offset + blob.size
+        if end != session.size:
+            raise ValueError(f"Upload is missing bytes from {end} of {session.size}")
+        archive.seek(0)
+    except BaseException:
+        archive.close()
+        raise
+    return archive
+
+
+def discard_session(session_id):
+    """Deletes a session and its stored chunks."""
+    delete_prefix(StorageService.get_storage_backend(), chunk_prefix(session_id))
+    UploadSession.objects.filter(pk=session_id).delete()
+
+
+def expire_sessions():
+    """Deletes sessions, and their chunks, that have not received a chunk
+    for ``UPLOAD_SESSION_TTL`` seconds, unless a deployment job is still to
+    assemble them."""
+    cutoff = timezone.now() - timedelta(seconds=settings.UPLOAD_SESSION_TTL)
+    pending = DeploymentJob.objects.filter(
+        status__in=[DeploymentJob.QUEUED, DeploymentJob.RUNNING], upload__isnull=False
+    ).values('upload')
+    expired = 0
+    for session_id in UploadSession.objects.filter(updated_at__lt=cutoff).exclude(pk__in=pending).values_list(
+        'pk', flat=True
+    ):
+        discard_session(session_id)
+        expired += 1
+    return expired
@@ -1,23 +1,21 @@
-from django.urls import path, include
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from django.conf.urls.static import static
-from django.urls import path
-from rest_framework.routers import DefaultRouter
 from django.http import JsonResponse
+from django.urls import include, path
 from django.views.decorators.csrf import csrf_exempt
+from rest_framework.routers import DefaultRouter
+
 from . import views
 
 router = DefaultRouter()
 
 @csrf_exempt
-def handle_request(request):
-    print("handle projects request")
-    print("method "+ request.method)
+async def handle_request(request):
     if request.method == 'GET':
         viewset = views.ProjectViewSet.as_view({'get': 'list'})
-        return viewset(request)
+        return await sync_to_async(viewset)(request)
     elif request.method == 'POST':
-        return views.upload_project(request)
+        return await views.upload_project(request)
     return JsonResponse({'error': 'Method not allowed'}, status=405)
 
 
@@ -26,6 +24,17 @@ project_urlpatterns = [
     path('', handle_request, name='projects'),
     path('<int:project_id>/', views.delete_project, name='delete_project'),
     path('<int:project_id>/domain/', views.assign_domain, name='assign_domain'),
+    path('<int:project_id>/deployments/', views.list_deployments, name='list_deployments'),
+    path(
+        '<int:project_id>/deployments/<uuid:deployment_id>/activate/',
+        views.activate_deployment,
+        name='activate_deployment',
+    ),
+    path('jobs/<int:job_id>/', views.job_status, name='job_status'),
+    path('stream/', views.stream_project, name='stream_project'),
+    path('uploads/', views.create_upload_session, name='create_upload_session'),
+    path('uploads/<uuid:upload_id>/', views.upload_session, name='upload_session'),
+    path('uploads/<uuid:upload_id>/complete/', views.complete_upload_session, name='complete_upload_session'),
 ]
 
 # Apply the prefix to all routes
@@ -34,5 +43,7 @@ urlpatterns = [
     path('api/', include(router.urls)),
 ]
 
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+if settings.STORAGE_BACKEND == 'local':
+    urlpatterns += [
+        path(f"{settings.MEDIA_URL.lstrip('/')}<path:path>", views.serve_file, name='serve_file'),
+    ]
@@ -1,24 +1,83 @@
+import json
+import logging
 import mimetypes
+import os
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
 from django.forms import ValidationError
+from django.http import FileResponse, Http404, JsonResponse
+from django.shortcuts import aget_object_or_404, get_object_or_404
+from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt
 from rest_framework.viewsets import ModelViewSet
 
-from . import models
+from . import archives, domains, models, uploads
+from .cleanup import enqueue_cleanup, project_prefix
+from .deployments import activate
+from .jobs import deploy_stream, enqueue_deployment, stage_upload
+from .models import Deployment, DeploymentJob, Project, UploadSession
+from .pagination import KeysetPagination
 from .serializers import ProjectSerializer
-from django.views.decorators.csrf import csrf_exempt
-from django.http import JsonResponse
-from django.shortcuts import get_object_or_404
-from .models import Project
 from .storage import StorageService
-from django.conf import settings
+
+logger = logging.getLogger(__name__)
 
 class ProjectViewSet(ModelViewSet):
     queryset = models.Project.objects.all()
     serializer_class = ProjectSerializer
+    pagination_class = KeysetPagination
+
+def _discard_archive(archive_path, upload):
+    if upload is not None:
+        uploads.discard_session(upload.id)
+    else:
+        os.remove(archive_path)
+
+def _queue_deployment(archive_path, file_name, name, description, domain, upload=None):
+    """Creates a project for a staged archive, or for a completed upload
+    session, and queues its deployment."""
+    mime_type, _ = mimetypes.guess_type(file_name)
+    is_zip = mime_type in ('application/zip', 'application/x-zip-compressed')
+
+    # Create project instance and queue its deployment
+    try:
+        with transaction.atomic():
+            project = Project.objects.create(name=name, description=description, file='', domain=domain)
+            job = enqueue_deployment(project, archive_path, file_name, is_zip, upload=upload)
+        logger.info("Created project %s with deployment job %s (%s)", project.id, job.id, mime_type)
+
+    except ValidationError as ve:
+        logger.warning("Project creation failed: %s", ve)
+        _discard_archive(archive_path, upload)
+        return JsonResponse({'status': 'error', 'message': 'Invalid project data'}, status=400)
+    except IntegrityError:
+        _discard_archive(archive_path, upload)
+        return JsonResponse({'status': 'error', 'message': 'Domain is already assigned'}, status=409)
+    except Exception as e:
+        logger.exception("Unexpected error during project creation: %s", e)
+        _discard_archive(archive_path, upload)
+        return JsonResponse({'status': 'error', 'message': 'Failed to create project'}, status=500)
+
+    # Accepted: the deployment runs in the background
+    return JsonResponse({
+        'status': 'accepted',
+        'project_id': project.id,
+        'job_id': job.id,
+        'status_url': reverse('projects:job_status', args=[job.id]),
+    }, status=202)
+
+# upload_project, delete_project and assign_domain are async: under the
+# ASGI profile (gunicorn.asgi.conf.py) they wait for the database and the
+# staging disk without holding a thread, so one worker serves many of them.
 
 @csrf_exempt
-def upload_project(request):
+async def upload_project(request):
     if request.method == 'POST':
         try:
+            # Parsing a multipart body writes the file to disk
+            await sync_to_async(lambda: request.FILES)()
             # Extract POST parameters
             name = request.POST.get('name')
             domain = request.POST.get('domain')
@@ -26,67 +85,261 @@ def upload_project(request):
 
             name="Project"
             description ="description"
-            domain="domain"
             # Validate required fields
             if not name:
                 return JsonResponse({'status': 'error', 'message': 'Project name is required'}, status=400)
-            if not domain:
-                return JsonResponse({'status': 'error', 'message': 'Project domain is required'}, status=400)
+            # The domain is optional here, it can be assigned later
+            if domain:
+                try:
+                    domain = domains.assignable_domain(domain)
+                except ValueError as e:
+                    return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+            else:
+                domain = None
             if not uploaded_file:
                 return JsonResponse({'status': 'error', 'message': 'File is required'}, status=400)
 
-            # Get the storage backend and attempt file upload
-            storage_backend = StorageService.get_storage_backend()
+            # Stage the upload; a deployment job extracts and uploads it
+            # outside the request
             try:
-                ext = mimetypes.guess_extension(uploaded_file.name)
-                print(f"ext: {ext}")
-                is_zip = ext == ".zip"
-
-                file_url = storage_backend.upload_file(uploaded_file, uploaded_file.name, is_zip)
-                print(f"file_url: {file_url}")
+                archive_path = await sync_to_async(stage_upload)(uploaded_file)
+                logger.info("Staged upload %s at %s", uploaded_file.name, archive_path)
 
             except Exception as e:
-                print(f"File upload failed: {e}")
+                logger.error("File upload failed: %s", e)
                 return JsonResponse({'status': 'error', 'message': 'Failed to upload file'}, status=500)
 
-            # Create project instance
-            try:
-                project = Project.objects.create(name=name, description=description, file=file_url, domain=domain)
-                print("project created")
-                print(project)
-                
-            except ValidationError as ve:
-                print(f"Project creation failed: {ve}")
-                return JsonResponse({'status': 'error', 'message': 'Invalid project data'}, status=400)
-            except Exception as e:
-                print(f"Unexpected error during project creation: {e}")
-                return JsonResponse({'status': 'error', 'message': 'Failed to create project'}, status=500)
-
-            # Success response
-            return JsonResponse({'status': 'success', 'project_id': project.id, 'file_url': file_url})
+            return await sync_to_async(_queue_deployment)(archive_path, uploaded_file.name, name, description, domain)
 
         except Exception as e:
             # Catch unexpected exceptions
-            print(f"Unexpected error in upload_project: {e}")
+            logger.exception("Unexpected error in upload_project: %s", e)
             return JsonResponse({'status': 'error', 'message': 'An unexpected error occurred'}, status=500)
 
     # Handle non-POST requests
     return JsonResponse({'status': 'error', 'message': 'Invalid request method'}, status=405)
 
 @csrf_exempt
-def delete_project(request, project_id):
-    if request.method == 'DELETE':
+def stream_project(request):
+    """Creates a project from a tar archive sent as the raw request body and
+    deploys it while the body is still arriving.
+
+    ``file_name`` (a ``.tar``, ``.tar.gz`` or ``.tar.zst`` name) and the
+    optional ``domain`` are query parameters. Under WSGI the body is read
+    from the connection as the archive is decoded, so files are uploaded to
+    storage while later ones are still being received; under ASGI Django
+    receives the whole body first.
+    """
+    if request.method == 'POST':
+        file_name = request.GET.get('file_name', '')
+        if archives.tar_compression(file_name) is None:
+            return JsonResponse(
+                {'status': 'error', 'message': 'A .tar, .tar.gz or .tar.zst file name is required'}, status=400
+            )
+        try:
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        if length <= 0:
+            return JsonResponse({'status': 'error', 'message': 'Content-Length is required'}, status=411)
+        if length > settings.UPLOAD_MAX_SIZE:
+            return JsonResponse({'status': 'error', 'message': 'Upload is too large'}, status=413)
+        domain = request.GET.get('domain')
+        if domain:
+            try:
+                domain = domains.assignable_domain(domain)
+            except ValueError as e:
+                return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+        else:
+            domain = None
+
+        try:
+            project = Project.objects.create(name="Project", description="description", file='', domain=domain)
+        except IntegrityError:
+            return JsonResponse({'status': 'error', 'message': 'Domain is already assigned'}, status=409)
+
+        job, error = deploy_stream(project, request, file_name)
+        if error is not None:
+            # Nothing was deployed: the project and its job go, and the
+            # domain is free for another attempt
+            _delete_project(project)
+            domains.invalidate()
+            # An archive that cannot be decoded is the sender's; storage
+            # failures are ours
+            status = 400 if isinstance(error, archives.InvalidArchive) else 500
+            return JsonResponse({'status': 'error', 'message': job.error}, status=status)
+        return JsonResponse({
+            'status': 'deployed',
+            'project_id': project.id,
+            'job_id': job.id,
+            'status_url': reverse('projects:job_status', args=[job.id]),
+        }, status=201)
+    return JsonResponse({'status': 'error', 'message': 'Invalid request method'}, status=405)
+
+def _upload_session_response(session, status=200):
+    return JsonResponse({
+        'upload_id': session.id,
+        'file_name': session.file_name,
+        'size': session.size,
+        'offset': session.offset,
+        'chunk_size': settings.UPLOAD_CHUNK_SIZE,
+        'upload_url': reverse('projects:upload_session', args=[session.id]),
+    }, status=status)
+
+@csrf_exempt
+def create_upload_session(request):
+    """Starts a resumable upload. Expects ``file_name`` and ``size`` in bytes."""
+    if request.method == 'POST':
+        file_name = request.POST.get('file_name')
+        try:
+            size = int(request.POST.get('size', ''))
+        except ValueError:
+            return JsonResponse({'status': 'error', 'message': 'Upload size is required'}, status=400)
+        if not file_name:
+            return JsonResponse({'status': 'error', 'message': 'File name is required'}, status=400)
+        try:
+            session = uploads.create_session(file_name, size)
+        except uploads.ChunkError as e:
+            return JsonResponse({'status': 'error', 'message': str(e)}, status=e.status)
+        return _upload_session_response(session, status=201)
+    return JsonResponse({'status': 'error', 'message': 'Invalid request method'}, status=405)
+
+@csrf_exempt
+def upload_session(request, upload_id):
+    """GET reports how much of the upload has arrived, PUT writes the
+    request body at the ``offset`` query parameter."""
+    session = get_object_or_404(UploadSession, id=upload_id)
+    if request.method == 'GET':
+        return _upload_session_response(session)
+    if request.method == 'PUT':
+        try:
+            offset = int(request.GET.get('offset', ''))
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            return JsonResponse({'status': 'error', 'message': 'Chunk offset is required'}, status=400)
+        try:
+            session = uploads.write_chunk(session.id, offset, request, length)
+        except uploads.ChunkError as e:
+            try:
+                session.refresh_from_db()
+            except UploadSession.DoesNotExist:
+                return JsonResponse({'status': 'error', 'message': str(e)}, status=e.status)
+            return JsonResponse({'status': 'error', 'message': str(e), 'offset': session.offset}, status=e.status)
+        return _upload_session_response(session)
+    return JsonResponse({'status': 'error', 'message': 'Invalid request method'}, status=405)
+
+@csrf_exempt
+def complete_upload_session(request, upload_id):
+    """Hands a fully received upload to a deployment job."""
+    if request.method == 'POST':
+        try:
+            session = uploads.complete_session(upload_id)
+        except uploads.ChunkError as e:
+            return JsonResponse({'status': 'error', 'message': str(e)}, status=e.status)
+        return _queue_deployment('', session.file_name, "Project", "description", None, upload=session)
+    return JsonResponse({'status': 'error', 'message': 'Invalid request method'}, status=405)
+
+def job_status(request, job_id):
+    if request.method == 'GET':
+        job = get_object_or_404(DeploymentJob, id=job_id)
+        return JsonResponse({
+            'id': job.id,
+            'project_id': job.project_id,
+            'status': job.status,
+            'error': job.error,
+            'created_at': job.created_at,
+            'started_at': job.started_at,
+            'finished_at': job.finished_at,
+        })
+    return JsonResponse({'status': 'error', 'message': 'Invalid request method'}, status=405)
+
+def _deployment_response(deployment, active_id):
+    return {
+        'id': deployment.id,
+        'job_id': deployment.job_id,
+        'active': deployment.id == active_id,
+        'file_count': deployment.file_count,
+        'total_size': deployment.total_size,
+        'created_at': deployment.created_at,
+    }
+
+def list_deployments(request, project_id):
+    """Lists a project's deployments, newest first."""
+    if request.method == 'GET':
         project = get_object_or_404(Project, id=project_id)
+        deployments = project.deployments.order_by('-created_at')
+        active_id = project.active_deployment_id
+        return JsonResponse({
+            'deployments': [_deployment_response(deployment, active_id) for deployment in deployments],
+        })
+    return JsonResponse({'status': 'error', 'message': 'Invalid request method'}, status=405)
+
+@csrf_exempt
+def activate_deployment(request, project_id, deployment_id):
+    """Serves another of the project's deployments, e.g. to roll back."""
+    if request.method == 'POST':
+        deployment = get_object_or_404(Deployment, id=deployment_id, project_id=project_id)
+        if not activate(project_id, deployment):
+            raise Http404("Deployment not found")
+        return JsonResponse({'status': 'success', 'message': 'Deployment activated', 'deployment_id': deployment.id})
+    return JsonResponse({'status': 'error', 'message': 'Invalid request method'}, status=405)
+
+def _delete_project(project):
+    """Deletes a project's rows and queues the deletion of what it stored,
+    which the job worker carries out. Its cached files are dropped here too,
+    off the event loop, as that reads the cache's disk."""
+    prefix = project_prefix(project.id)
+    with transaction.atomic():
         project.delete()
+        enqueue_cleanup(prefix)
+    StorageService.get_asset_cache().invalidate(prefix)
+
+@csrf_exempt
+async def delete_project(request, project_id):
+    if request.method == 'DELETE':
+        project = await aget_object_or_404(Project, id=project_id)
+        await sync_to_async(_delete_project)(project)
+        domains.invalidate()
         return JsonResponse({'status': 'success', 'message': 'Project deleted'})
     return JsonResponse({'status': 'error', 'message': 'Invalid request method'})
 
+def _save_domain(project):
+    with transaction.atomic():
+        project.save(update_fields=['domain'])
+
 @csrf_exempt
-def assign_domain(request, project_id):
+async def assign_domain(request, project_id):
     if request.method == 'POST':
-        project = get_object_or_404(Project, id=project_id)
-        domain = request.POST.get('domain')
-        project.domain = domain
-        project.save()
-        return JsonResponse({'status': 'success', 'message': 'Domain assigned'})
+        project = await aget_object_or_404(Project, id=project_id)
+        if request.content_type == 'application/json':
+            try:
+                domain = json.loads(request.body).get('domain')
+            except (ValueError, AttributeError):
+                return JsonResponse({'status': 'error', 'message': 'Invalid JSON body'}, status=400)
+        else:
+            domain = request.POST.get('domain')
+        try:
+            project.domain = domains.assignable_domain(domain) if domain else None
+        except ValueError as e:
+            return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+        try:
+            await sync_to_async(_save_domain)(project)
+        except IntegrityError:
+            return JsonResponse({'status': 'error', 'message': 'Domain is already assigned'}, status=409)
+        domains.invalidate()
+        return JsonResponse({'status': 'success', 'message': 'Domain assigned', 'domain': project.domain})
     return JsonResponse({'status': 'error', 'message': 'Invalid request method'})
+
+def serve_file(request, path):
+    """Serves a file stored by the local storage backend.
+
+    FileResponse hands the open file to the server's ``wsgi.file_wrapper``,
+    which gunicorn sends with ``os.sendfile`` without copying it through
+    Python.
+    """
+    storage_backend = StorageService.get_storage_backend()
+    try:
+        file = storage_backend.open(path)
+    except (OSError, ValueError):
+        raise Http404("File not found")
+    return FileResponse(file)
@@ -0,0 +1,42 @@
+import io
+import zipfile
+
+import pytest
+from relecloud import domains
+from relecloud.deployments import deploy
+from relecloud.models import DeploymentJob
+from relecloud.storage import StorageService
+
+
+@pytest.fixture
+def local_storage(tmp_path, settings):
+    """The local storage backend, storing under ``tmp_path / "media"``."""
+    settings.STORAGE_BACKEND = "local"
+    settings.STORAGE_HEALTH_CHECK_INTERVAL = 0
+    settings.MEDIA_ROOT = str(tmp_path / "media")
+    settings.ASSET_CACHE_DIR = str(tmp_path / "asset-cache")
+    settings.STAGING_ROOT = str(tmp_path / "staging")
+    StorageService.reset()
+    domains.invalidate()
+    yield StorageService.get_storage_backend()
+    StorageService.reset()
+    domains.invalidate()
+
+
+@pytest.fixture
+def deploy_files(local_storage):
+    """Deploys a ZIP of ``{name: content}`` to a project the way the job
+    worker does, and returns the ``Deployment``."""
+
+    def deploy_files(project, files):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w") as zip_file:
+            for name, content in files.items():
+                zip_file.writestr(name, content)
+        archive.seek(0)
+        job = DeploymentJob.objects.create(
+            project=project, archive="", file_name="site.zip", is_zip=True, status=DeploymentJob.SUCCEEDED
+        )
+        return deploy(job, archive)
+
+    return deploy_files
@@ -0,0 +1,55 @@
+import threading
+
+import pytest
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.http import Http404, HttpResponse
+from django.test import AsyncClient, AsyncRequestFactory
+from project import metrics
+from relecloud import domains, views
+from relecloud.models import Project
+from relecloud.serving import HostedSiteMiddleware
+
+
+@pytest.mark.django_db
+def test_async_views_run_on_the_same_thread_as_the_middleware(monkeypatch, settings):
+    threads = {}
+    start_request = metrics.start_request
+
+    def recording_start_request():
+        threads["middleware"] = threading.current_thread()
+        start_request()
+
+    async def recording_get_object_or_404(*args, **kwargs):
+        threads["view"] = threading.current_thread()
+        raise Http404()
+
+    monkeypatch.setattr(metrics, "start_request", recording_start_request)
+    monkeypatch.setattr(views, "aget_object_or_404", recording_get_object_or_404)
+    domains.invalidate()
+
+    response = async_to_sync(AsyncClient().delete)("/api/projects/1/", headers={"origin": settings.WEBSITE_HOSTNAME})
+
+    assert response.status_code == 404
+    # No middleware handed the request to a thread of its own
+    assert threads["middleware"] is threads["view"]
+
+
+@pytest.mark.django_db
+def test_hosted_sites_are_served_on_the_event_loop(deploy_files):
+    project = Project.objects.create(name="Site", description="", domain="example.com")
+    deploy_files(project, {"index.html": "<h1>home</h1>"})
+
+    async def api(request):
+        return HttpResponse("api")
+
+    middleware = HostedSiteMiddleware(api)
+
+    async def get(host):
+        request = AsyncRequestFactory().get("/")
+        request.META["HTTP_HOST"] = host
+        response = await middleware(request)
+        return b"".join(response.streaming_content if response.streaming else [response.content])
+
+    assert iscoroutinefunction(middleware)
+    assert async_to_sync(get)("example.com") == b"<h1>home</h1>"
+    assert async_to_sync(get)("api.example.org") == b"api"
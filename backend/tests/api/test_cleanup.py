@@ -0,0 +1,86 @@
+import io
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.test import RequestFactory
+from relecloud import views
+from relecloud.jobs import run_worker
+from relecloud.models import CleanupJob, Project
+
+
+def _stored(tmp_path, prefix):
+    root = tmp_path / "media" / prefix
+    return sorted(str(path.relative_to(tmp_path / "media")) for path in root.rglob("*") if path.is_file())
+
+
+@pytest.mark.django_db
+def test_delete_project_queues_cleanup_of_its_prefix(local_storage, tmp_path, deploy_files):
+    project = Project.objects.create(name="Site", description="")
+    other = Project.objects.create(name="Other", description="")
+    deploy_files(project, {"index.html": "v1"})
+    deploy_files(project, {"index.html": "v2", "app.js": "x"})
+    deploy_files(other, {"index.html": "other"})
+    objects = _stored(tmp_path, "objects")
+
+    response = async_to_sync(views.delete_project)(RequestFactory().delete(f"/api/projects/{project.id}/"), project.id)
+
+    assert response.status_code == 200
+    assert not Project.objects.filter(pk=project.id).exists()
+    job = CleanupJob.objects.get()
+    assert (job.prefix, job.status) == (f"projects/{project.id}/", CleanupJob.QUEUED)
+    # Nothing is deleted until a worker picks the job up
+    assert len(_stored(tmp_path, f"projects/{project.id}")) == 2
+
+    run_worker(once=True)
+
+    job.refresh_from_db()
+    assert (job.status, job.deleted, job.marker) == (CleanupJob.SUCCEEDED, 2, "")
+    assert _stored(tmp_path, f"projects/{project.id}") == []
+    assert len(_stored(tmp_path, f"projects/{other.id}")) == 1
+    # Objects may be shared and are left for garbage collection
+    assert _stored(tmp_path, "objects") == objects
+
+
+class WorkerKilled(BaseException):
+    pass
+
+
+@pytest.mark.django_db
+def test_interrupted_cleanup_resumes_from_its_marker(local_storage, tmp_path, monkeypatch, settings):
+    for index in range(5):
+        local_storage._upload_file(io.BytesIO(b"x"), f"projects/9/deployments/d{index}/file.txt")
+    job = CleanupJob.objects.create(prefix="projects/9/")
+    local_storage.DELETE_BATCH_SIZE = 2
+    batches, markers = [], []
+    delete_batch, list_pages = local_storage.delete_batch, local_storage.list_pages
+
+    def dies_after_first_batch(names):
+        if batches:
+            raise WorkerKilled()
+        batches.append(names)
+        delete_batch(names)
+
+    def recording_list_pages(prefix, marker=None, page_size=256):
+        markers.append(marker)
+        return list_pages(prefix, marker, page_size)
+
+    monkeypatch.setattr(local_storage, "delete_batch", dies_after_first_batch)
+    monkeypatch.setattr(local_storage, "list_pages", recording_list_pages)
+    with pytest.raises(WorkerKilled):
+        run_worker(once=True)
+
+    job.refresh_from_db()
+    assert (job.status, job.deleted) == (CleanupJob.RUNNING, 2)
+    assert job.marker == "projects/9/deployments/d1/file.txt"
+    assert len(_stored(tmp_path, "projects/9")) == 3
+
+    # The next worker requeues the abandoned job and carries on
+    settings.DEPLOYMENT_JOB_TIMEOUT = 0
+    monkeypatch.setattr(local_storage, "delete_batch", lambda names: batches.append(names) or delete_batch(names))
+    run_worker(once=True)
+
+    job.refresh_from_db()
+    assert (job.status, job.deleted) == (CleanupJob.SUCCEEDED, 5)
+    assert markers == [None, "projects/9/deployments/d1/file.txt"]
+    assert [len(names) for names in batches] == [2, 2, 1]
+    assert _stored(tmp_path, "projects/9") == []
@@ -0,0 +1,71 @@
+import json
+
+import pytest
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from relecloud import views
+from relecloud.deployments import prune_deployments
+from relecloud.models import Deployment, Project
+
+
+def _home(client):
+    return b"".join(client.get("/", HTTP_HOST="example.com").streaming_content)
+
+
+@pytest.mark.django_db
+def test_each_deploy_gets_its_own_prefix(client, local_storage, deploy_files):
+    project = Project.objects.create(name="Site", description="", domain="example.com")
+
+    first = deploy_files(project, {"index.html": "v1"})
+    assert _home(client) == b"v1"
+    second = deploy_files(project, {"index.html": "v2"})
+
+    assert first.prefix != second.prefix
+    assert local_storage.read_manifest(first.file).lookup("index.html").size == 2
+    project.refresh_from_db()
+    assert project.active_deployment == second
+    assert _home(client) == b"v2"
+
+
+@pytest.mark.django_db
+def test_rollback_is_one_update(client, local_storage, deploy_files):
+    project = Project.objects.create(name="Site", description="", domain="example.com")
+    first = deploy_files(project, {"index.html": "v1"})
+    deploy_files(project, {"index.html": "v2"})
+
+    request = RequestFactory().post(f"/api/projects/{project.id}/deployments/{first.id}/activate/")
+    with CaptureQueriesContext(connection) as queries:
+        response = views.activate_deployment(request, project.id, first.id)
+
+    assert response.status_code == 200
+    writes = [query["sql"] for query in queries if not query["sql"].startswith(("SELECT", "SAVEPOINT", "RELEASE"))]
+    assert len(writes) == 1 and writes[0].startswith("UPDATE")
+    assert _home(client) == b"v1"
+    listing = json.loads(views.list_deployments(RequestFactory().get("/"), project.id).content)
+    assert [deployment["active"] for deployment in listing["deployments"]] == [False, True]
+
+
+@pytest.mark.django_db
+def test_cannot_activate_another_projects_deployment(local_storage, deploy_files):
+    project = Project.objects.create(name="Site", description="")
+    other = deploy_files(Project.objects.create(name="Other", description=""), {"index.html": "other"})
+
+    request = RequestFactory().post("/")
+    with pytest.raises(views.Http404):
+        views.activate_deployment(request, project.id, other.id)
+
+
+@pytest.mark.django_db
+def test_prune_keeps_active_and_newest(local_storage, deploy_files):
+    project = Project.objects.create(name="Site", description="")
+    deployments = [deploy_files(project, {"index.html": f"v{i}"}) for i in range(5)]
+    # Roll back to the oldest, which must survive pruning
+    Project.objects.filter(pk=project.pk).update(active_deployment=deployments[0], file=deployments[0].file)
+
+    assert prune_deployments(project.id, keep=2) == 2
+
+    assert set(Deployment.objects.filter(project=project)) == {deployments[0], deployments[3], deployments[4]}
+    for deployment in deployments[1:3]:
+        assert not local_storage._exists(deployment.file)
+    assert local_storage._exists(deployments[0].file)
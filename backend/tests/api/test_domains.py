@@ -0,0 +1,121 @@
+import json
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.test import RequestFactory
+from relecloud import domains, views
+from relecloud.models import Deployment, Project
+
+
+def _project(name, domain=None, manifest=None):
+    project = Project.objects.create(name=name, description="", domain=domain)
+    if manifest:
+        deployment = Deployment.objects.create(project=project, prefix=manifest, file=f"{manifest}/manifest.bin")
+        Project.objects.filter(pk=project.pk).update(active_deployment=deployment, file=deployment.file)
+    return project
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    domains.invalidate()
+    yield
+    domains.invalidate()
+
+
+def _assign(project_id, domain):
+    request = RequestFactory().post(
+        f"/api/projects/{project_id}/domain/", json.dumps({"domain": domain}), content_type="application/json"
+    )
+    response = async_to_sync(views.assign_domain)(request, project_id)
+    return response.status_code, json.loads(response.content)
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("Example.COM", "example.com"),
+    ("example.com:8000", "example.com"),
+    ("www.example.com.", "www.example.com"),
+    ("*.Example.com", "*.example.com"),
+    ("bücher.example", "xn--bcher-kva.example"),
+])
+def test_normalize_domain(value, expected):
+    assert domains.normalize_domain(value) == expected
+
+
+@pytest.mark.parametrize(
+    "value", ["", "-bad.com", "a..b", "*.com", "[::1]:80", "exa mple.com", "127.0.0.1", "10.0.0.1:8000", "localhost"]
+)
+def test_normalize_domain_rejects_invalid(value):
+    with pytest.raises(ValueError):
+        domains.normalize_domain(value)
+
+
+@pytest.mark.django_db
+def test_resolve_exact_and_wildcard():
+    site = _project("Site", "example.com", "site")
+    shop = _project("Shop", "shop.example.com", "shop")
+    apps = _project("Apps", "*.example.com")
+
+    assert domains.resolve_host("EXAMPLE.com:443") == domains.ResolvedSite(site.id, "site/manifest.bin", None)
+    assert domains.resolve_host("shop.example.com") == domains.ResolvedSite(shop.id, "shop/manifest.bin", None)
+    assert domains.resolve_host("blog.example.com").project_id == apps.id
+    assert domains.resolve_host("a.blog.example.com").project_id == apps.id
+    assert domains.resolve_host("example.org") is None
+
+
+@pytest.mark.django_db
+def test_resolve_is_cached(django_assert_num_queries):
+    _project("Site", "example.com", "site")
+
+    with django_assert_num_queries(2):
+        domains.resolve_host("example.com")
+        domains.resolve_host("example.com")
+        domains.resolve_host("unknown.com")
+    with django_assert_num_queries(0):
+        domains.resolve_host("example.com")
+        # Misses are cached too
+        domains.resolve_host("unknown.com")
+
+
+@pytest.mark.django_db
+def test_assign_domain_normalizes_and_invalidates():
+    project = _project("Site", manifest="site")
+    assert domains.resolve_host("example.com") is None
+
+    assert _assign(project.id, "Example.com") == (
+        200, {"status": "success", "message": "Domain assigned", "domain": "example.com"}
+    )
+
+    assert domains.resolve_host("example.com").project_id == project.id
+
+
+@pytest.mark.django_db
+def test_assign_domain_rejects_duplicates_and_invalid():
+    Project.objects.create(name="Site", description="", domain="example.com")
+    other = Project.objects.create(name="Other", description="")
+
+    assert _assign(other.id, "EXAMPLE.com")[0] == 409
+    assert _assign(other.id, "not a domain")[0] == 400
+    other.refresh_from_db()
+    assert other.domain is None
+
+
+@pytest.mark.django_db
+def test_assign_domain_rejects_the_apps_own_hosts(settings):
+    settings.ALLOWED_HOSTS = ["api.example.com", ".hoster.dev", "127.0.0.1"]
+    settings.WEBSITE_HOSTNAME = "https://app.example.org"
+    project = Project.objects.create(name="Site", description="")
+
+    for domain in ["api.example.com", "*.example.com", "hoster.dev", "x.hoster.dev", "*.x.hoster.dev",
+                   "app.example.org:443", "*.example.org", "127.0.0.1"]:
+        assert _assign(project.id, domain)[0] == 400, domain
+    assert _assign(project.id, "shop.example.com")[0] == 200
+
+
+@pytest.mark.django_db
+def test_delete_project_invalidates():
+    project = Project.objects.create(name="Site", description="", domain="example.com")
+    assert domains.resolve_host("example.com").project_id == project.id
+
+    async_to_sync(views.delete_project)(RequestFactory().delete(f"/api/projects/{project.id}/"), project.id)
+
+    assert domains.resolve_host("example.com") is None
@@ -0,0 +1,200 @@
+import io
+import os
+import time
+
+import pytest
+from django.core.management import call_command
+from relecloud import garbage
+from relecloud.models import GarbageCollection, Project
+
+DAY = 24 * 3600
+
+
+@pytest.fixture(autouse=True)
+def grace_period(settings):
+    settings.GC_GRACE_PERIOD = DAY
+
+
+def _store(storage_backend, name, age=2 * DAY):
+    storage_backend._upload_file(io.BytesIO(b"orphan"), name)
+    modified = time.time() - age
+    os.utime(storage_backend.path(name), (modified, modified))
+
+
+def _age_everything(tmp_path, age=2 * DAY):
+    modified = time.time() - age
+    for path in (tmp_path / "media").rglob("*"):
+        if path.is_file():
+            os.utime(path, (modified, modified))
+
+
+def _stored(tmp_path):
+    root = tmp_path / "media"
+    return sorted(str(path.relative_to(root)) for path in root.rglob("*") if path.is_file())
+
+
+@pytest.fixture
+def site(local_storage, tmp_path, deploy_files):
+    """A project with a deployment, and the orphans a failed upload and a
+    deleted project left behind."""
+    project = Project.objects.create(name="Site", description="")
+    deploy_files(project, {"index.html": "<p>" + "hello " * 400 + "</p>", "app.js": "x"})
+    _age_everything(tmp_path)
+    kept = _stored(tmp_path)
+    orphans = ["objects/" + "0" * 64, "objects/" + "0" * 64 + ".gz", "projects/99/deployments/abc/manifest.bin"]
+    for name in orphans:
+        _store(local_storage, name)
+    # Too young to be collected, orphaned or not
+    _store(local_storage, "projects/98/deployments/def/manifest.bin", age=60)
+    return kept, sorted(orphans)
+
+
+@pytest.mark.django_db
+def test_collectgarbage_deletes_old_orphans_only(site, tmp_path):
+    kept, orphans = site
+    assert any(name.endswith(".gz") for name in kept)
+    out = io.StringIO()
+
+    call_command("collectgarbage", stdout=out)
+
+    assert _stored(tmp_path) == sorted(kept + ["projects/98/deployments/def/manifest.bin"])
+    run = GarbageCollection.objects.get()
+    assert (run.deleted, run.scanned, run.marker) == (3, len(kept) + 4, "")
+    assert run.finished_at is not None and run.objects_collected_at is not None
+    assert f"{run.deleted} of {run.scanned} files deleted" in out.getvalue()
+
+
+@pytest.mark.django_db
+def test_collectgarbage_dry_run_lists_orphans(site, tmp_path):
+    kept, orphans = site
+    out = io.StringIO()
+
+    call_command("collectgarbage", "--dry-run", stdout=out)
+
+    listed = [line.split("\t")[0] for line in out.getvalue().splitlines() if "\t" in line]
+    assert listed == orphans
+    assert "3 orphaned" in out.getvalue()
+    assert len(_stored(tmp_path)) == len(kept) + 4
+    assert not GarbageCollection.objects.exists()
+
+
+def _objects(tmp_path):
+    return [name for name in _stored(tmp_path) if name.startswith("objects/")]
+
+
+@pytest.fixture
+def deleted_site(local_storage, tmp_path, deploy_files):
+    """The objects of a deleted project's site, old enough to collect but
+    still remembered as stored by this worker."""
+    project = Project.objects.create(name="Gone", description="")
+    deploy_files(project, {"index.html": "v1"})
+    Project.objects.all().delete()
+    _age_everything(tmp_path)
+    return _objects(tmp_path)
+
+
+@pytest.mark.django_db
+def test_deploy_uploads_again_objects_collected_while_it_ran(deleted_site, local_storage, tmp_path, deploy_files,
+                                                             monkeypatch):
+    upload_manifest = local_storage._upload_manifest
+    uploads = []
+
+    def collect_then_upload_manifest(entries, folder_name):
+        # The deploy found its object stored; a collection then deletes it
+        # before the deployment is recorded
+        if not uploads:
+            call_command("collectgarbage", stdout=io.StringIO())
+            assert _objects(tmp_path) == []
+        uploads.append(folder_name)
+        return upload_manifest(entries, folder_name)
+
+    monkeypatch.setattr(local_storage, "_upload_manifest", collect_then_upload_manifest)
+    project = Project.objects.create(name="Again", description="")
+    deployment = deploy_files(project, {"index.html": "v1"})
+
+    assert uploads == [deployment.prefix] * 2
+    assert _objects(tmp_path) == deleted_site
+    assert garbage.missing_objects(local_storage, local_storage.read_manifest(deployment.file)) == []
+    project.refresh_from_db()
+    assert project.active_deployment_id == deployment.id
+
+
+@pytest.mark.django_db
+def test_collection_keeps_objects_of_deployments_recorded_since_it_started(deleted_site, local_storage, tmp_path,
+                                                                          deploy_files):
+    run = GarbageCollection.objects.create()
+    deployments = []
+
+    def deploy_reusing_orphan(blob):
+        if not deployments:
+            project = Project.objects.create(name="Again", description="")
+            deployments.append(deploy_files(project, {"index.html": "v1"}))
+
+    collection = garbage.collect(local_storage, run=run, orphan=deploy_reusing_orphan)
+
+    assert collection.orphaned == len(deleted_site) + 1 and collection.objects_deleted == 0
+    assert _objects(tmp_path) == deleted_site
+    run.refresh_from_db()
+    assert run.objects_collected_at is not None and run.collecting_until is None
+
+
+class CollectorKilled(BaseException):
+    pass
+
+
+@pytest.mark.django_db
+def test_interrupted_collection_resumes_from_its_marker(local_storage, tmp_path, monkeypatch):
+    for index in range(5):
+        _store(local_storage, f"projects/9/deployments/d{index}/file.txt")
+    local_storage.DELETE_BATCH_SIZE = 2
+    batches, markers = [], []
+    delete_batch, list_pages = local_storage.delete_batch, local_storage.list_pages
+
+    def dies_after_first_batch(names):
+        if batches:
+            raise CollectorKilled()
+        batches.append(names)
+        delete_batch(names)
+
+    def recording_list_pages(prefix, marker=None, page_size=256):
+        markers.append(marker)
+        return list_pages(prefix, marker, page_size)
+
+    monkeypatch.setattr(local_storage, "delete_batch", dies_after_first_batch)
+    monkeypatch.setattr(local_storage, "list_pages", recording_list_pages)
+    with pytest.raises(CollectorKilled):
+        call_command("collectgarbage", stdout=io.StringIO())
+
+    run = GarbageCollection.objects.get()
+    assert (run.deleted, run.marker, run.finished_at) == (2, "projects/9/deployments/d1/file.txt", None)
+
+    monkeypatch.setattr(local_storage, "delete_batch", lambda names: batches.append(names) or delete_batch(names))
+    call_command("collectgarbage", stdout=io.StringIO())
+
+    run.refresh_from_db()
+    assert (run.deleted, run.marker) == (5, "")
+    assert run.finished_at is not None
+    assert markers == [None, "projects/9/deployments/d1/file.txt"]
+    assert [len(names) for names in batches] == [2, 2, 1]
+    assert _stored(tmp_path) == []
+
+
+@pytest.mark.django_db
+def test_deploy_forgets_objects_a_collection_deleted(local_storage, tmp_path, deploy_files):
+    project = Project.objects.create(name="Site", description="")
+    deploy_files(project, {"index.html": "v1"})
+    Project.objects.all().delete()
+    _age_everything(tmp_path)
+    call_command("collectgarbage", stdout=io.StringIO())
+    assert _stored(tmp_path) == []
+
+    project = Project.objects.create(name="Again", description="")
+    deployment = deploy_files(project, {"index.html": "v1"})
+
+    # Uploaded again rather than assumed to be stored
+    manifest = local_storage.read_manifest(deployment.file)
+    assert [f"objects/{digest}" for digest in manifest.digests()] == [
+        name for name in _stored(tmp_path) if name.startswith("objects/")
+    ]
+    garbage.forget_collected_objects(local_storage)
+    assert local_storage._known_objects
@@ -0,0 +1,197 @@
+import io
+import json
+import os
+import tarfile
+import zipfile
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory
+from relecloud import views
+from relecloud.jobs import run_worker
+from relecloud.models import DeploymentJob, Project
+
+
+def _zip(pages):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, content in pages.items():
+            archive.writestr(name, content)
+    return buffer.getvalue()
+
+
+def _upload(content, name="site.zip"):
+    request = RequestFactory().post("/api/projects/", {"file": SimpleUploadedFile(name, content)})
+    return async_to_sync(views.upload_project)(request)
+
+
+@pytest.mark.django_db
+def test_upload_returns_202_and_queues_job(local_storage, settings, tmp_path):
+    response = _upload(_zip({"index.html": "<h1>hi</h1>"}))
+
+    assert response.status_code == 202
+    body = json.loads(response.content)
+    job = DeploymentJob.objects.get(pk=body["job_id"])
+    assert job.status == DeploymentJob.QUEUED
+    assert job.is_zip
+    assert body["status_url"] == f"/api/projects/jobs/{job.id}/"
+    # Nothing is extracted until a worker picks the job up
+    assert not (tmp_path / "media" / "objects").exists()
+
+
+@pytest.mark.django_db
+def test_worker_deploys_staged_archive(local_storage, tmp_path):
+    body = json.loads(_upload(_zip({"index.html": "<h1>hi</h1>"})).content)
+
+    run_worker(once=True)
+
+    job = DeploymentJob.objects.get(pk=body["job_id"])
+    assert job.status == DeploymentJob.SUCCEEDED
+    assert job.finished_at is not None
+    project = Project.objects.get(pk=body["project_id"])
+    deployment = project.active_deployment
+    assert deployment.job == job
+    assert project.file == f"projects/{project.id}/deployments/{deployment.id.hex}/manifest.bin"
+    assert (deployment.file_count, deployment.total_size) == (1, len("<h1>hi</h1>"))
+    assert list((tmp_path / "staging").iterdir()) == []
+
+    status = json.loads(views.job_status(RequestFactory().get(body["status_url"]), job.id).content)
+    assert status["status"] == "succeeded"
+
+
+@pytest.mark.django_db
+def test_worker_only_claims_jobs_staged_on_its_instance(local_storage, settings):
+    settings.INSTANCE_NAME = "web-1"
+    body = json.loads(_upload(_zip({"index.html": "<h1>hi</h1>"})).content)
+    job = DeploymentJob.objects.get(pk=body["job_id"])
+    assert job.host == "web-1"
+
+    settings.INSTANCE_NAME = "web-2"
+    run_worker(once=True)
+    job.refresh_from_db()
+    assert job.status == DeploymentJob.QUEUED
+
+    settings.INSTANCE_NAME = "web-1"
+    run_worker(once=True)
+    job.refresh_from_db()
+    assert job.status == DeploymentJob.SUCCEEDED
+
+
+@pytest.mark.django_db
+def test_worker_records_failed_job(local_storage):
+    body = json.loads(_upload(b"not a zip").content)
+
+    run_worker(once=True)
+
+    job = DeploymentJob.objects.get(pk=body["job_id"])
+    assert job.status == DeploymentJob.FAILED
+    assert "not a valid ZIP" in job.error
+
+
+def _tar_gz(pages):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+        for name, content in pages.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+    return buffer.getvalue()
+
+
+@pytest.mark.django_db
+def test_worker_deploys_staged_tar_archive(local_storage):
+    body = json.loads(_upload(_tar_gz({"index.html": b"<h1>hi</h1>"}), name="site.tar.gz").content)
+
+    run_worker(once=True)
+
+    job = DeploymentJob.objects.get(pk=body["job_id"])
+    assert (job.status, job.is_zip) == (DeploymentJob.SUCCEEDED, False)
+    assert Project.objects.get(pk=body["project_id"]).active_deployment.file_count == 1
+
+
+class _Body:
+    """A request body arriving over the network: records how much of it the
+    view has read."""
+
+    def __init__(self, data):
+        self._file = io.BytesIO(data)
+        self.received = 0
+
+    def read(self, size=-1):
+        data = self._file.read(size)
+        self.received += len(data)
+        return data
+
+    def readline(self, size=-1):
+        return self._file.readline(size)
+
+
+@pytest.mark.django_db
+def test_streamed_tar_is_deployed_while_it_arrives(local_storage, monkeypatch):
+    pages = {f"page-{index}.html": os.urandom(64 * 1024) for index in range(64)}
+    data = _tar_gz(pages)
+    body = _Body(data)
+    received_at_first_upload = []
+    upload_file = local_storage._upload_file
+
+    def recording_upload_file(file, name, **kwargs):
+        received_at_first_upload.append(body.received)
+        return upload_file(file, name, **kwargs)
+
+    monkeypatch.setattr(local_storage, "_upload_file", recording_upload_file)
+    request = RequestFactory().post(
+        "/api/projects/stream/?file_name=site.tar.gz&domain=Site.Example.com",
+        data=data, content_type="application/octet-stream", **{"wsgi.input": body},
+    )
+
+    response = views.stream_project(request)
+
+    assert response.status_code == 201
+    result = json.loads(response.content)
+    job = DeploymentJob.objects.get(pk=result["job_id"])
+    assert (job.status, job.archive) == (DeploymentJob.SUCCEEDED, "")
+    project = Project.objects.get(pk=result["project_id"])
+    assert (project.domain, project.active_deployment.file_count) == ("site.example.com", 64)
+    # The first file was stored before the rest of the body had arrived
+    assert received_at_first_upload[0] < len(data) / 2
+
+
+def _post_stream(query, data=b"x" * 100):
+    request = RequestFactory().post(f"/api/projects/stream/{query}", data=data, content_type="application/x-tar")
+    return views.stream_project(request)
+
+
+@pytest.mark.django_db
+def test_streamed_upload_errors(local_storage):
+    assert _post_stream("?file_name=site.zip").status_code == 400
+    assert _post_stream("?file_name=site.tar", data=b"").status_code == 411
+
+    response = _post_stream("?file_name=site.tar.gz&domain=site.example.com")
+
+    assert response.status_code == 400
+    assert "not a valid tar archive" in json.loads(response.content)["message"]
+    # Nothing is left holding the domain
+    assert not Project.objects.exists() and not DeploymentJob.objects.exists()
+
+
+@pytest.mark.django_db
+def test_failed_streamed_deploy_can_be_retried(local_storage, monkeypatch):
+    data = _tar_gz({"index.html": b"<h1>hi</h1>"})
+
+    def unavailable(entries, folder_name):
+        raise OSError("storage is unavailable")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(local_storage, "_upload_manifest", unavailable)
+        response = _post_stream("?file_name=site.tar.gz&domain=site.example.com", data)
+
+    assert response.status_code == 500
+    assert "storage is unavailable" in json.loads(response.content)["message"]
+
+    response = _post_stream("?file_name=site.tar.gz&domain=site.example.com", data)
+
+    assert response.status_code == 201
+    project = Project.objects.get()
+    assert (project.pk, project.domain) == (json.loads(response.content)["project_id"], "site.example.com")
+    assert project.active_deployment.file_count == 1
@@ -0,0 +1,131 @@
+import json
+import os
+
+import pytest
+from django.core.management import call_command
+from project import metrics
+from relecloud.storage import AssetCache
+
+
+@pytest.fixture
+def registry(tmp_path, settings):
+    settings.METRICS_DIR = str(tmp_path / "metrics")
+    settings.METRICS_FLUSH_INTERVAL = 0
+    for metric in metrics.REGISTRY:
+        metric._samples.clear()
+    yield
+    for metric in metrics.REGISTRY:
+        metric._samples.clear()
+
+
+def _write_snapshot(directory, pid, requests, in_flight):
+    os.makedirs(directory, exist_ok=True)
+    snapshot = {
+        "pid": pid,
+        "metrics": {
+            metrics.REQUESTS.name: [[["projects:list", "GET", "200"], requests]],
+            metrics.IN_FLIGHT.name: [[[], in_flight]],
+        },
+    }
+    with open(os.path.join(directory, f"{pid}.json"), "w") as file:
+        json.dump(snapshot, file)
+
+
+def test_histogram_renders_cumulative_buckets(registry):
+    for value in (0.003, 0.2, 7):
+        metrics.REQUEST_LATENCY.observe(value, route="projects:list", method="GET")
+
+    text = metrics.render(metrics.collect())
+
+    assert 'hoster_request_duration_seconds_bucket{route="projects:list",method="GET",le="0.005"} 1' in text
+    assert 'hoster_request_duration_seconds_bucket{route="projects:list",method="GET",le="0.25"} 2' in text
+    assert 'hoster_request_duration_seconds_bucket{route="projects:list",method="GET",le="+Inf"} 3' in text
+    assert 'hoster_request_duration_seconds_count{route="projects:list",method="GET"} 3' in text
+
+
+def test_collect_merges_processes(registry, settings):
+    metrics.REQUESTS.inc(route="projects:list", method="GET", status="200")
+    # A live process (this one's parent) and one that has exited
+    _write_snapshot(settings.METRICS_DIR, os.getppid(), 2, 1)
+    _write_snapshot(settings.METRICS_DIR, 2 ** 22 + 1, 4, 5)
+
+    merged = metrics.collect()
+
+    assert merged[metrics.REQUESTS.name][("projects:list", "GET", "200")] == 7
+    # Only live processes have requests in flight
+    assert merged[metrics.IN_FLIGHT.name][()] == 1
+
+
+def test_dead_processes_are_archived(registry, settings):
+    _write_snapshot(settings.METRICS_DIR, 2 ** 22 + 1, 4, 5)
+    _write_snapshot(settings.METRICS_DIR, 2 ** 22 + 2, 3, 5)
+
+    metrics.mark_process_dead(2 ** 22 + 1)
+    metrics.mark_process_dead(2 ** 22 + 2)
+
+    assert sorted(os.listdir(settings.METRICS_DIR)) == [metrics.ARCHIVE_NAME]
+    merged = metrics.collect()
+    assert merged[metrics.REQUESTS.name][("projects:list", "GET", "200")] == 7
+    assert () not in merged[metrics.IN_FLIGHT.name]
+
+
+def test_storage_calls_are_timed(registry):
+    metrics.start_request()
+    with metrics.storage_call("stat"):
+        pass
+    with pytest.raises(ValueError):
+        with metrics.storage_call("stream"):
+            raise ValueError("unavailable")
+
+    seconds, calls = metrics.request_storage_time()
+    assert calls == 2
+    assert metrics.STORAGE_ERRORS._samples == {("stream",): 1}
+
+
+def test_asset_cache_is_published(registry, tmp_path):
+    cache = AssetCache(8, 8, str(tmp_path / "cache"), 0, 0)
+    cache.open("a.css", "v1", 6, lambda: [b"abcdef"])
+    cache.open("a.css", "v1", 6, lambda: pytest.fail("fetched again"))
+    cache.open("b.css", "v1", 4, lambda: [b"wxyz"])
+
+    text = metrics.render(metrics.collect())
+
+    assert 'hoster_asset_cache_lookups_total{result="hit"} 1' in text
+    assert 'hoster_asset_cache_lookups_total{result="miss"} 2' in text
+    assert 'hoster_asset_cache_evictions_total{tier="memory"} 1' in text
+    assert 'hoster_asset_cache_bytes{tier="memory"} 4' in text
+    assert cache.stats()["memory_bytes"] == 4
+
+
+@pytest.mark.django_db
+def test_requests_are_recorded(client, registry):
+    response = client.get("/api/projects/")
+
+    assert response["Server-Timing"].startswith("app;dur=")
+    assert metrics.REQUESTS._samples == {("projects:projects", "GET", "403"): 1}
+    assert sum(metrics.REQUEST_LATENCY._samples[("projects:projects", "GET")][:-1]) == 1
+    assert metrics.IN_FLIGHT._samples[()] == 0
+
+
+@pytest.mark.django_db
+def test_metrics_are_served_locally_only(client, registry):
+    client.get("/api/projects/")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response["Content-Type"].startswith("text/plain; version=0.0.4")
+    assert b'hoster_requests_total{route="projects:projects",method="GET",status="403"} 1' in response.content
+
+    assert client.get("/metrics", REMOTE_ADDR="203.0.113.7").status_code == 403
+
+
+@pytest.mark.django_db
+def test_job_worker_writes_its_metrics(registry, settings):
+    with metrics.storage_call("upload"):
+        pass
+
+    call_command("runjobs", "--once")
+
+    with open(os.path.join(settings.METRICS_DIR, f"{os.getpid()}.json")) as file:
+        snapshot = json.load(file)
+    assert snapshot["metrics"][metrics.STORAGE_LATENCY.name][0][0] == ["upload"]
@@ -0,0 +1,69 @@
+import json
+
+import pytest
+from django.test import RequestFactory
+from relecloud import views
+from relecloud.models import Deployment, Project
+from relecloud.storage import StorageService
+
+
+def _list(**params):
+    response = views.ProjectViewSet.as_view({"get": "list"})(RequestFactory().get("/api/projects/", params))
+    response.render()
+    return json.loads(response.content)
+
+
+@pytest.mark.django_db
+def test_project_list_links_sites_without_touching_storage(local_storage, monkeypatch):
+    site = Project.objects.create(name="Site", description="", domain="site.example.com")
+    deployment = Deployment.objects.create(project=site, prefix="p", file="p/manifest.bin")
+    Project.objects.filter(pk=site.pk).update(active_deployment=deployment, file=deployment.file)
+    Project.objects.create(name="Pending", description="", domain="pending.example.com")
+
+    def unreachable():
+        raise OSError("storage is down")
+
+    monkeypatch.setattr(StorageService, "get_storage_backend", unreachable)
+    projects = _list()["results"]
+
+    # Newest first
+    assert [(project["url"], project["active_deployment"]) for project in projects] == [
+        (None, None),
+        ("http://site.example.com/", str(deployment.id)),
+    ]
+    assert all("file" not in project for project in projects)
+
+
+@pytest.mark.django_db
+def test_project_list_pages_with_cursor(local_storage):
+    ids = [Project.objects.create(name=f"Site {i}", description="").id for i in range(7)]
+
+    seen = []
+    page = _list(page_size=3)
+    while True:
+        seen += [project["id"] for project in page["results"]]
+        if not page["next_cursor"]:
+            break
+        assert f"cursor={page['next_cursor']}" in page["next"]
+        page = _list(page_size=3, cursor=page["next_cursor"])
+
+    assert seen == sorted(ids, reverse=True)
+
+
+@pytest.mark.django_db
+def test_project_list_pages_through_equal_timestamps(local_storage):
+    Project.objects.bulk_create([Project(name=f"Site {i}", description="") for i in range(5)])
+    Project.objects.update(created_at=Project.objects.first().created_at)
+
+    first = _list(page_size=2)
+    second = _list(page_size=2, cursor=first["next_cursor"])
+
+    ids = [p["id"] for p in first["results"] + second["results"]]
+    assert len(set(ids)) == 4
+    assert ids == sorted(ids, reverse=True)
+
+
+@pytest.mark.django_db
+def test_project_list_rejects_malformed_cursor(local_storage):
+    response = views.ProjectViewSet.as_view({"get": "list"})(RequestFactory().get("/api/projects/", {"cursor": "!!"}))
+    assert response.status_code == 404
@@ -0,0 +1,171 @@
+import gzip
+import zipfile
+from io import BytesIO
+
+import pytest
+from django.utils.http import http_date
+from relecloud import serving
+from relecloud.deployments import deploy
+from relecloud.models import DeploymentJob, Project
+from relecloud.storage import StorageService
+
+VIDEO = bytes(range(256)) * 40
+
+
+@pytest.fixture
+def site(local_storage, tmp_path):
+    archive = tmp_path / "site.zip"
+    with zipfile.ZipFile(archive, "w") as zip_file:
+        zip_file.writestr("index.html", "<h1>home</h1>")
+        zip_file.writestr("docs/index.html", "<h1>docs</h1>")
+        zip_file.writestr("media/clip.mp4", VIDEO)
+    project = Project.objects.create(name="Site", description="", domain="example.com")
+    with open(archive, "rb") as file:
+        _deploy(project, file)
+    return project
+
+
+def _deploy(project, archive):
+    job = DeploymentJob.objects.create(project=project, archive="", file_name="site.zip", is_zip=True)
+    return deploy(job, archive)
+
+
+def _get(client, path, **headers):
+    return client.get(path, HTTP_HOST="example.com", **headers)
+
+
+@pytest.mark.django_db
+def test_serves_index_documents(client, site):
+    for path, body in [("/", b"<h1>home</h1>"), ("/docs/", b"<h1>docs</h1>"), ("/docs", b"<h1>docs</h1>")]:
+        response = _get(client, path)
+        assert response.status_code == 200
+        assert response["Content-Type"] == "text/html"
+        assert b"".join(response.streaming_content) == body
+    assert _get(client, "/missing.html").status_code == 404
+
+
+@pytest.mark.django_db
+def test_other_hosts_reach_the_api(client, site):
+    response = client.get("/api/projects/")
+    # Rejected by the API's origin check, not served as a site
+    assert response.status_code == 403
+
+
+@pytest.mark.django_db
+def test_a_project_cannot_take_over_the_apps_own_hosts(client, site, settings):
+    settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, "api.example.com"]
+    # Assigned before such domains were refused
+    for domain in ["api.example.com", "127.0.0.1"]:
+        project = Project.objects.create(name=domain, description="", domain=domain)
+        headers = {"HTTP_HOST": domain, "HTTP_ORIGIN": settings.WEBSITE_HOSTNAME}
+
+        response = client.get("/api/projects/", **headers)
+        assert response.status_code == 200
+        assert response["Content-Type"] == "application/json"
+        response = client.delete(f"/api/projects/{project.id}/", **headers)
+        assert response.json() == {"status": "success", "message": "Project deleted"}
+
+
+@pytest.mark.django_db
+def test_etag_and_last_modified_revalidation(client, site, monkeypatch):
+    response = _get(client, "/")
+    etag = response["ETag"]
+    last_modified = response["Last-Modified"]
+
+    # A matching ETag is answered without asking storage about the file
+    backend = StorageService.get_storage_backend()
+    StorageService.get_asset_cache().invalidate("objects/")
+    stat = backend.stat
+    monkeypatch.setattr(backend, "stat", lambda name: pytest.fail("stat called") if "objects/" in name else stat(name))
+    response = _get(client, "/", HTTP_IF_NONE_MATCH=f'"other", W/{etag}')
+    assert response.status_code == 304
+    assert response["ETag"] == etag
+    assert response.content == b""
+    monkeypatch.undo()
+
+    assert _get(client, "/", HTTP_IF_MODIFIED_SINCE=last_modified).status_code == 304
+    assert _get(client, "/", HTTP_IF_MODIFIED_SINCE=http_date(0)).status_code == 200
+
+
+@pytest.mark.django_db
+def test_range_requests(client, site):
+    response = _get(client, "/media/clip.mp4", HTTP_RANGE="bytes=100-299")
+    assert response.status_code == 206
+    assert response["Content-Range"] == f"bytes 100-299/{len(VIDEO)}"
+    assert response["Content-Length"] == "200"
+    assert b"".join(response.streaming_content) == VIDEO[100:300]
+
+    response = _get(client, "/media/clip.mp4", HTTP_RANGE="bytes=-10")
+    assert b"".join(response.streaming_content) == VIDEO[-10:]
+
+    response = _get(client, "/media/clip.mp4", HTTP_RANGE=f"bytes={len(VIDEO)}-")
+    assert response.status_code == 416
+    assert response["Content-Range"] == f"bytes */{len(VIDEO)}"
+
+    # A stale If-Range gets the whole file
+    response = _get(client, "/media/clip.mp4", HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"stale"')
+    assert response.status_code == 200
+    assert b"".join(response.streaming_content) == VIDEO
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-0", (0, 1)),
+    ("bytes=5-", (5, 5)),
+    ("bytes=5-100", (5, 5)),
+    ("bytes=-3", (7, 3)),
+    ("bytes=-30", (0, 10)),
+    ("bytes=6-5", None),
+    ("bytes=0-1,4-5", None),
+    ("items=0-1", None),
+])
+def test_parse_range(header, expected):
+    assert serving.parse_range(header, 10) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=10-", "bytes=-0"])
+def test_parse_range_unsatisfiable(header):
+    with pytest.raises(ValueError):
+        serving.parse_range(header, 10)
+
+
+@pytest.mark.django_db
+def test_head_and_methods(client, site):
+    response = client.head("/", HTTP_HOST="example.com")
+    assert response.status_code == 200
+    assert response["Content-Length"] == str(len(b"<h1>home</h1>"))
+    assert response.content == b""
+    assert client.post("/", HTTP_HOST="example.com").status_code == 405
+
+
+@pytest.mark.django_db
+def test_repeat_requests_are_served_from_cache(client, site, monkeypatch):
+    assert b"".join(_get(client, "/media/clip.mp4").streaming_content) == VIDEO
+
+    backend = StorageService.get_storage_backend()
+    monkeypatch.setattr(backend, "stream", lambda *args: pytest.fail("stream called"))
+    response = _get(client, "/media/clip.mp4", HTTP_RANGE="bytes=10-19")
+    assert b"".join(response.streaming_content) == VIDEO[10:20]
+    assert StorageService.get_asset_cache().stats()["hits"] == 1
+
+
+@pytest.mark.django_db
+def test_serves_precompressed_variants(client, site, settings):
+    settings.COMPRESS_MIN_SIZE = 100
+    style = "body { color: black; }\n" * 100
+    archive = BytesIO()
+    with zipfile.ZipFile(archive, "w") as zip_file:
+        zip_file.writestr("style.css", style)
+    archive.seek(0)
+    _deploy(site, archive)
+
+    response = _get(client, "/style.css", HTTP_ACCEPT_ENCODING="gzip, deflate")
+    assert response["Content-Encoding"] == "gzip"
+    assert response["Vary"] == "Accept-Encoding"
+    assert gzip.decompress(b"".join(response.streaming_content)).decode() == style
+    gzip_etag = response["ETag"]
+
+    response = _get(client, "/style.css")
+    assert "Content-Encoding" not in response
+    assert b"".join(response.streaming_content).decode() == style
+    assert response["ETag"] != gzip_etag
+    assert _get(client, "/style.css", HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=gzip_etag).status_code == 304
@@ -0,0 +1,167 @@
+import io
+import json
+import zipfile
+
+import pytest
+from django.test import RequestFactory
+from relecloud import uploads, views
+from relecloud.jobs import run_worker
+from relecloud.models import DeploymentJob, Project, UploadSession
+
+PAGE = bytes(range(256)) * 40
+
+
+def _zip():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr("index.html", PAGE)
+    return buffer.getvalue()
+
+
+ARCHIVE = _zip()
+
+
+def _create(size=len(ARCHIVE)):
+    request = RequestFactory().post("/api/projects/uploads/", {"file_name": "site.zip", "size": size})
+    return views.create_upload_session(request)
+
+
+def _put(upload_id, offset, data):
+    request = RequestFactory().put(
+        f"/api/projects/uploads/{upload_id}/?offset={offset}", data, content_type="application/octet-stream"
+    )
+    return views.upload_session(request, upload_id)
+
+
+def _complete(upload_id):
+    request = RequestFactory().post(f"/api/projects/uploads/{upload_id}/complete/")
+    return views.complete_upload_session(request, upload_id)
+
+
+def _chunks(storage_backend, upload_id):
+    return [blob.name for blobs, _ in storage_backend.list_pages(uploads.chunk_prefix(upload_id)) for blob in blobs]
+
+
+@pytest.mark.django_db
+def test_chunked_upload_is_handed_to_a_deployment_job(local_storage, settings):
+    response = _create()
+    assert response.status_code == 201
+    upload_id = json.loads(response.content)["upload_id"]
+
+    assert json.loads(_put(upload_id, 0, ARCHIVE[:4000]).content)["offset"] == 4000
+    # A retried chunk may overlap what was already received
+    assert json.loads(_put(upload_id, 2000, ARCHIVE[2000:8000]).content)["offset"] == 8000
+    assert json.loads(_put(upload_id, 8000, ARCHIVE[8000:]).content)["offset"] == len(ARCHIVE)
+
+    response = _complete(upload_id)
+    assert response.status_code == 202
+    job = DeploymentJob.objects.get(pk=json.loads(response.content)["job_id"])
+    assert (job.file_name, job.is_zip, job.host) == ("site.zip", True, "")
+    assert UploadSession.objects.get(pk=upload_id).status == UploadSession.COMPLETE
+
+    # The chunks are stored, so the worker of any instance can deploy them
+    settings.INSTANCE_NAME = "another-instance"
+    run_worker(once=True)
+
+    job.refresh_from_db()
+    assert job.status == DeploymentJob.SUCCEEDED
+    deployment = Project.objects.get(pk=job.project_id).active_deployment
+    assert (deployment.file_count, deployment.total_size) == (1, len(PAGE))
+    assert not UploadSession.objects.filter(pk=upload_id).exists()
+    assert _chunks(local_storage, upload_id) == []
+
+
+@pytest.mark.django_db
+def test_assemble_reads_overlapping_chunks_once(local_storage):
+    upload_id = json.loads(_create().content)["upload_id"]
+    _put(upload_id, 0, ARCHIVE[:4000])
+    _put(upload_id, 2000, ARCHIVE[2000:8000])
+    _put(upload_id, 8000, ARCHIVE[8000:])
+
+    with uploads.assemble(UploadSession.objects.get(pk=upload_id)) as archive:
+        assert archive.read() == ARCHIVE
+
+
+@pytest.mark.django_db
+def test_assemble_fails_on_a_missing_chunk(local_storage):
+    upload_id = json.loads(_create().content)["upload_id"]
+    _put(upload_id, 0, ARCHIVE[:4000])
+    _put(upload_id, 4000, ARCHIVE[4000:])
+    local_storage.delete_batch(_chunks(local_storage, upload_id)[:1])
+
+    with pytest.raises(ValueError, match="missing bytes from 0"):
+        uploads.assemble(UploadSession.objects.get(pk=upload_id))
+
+
+@pytest.mark.django_db
+def test_chunk_after_a_gap_is_rejected_with_resume_offset(local_storage):
+    upload_id = json.loads(_create().content)["upload_id"]
+    _put(upload_id, 0, ARCHIVE[:1000])
+
+    response = _put(upload_id, 5000, ARCHIVE[5000:6000])
+
+    assert response.status_code == 409
+    assert json.loads(response.content)["offset"] == 1000
+    status = json.loads(views.upload_session(RequestFactory().get("/"), upload_id).content)
+    assert status["offset"] == 1000
+
+
+@pytest.mark.django_db
+def test_overtaken_chunk_does_not_move_the_offset_back(local_storage):
+    upload_id = json.loads(_create().content)["upload_id"]
+
+    class Slow(io.BytesIO):
+        """A body during which another chunk of the session arrives."""
+
+        def read(self, size=-1):
+            if self.tell() == 0:
+                uploads.write_chunk(upload_id, 0, io.BytesIO(ARCHIVE[:8000]), 8000)
+            return super().read(size)
+
+    session = uploads.write_chunk(upload_id, 0, Slow(ARCHIVE[:4000]), 4000)
+
+    assert session.offset == 8000
+    assert UploadSession.objects.get(pk=upload_id).offset == 8000
+    assert _put(upload_id, 8000, ARCHIVE[8000:]).status_code == 200
+    assert _complete(upload_id).status_code == 202
+
+
+@pytest.mark.django_db
+def test_incomplete_upload_cannot_be_completed(local_storage):
+    upload_id = json.loads(_create().content)["upload_id"]
+    _put(upload_id, 0, ARCHIVE[:1000])
+
+    assert _complete(upload_id).status_code == 409
+    assert not DeploymentJob.objects.exists()
+
+
+@pytest.mark.django_db
+def test_oversized_upload_is_refused(local_storage, settings):
+    settings.UPLOAD_MAX_SIZE = 100
+    assert _create(size=101).status_code == 413
+
+
+@pytest.mark.django_db
+def test_expired_or_unknown_upload_is_not_found(local_storage, settings):
+    upload_id = json.loads(_create().content)["upload_id"]
+    _put(upload_id, 0, ARCHIVE[:1000])
+    settings.UPLOAD_SESSION_TTL = -1
+
+    assert uploads.expire_sessions() == 1
+
+    assert _chunks(local_storage, upload_id) == []
+    assert _complete(upload_id).status_code == 404
+    with pytest.raises(uploads.ChunkError) as raised:
+        uploads.write_chunk(upload_id, 1000, io.BytesIO(ARCHIVE[1000:2000]), 1000)
+    assert raised.value.status == 404
+
+
+@pytest.mark.django_db
+def test_completed_upload_is_not_expired_before_it_is_deployed(local_storage, settings):
+    upload_id = json.loads(_create().content)["upload_id"]
+    _put(upload_id, 0, ARCHIVE)
+    assert _complete(upload_id).status_code == 202
+    settings.UPLOAD_SESSION_TTL = -1
+
+    assert uploads.expire_sessions() == 0
+    assert _complete(upload_id).status_code == 409
@@ -0,0 +1,55 @@
+"""Synthetic site archives for the upload benchmarks.
+
+Contents are generated from the file's index, so every file is distinct and
+is really uploaded rather than found in storage already.
+"""
+import os
+import zipfile
+
+MB = 1024 * 1024
+
+
+def tiny_files(path, count, size=200):
+    """Many small text files in a flat-ish tree, like a bundled site."""
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for index in range(count):
+            line = f"/* chunk {index} */ console.log({index});\n"
+            body = (line * (size // len(line) + 1))[:size]
+            archive.writestr(f"static/js/dir-{index % 64}/chunk-{index}.js", body)
+        archive.writestr("index.html", "<html><body>home</body></html>")
+    return path
+
+
+def huge_files(path, sizes_mb):
+    """A few large incompressible files, like videos."""
+    # A random 1 MiB pattern does not compress, so inflating a member really
+    # produces that many bytes
+    chunk = os.urandom(MB)
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=1) as archive:
+        for index, size in enumerate(sizes_mb):
+            with archive.open(f"media/video-{index}.mp4", "w", force_zip64=True) as member:
+                for part in range(size):
+                    # Differ per member so no two share a digest
+                    member.write(chunk[:-8] + index.to_bytes(4, "little") + part.to_bytes(4, "little"))
+        archive.writestr("index.html", "<html><body>videos</body></html>")
+    return path
+
+
+def deep_tree(path, depth, fanout, files_per_dir=2):
+    """A tree ``depth`` directories deep with ``fanout`` children each, so
+    paths are long and the manifest has many shared prefixes."""
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        count = 0
+
+        def walk(prefix, level):
+            nonlocal count
+            for index in range(files_per_dir):
+                archive.writestr(f"{prefix}page-{index}.html", f"<p>{prefix} {index}</p>")
+                count += 1
+            if level == depth:
+                return
+            for child in range(fanout):
+                walk(f"{prefix}level-{level}-{child}/", level + 1)
+
+        walk("", 0)
+    return path, count
@@ -0,0 +1,56 @@
+import asyncio
+import os
+
+import pytest
+from azure.storage.blob import BlobServiceClient
+from azure.storage.blob.aio import BlobServiceClient as AsyncBlobServiceClient
+
+from .fake_blob import CONNECTION_STRING, FakeAsyncBlobTransport, FakeBlobStore, FakeBlobTransport
+from .report import PeakRSS
+
+BENCHMARKS_DIR = os.path.dirname(__file__)
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_collection_modifyitems(items):
+    # Marked before pytest applies -m, so the default "not benchmark" skips them
+    for item in items:
+        if str(item.path).startswith(BENCHMARKS_DIR + os.sep):
+            item.add_marker(pytest.mark.benchmark)
+
+
+@pytest.fixture
+def fake_blob_store(monkeypatch, settings):
+    """Points every BlobServiceClient created by the app, sync or asyncio, at
+    an in-process fake."""
+    store = FakeBlobStore()
+    from_connection_string = BlobServiceClient.from_connection_string.__func__
+
+    def patched(cls, conn_str, **kwargs):
+        return from_connection_string(cls, conn_str, transport=FakeBlobTransport(store), **kwargs)
+
+    monkeypatch.setattr(BlobServiceClient, "from_connection_string", classmethod(patched))
+
+    aio_from_connection_string = AsyncBlobServiceClient.from_connection_string.__func__
+
+    def patched_aio(cls, conn_str, **kwargs):
+        transport = kwargs.pop("transport", None)
+        if transport is not None:
+            # Replaced by the fake before it was ever used
+            asyncio.get_running_loop().create_task(transport.close())
+        return aio_from_connection_string(cls, conn_str, transport=FakeAsyncBlobTransport(store), **kwargs)
+
+    monkeypatch.setattr(AsyncBlobServiceClient, "from_connection_string", classmethod(patched_aio))
+    settings.STORAGE_BACKEND = "azure"
+    settings.AZURE_STORAGE_CONNECTION_STRING = CONNECTION_STRING
+    settings.AZURE_STORAGE_ACCOUNT_NAME = "devstoreaccount1"
+    settings.AZURE_STORAGE_ACCOUNT_KEY = CONNECTION_STRING.split("AccountKey=")[1].split(";")[0]
+    settings.AZURE_CONTAINER_NAME = "benchmarks"
+    return store
+
+
+@pytest.fixture
+def peak_rss():
+    if not os.path.exists("/proc/self/statm"):
+        pytest.skip("RSS sampling needs /proc")
+    return PeakRSS
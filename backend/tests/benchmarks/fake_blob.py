@@ -0,0 +1,316 @@
+"""In-process stand-in for the Azure Blob service.
+
+``FakeBlobTransport`` plugs into the real ``BlobServiceClient`` pipeline, so
+benchmarks exercise the SDK's own chunking and request building while the
+"network" is a dictionary. Blob bodies are discarded unless ``keep_data`` is
+set, which keeps the fake itself from dominating memory measurements; only
+kept blobs can be downloaded.
+"""
+import asyncio
+import threading
+import time
+import uuid
+from email.utils import formatdate
+from urllib.parse import parse_qs, unquote, urlparse
+from xml.etree import ElementTree
+
+from azure.core.pipeline.transport import AsyncHttpResponse, AsyncHttpTransport, HttpResponse, HttpTransport
+from azure.core.utils import CaseInsensitiveDict
+
+# Well-known Azurite development account, accepted by the SDK's connection string parser.
+CONNECTION_STRING = (
+    "DefaultEndpointsProtocol=http;AccountName=devstoreaccount1;"
+    "AccountKey=Eby8vdM02xNOcqFlqUwJPLlmEtlCDXJ1OUzFT50uSRZ6IFsuFq2UVErCz4I6tq/K1SZFPTOtr/KBHBeksoGMGw==;"
+    "BlobEndpoint=http://127.0.0.1:10000/devstoreaccount1;"
+)
+
+
+class FakeBlob:
+    def __init__(self, size, content_type, data=None):
+        self.size = size
+        self.content_type = content_type
+        self.data = data
+        self.etag = f'"0x{uuid.uuid4().hex[:16].upper()}"'
+        self.last_modified = formatdate(usegmt=True)
+
+
+class FakeBlobStore:
+    """Blobs and uncommitted blocks, keyed by ``(container, blob name)``."""
+
+    def __init__(self, keep_data=False, latency=0.0):
+        self.keep_data = keep_data
+        self.latency = latency
+        self.blobs = {}
+        self.blocks = {}
+        self.requests = 0
+        self.bytes_received = 0
+        self.lock = threading.Lock()
+
+
+class _FakeResponse(HttpResponse):
+    def __init__(self, request, status_code, headers=None, body=b""):
+        super().__init__(request, None)
+        self.status_code = status_code
+        self.reason = "OK" if status_code < 400 else "Error"
+        self.headers = CaseInsensitiveDict(headers or {})
+        self.headers.setdefault("x-ms-request-id", str(uuid.uuid4()))
+        self.headers.setdefault("x-ms-version", "2021-08-06")
+        self.content_type = self.headers.get("content-type")
+        self._body = body
+
+    def body(self):
+        return self._body
+
+    def stream_download(self, pipeline, **kwargs):
+        return _Chunks(self)
+
+
+class _Chunks:
+    """Body iterator; the SDK sets and reads attributes on it, so it cannot
+    be a plain iterator."""
+
+    def __init__(self, response):
+        self.response = response
+        self.content_length = len(response._body)
+        self._chunks = iter([response._body])
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._chunks)
+
+
+def _read_body(request):
+    data = request.data if request.data is not None else request.files
+    if data is None:
+        return b""
+    if isinstance(data, (bytes, bytearray)):
+        return bytes(data)
+    if isinstance(data, str):
+        return data.encode()
+    return data.read()
+
+
+class FakeBlobTransport(HttpTransport):
+    def __init__(self, store):
+        self.store = store
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def _error(self, request, status_code, code):
+        return _FakeResponse(request, status_code, {"x-ms-error-code": code})
+
+    def send(self, request, **kwargs):
+        if self.store.latency:
+            time.sleep(self.store.latency)
+        return self.handle(request)
+
+    def handle(self, request):
+        store = self.store
+        url = urlparse(request.url)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        # Path is /<account>/<container>[/<blob>]
+        parts = unquote(url.path).lstrip("/").split("/", 2)
+        container = parts[1] if len(parts) > 1 else ""
+        blob = parts[2] if len(parts) > 2 else None
+        with store.lock:
+            store.requests += 1
+        if blob is None:
+            return self._container(request, container, query)
+        return self._blob(request, (container, blob), query)
+
+    def _container(self, request, container, query):
+        if query.get("restype") == "container" and query.get("comp") == "list" and request.method == "GET":
+            return self._list(request, container, query)
+        if query.get("restype") == "container" and query.get("comp") == "batch" and request.method == "POST":
+            return self._batch(request, container)
+        if query.get("restype") == "container" and request.method in ("GET", "HEAD"):
+            return _FakeResponse(
+                request, 200, {"ETag": '"0x1"', "Last-Modified": formatdate(usegmt=True)}
+            )
+        return self._error(request, 400, "UnsupportedFakeOperation")
+
+    def _list(self, request, container, query):
+        """One page of List Blobs, in name order after ``marker``."""
+        prefix, marker = query.get("prefix", ""), query.get("marker", "")
+        limit = int(query.get("maxresults", 5000))
+        with self.store.lock:
+            names = sorted(
+                name for (blob_container, name) in self.store.blobs
+                if blob_container == container and name.startswith(prefix) and name > marker
+            )
+            page = [(name, self.store.blobs[(container, name)]) for name in names[:limit]]
+        root = ElementTree.Element("EnumerationResults", ContainerName=container)
+        ElementTree.SubElement(root, "Prefix").text = prefix
+        ElementTree.SubElement(root, "MaxResults").text = str(limit)
+        blobs = ElementTree.SubElement(root, "Blobs")
+        for name, blob in page:
+            element = ElementTree.SubElement(blobs, "Blob")
+            ElementTree.SubElement(element, "Name").text = name
+            properties = ElementTree.SubElement(element, "Properties")
+            ElementTree.SubElement(properties, "Content-Length").text = str(blob.size)
+            ElementTree.SubElement(properties, "Etag").text = blob.etag
+            ElementTree.SubElement(properties, "Last-Modified").text = blob.last_modified
+            ElementTree.SubElement(properties, "BlobType").text = "BlockBlob"
+        # The service's marker is opaque; the last name returned serves here
+        ElementTree.SubElement(root, "NextMarker").text = page[-1][0] if len(names) > limit else ""
+        body = ElementTree.tostring(root, encoding="utf-8", xml_declaration=True)
+        return _FakeResponse(request, 200, {"Content-Type": "application/xml"}, body)
+
+    def _batch(self, request, container):
+        """Blob Batch of Delete Blob sub-requests, answered in order."""
+        boundary = request.headers["Content-Type"].partition("boundary=")[2]
+        parts = []
+        for part in _read_body(request).decode().split(f"--{boundary}")[1:-1]:
+            request_line = part.strip().split("\r\n\r\n", 1)[1].split("\r\n", 1)[0]
+            method, path, _ = request_line.split(" ")
+            # /<account>/<container>/<blob>?
+            name = unquote(path.partition("?")[0]).lstrip("/").split("/", 2)[2]
+            with self.store.lock:
+                found = self.store.blobs.pop((container, name), None) is not None
+            status = "202 Accepted" if method == "DELETE" and found else "404 The specified blob does not exist."
+            parts.append(
+                f"Content-Type: application/http\r\nContent-ID: {len(parts)}\r\n\r\n"
+                f"HTTP/1.1 {status}\r\nx-ms-request-id: {uuid.uuid4()}\r\nx-ms-version: 2021-08-06\r\n"
+                + ("" if found else "x-ms-error-code: BlobNotFound\r\n")
+                + "\r\n"
+            )
+        response_boundary = f"batchresponse_{uuid.uuid4()}"
+        body = "".join(f"--{response_boundary}\r\n{part}\r\n" for part in parts) + f"--{response_boundary}--\r\n"
+        headers = {"Content-Type": f"multipart/mixed; boundary={response_boundary}"}
+        return _FakeResponse(request, 202, headers, body.encode())
+
+    def _blob(self, request, key, query):
+        store = self.store
+        comp = query.get("comp")
+        if request.method == "PUT" and comp == "block":
+            body = _read_body(request)
+            with store.lock:
+                store.bytes_received += len(body)
+                store.blocks[(key, query["blockid"])] = body if store.keep_data else len(body)
+            return _FakeResponse(request, 201)
+        if request.method == "PUT" and comp == "blocklist":
+            ids = [el.text for el in ElementTree.fromstring(_read_body(request))]
+            with store.lock:
+                staged = [store.blocks.pop((key, block_id)) for block_id in ids]
+                if store.keep_data:
+                    data = b"".join(staged)
+                    size = len(data)
+                else:
+                    data, size = None, sum(staged)
+                blob = store.blobs[key] = FakeBlob(size, request.headers.get("x-ms-blob-content-type"), data)
+            return _FakeResponse(request, 201, {"ETag": blob.etag, "Last-Modified": blob.last_modified})
+        if request.method == "PUT" and comp is None:
+            body = _read_body(request)
+            with store.lock:
+                store.bytes_received += len(body)
+                blob = store.blobs[key] = FakeBlob(
+                    len(body), request.headers.get("x-ms-blob-content-type"), body if store.keep_data else None
+                )
+            return _FakeResponse(request, 201, {"ETag": blob.etag, "Last-Modified": blob.last_modified})
+
+        blob = store.blobs.get(key)
+        if blob is None:
+            return self._error(request, 404, "BlobNotFound")
+        headers = {
+            "Content-Length": str(blob.size),
+            "Content-Type": blob.content_type or "application/octet-stream",
+            "ETag": blob.etag,
+            "Last-Modified": blob.last_modified,
+            "x-ms-blob-type": "BlockBlob",
+        }
+        if request.method == "HEAD":
+            return _FakeResponse(request, 200, headers)
+        if request.method == "DELETE":
+            with store.lock:
+                store.blobs.pop(key, None)
+            return _FakeResponse(request, 202)
+        if request.method == "GET" and comp is None and blob.data is not None:
+            return self._download(request, blob, headers)
+        return self._error(request, 400, "UnsupportedFakeOperation")
+
+    def _download(self, request, blob, headers):
+        requested = request.headers.get("x-ms-range") or request.headers.get("Range")
+        if not requested:
+            return _FakeResponse(request, 200, headers, blob.data)
+        first, _, last = requested.removeprefix("bytes=").partition("-")
+        first = int(first)
+        last = min(int(last), blob.size - 1) if last else blob.size - 1
+        if first >= blob.size:
+            return self._error(request, 416, "InvalidRange")
+        body = blob.data[first:last + 1]
+        content_range = f"bytes {first}-{last}/{blob.size}"
+        headers = dict(headers, **{"Content-Length": str(len(body)), "Content-Range": content_range})
+        return _FakeResponse(request, 206, headers, body)
+
+
+class _FakeAsyncResponse(AsyncHttpResponse):
+    def __init__(self, response):
+        super().__init__(response.request, None)
+        self.status_code = response.status_code
+        self.reason = response.reason
+        self.headers = response.headers
+        self.content_type = response.content_type
+        self._body = response._body
+
+    def body(self):
+        return self._body
+
+    async def load_body(self):
+        pass
+
+    def stream_download(self, pipeline, **kwargs):
+        return _AsyncChunks(self)
+
+    async def close(self):
+        pass
+
+
+class _AsyncChunks(_Chunks):
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._chunks)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakeAsyncBlobTransport(AsyncHttpTransport):
+    """The fake for the SDK's asyncio clients. Latency is awaited, so
+    concurrent requests overlap the way they do against the real service."""
+
+    def __init__(self, store):
+        self.store = store
+        self._transport = FakeBlobTransport(store)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    async def open(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def send(self, request, **kwargs):
+        if self.store.latency:
+            await asyncio.sleep(self.store.latency)
+        if hasattr(request.data, "__aiter__"):
+            request.data = b"".join([chunk async for chunk in request.data])
+        return _FakeAsyncResponse(self._transport.handle(request))
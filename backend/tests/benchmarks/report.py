@@ -0,0 +1,157 @@
+"""Measurements and baselines shared by the benchmarks.
+
+``measure`` times a block and samples its peak RSS; ``Result.report`` prints
+throughput, memory and latency percentiles and compares them with the saved
+baseline in ``baselines.json``::
+
+    # Record new baselines after an intended change, and commit the file
+    BENCH_SAVE_BASELINE=1 python3 -m pytest -m benchmark -s backend/tests/benchmarks/test_upload_pipeline.py
+
+    # Fail when a result is more than BENCH_TOLERANCE (default 0.25) worse
+    BENCH_FAIL_ON_REGRESSION=1 python3 -m pytest -m benchmark -s backend/tests/benchmarks/test_upload_pipeline.py
+
+Baselines depend on the machine they were recorded on, so only compare runs
+from the same one.
+"""
+import json
+import os
+import statistics
+import threading
+import time
+from contextlib import contextmanager
+
+MB = 1024 * 1024
+BASELINES = os.path.join(os.path.dirname(__file__), "baselines.json")
+TOLERANCE = float(os.environ.get("BENCH_TOLERANCE", 0.25))
+
+# Metric -> whether larger is better
+METRICS = {
+    "files_per_s": True,
+    "mb_per_s": True,
+    "peak_rss_growth_mb": False,
+    "p50_ms": False,
+    "p90_ms": False,
+    "p99_ms": False,
+}
+
+
+def current_rss():
+    """Resident set size of this process in bytes, read from /proc."""
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+class PeakRSS:
+    """Samples RSS on a background thread and records the high-water mark
+    above the level at entry."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.baseline = 0
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, current_rss())
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self.baseline = self.peak = current_rss()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+    @property
+    def growth(self):
+        return self.peak - self.baseline
+
+
+def percentiles(samples):
+    """Returns the p50, p90 and p99 of ``samples``, in their unit."""
+    if len(samples) < 2:
+        value = samples[0] if samples else 0.0
+        return value, value, value
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return cuts[49], cuts[89], cuts[98]
+
+
+class Result:
+    """What one benchmark run moved, how long it took and what it cost."""
+
+    def __init__(self, name):
+        self.name = name
+        self.files = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.rss_growth = 0
+        self.latencies = []
+
+    def metrics(self):
+        p50, p90, p99 = percentiles(self.latencies)
+        seconds = self.seconds or float("inf")
+        return {
+            "files_per_s": round(self.files / seconds, 1),
+            "mb_per_s": round(self.bytes / MB / seconds, 2),
+            "peak_rss_growth_mb": round(self.rss_growth / MB, 1),
+            "p50_ms": round(p50 * 1000, 2),
+            "p90_ms": round(p90 * 1000, 2),
+            "p99_ms": round(p99 * 1000, 2),
+        }
+
+    def report(self):
+        """Prints the result next to its baseline, saves it as the new
+        baseline if asked to, and returns the metrics that regressed."""
+        metrics = self.metrics()
+        baselines = load_baselines()
+        baseline = baselines.get(self.name, {})
+        print(f"\n{self.name}: {self.files} files, {self.bytes / MB:.1f} MiB in {self.seconds:.2f}s")
+        regressions = []
+        for metric, value in metrics.items():
+            line = f"  {metric:<20} {value:>10}"
+            previous = baseline.get(metric)
+            if previous:
+                change = (value - previous) / previous
+                line += f"   baseline {previous:>10}  {change:+.0%}"
+                worse = -change if METRICS[metric] else change
+                if worse > TOLERANCE:
+                    regressions.append(metric)
+                    line += "  REGRESSION"
+            print(line)
+        if os.environ.get("BENCH_SAVE_BASELINE"):
+            baselines[self.name] = metrics
+            save_baselines(baselines)
+        elif regressions and os.environ.get("BENCH_FAIL_ON_REGRESSION"):
+            raise AssertionError(f"{self.name} regressed beyond {TOLERANCE:.0%}: {', '.join(regressions)}")
+        return regressions
+
+
+@contextmanager
+def measure(name):
+    """Times the block and samples peak RSS while it runs; yields the
+    ``Result`` for the block to fill in with what it moved."""
+    result = Result(name)
+    with PeakRSS() as rss:
+        start = time.perf_counter()
+        yield result
+        result.seconds = time.perf_counter() - start
+    result.rss_growth = rss.growth
+
+
+def load_baselines():
+    try:
+        with open(BASELINES) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baselines(baselines):
+    with open(BASELINES, "w") as file:
+        json.dump(dict(sorted(baselines.items())), file, indent=2)
+        file.write("\n")
@@ -0,0 +1,74 @@
+"""Thread-pool vs asyncio uploads of an archive of many small files.
+
+With ``BENCH_LATENCY_MS`` of simulated round trip per request, the thread
+pool is bounded by ``STORAGE_UPLOAD_CONCURRENCY`` requests in flight and the
+asyncio backend by ``STORAGE_ASYNC_CONCURRENCY``. Either is also bounded by
+CPU, about a millisecond per request in the SDK plus the Brotli variants:
+at a few milliseconds of latency both reach the same rate, so the default
+latency is that of a distant region::
+
+    BENCH_FILES=5000 BENCH_LATENCY_MS=20 python3 -m pytest -m benchmark -s \
+        backend/tests/benchmarks/test_async_upload.py
+"""
+import asyncio
+import os
+
+import pytest
+from relecloud.aio_storage import AsyncAzureStorageBackend
+from relecloud.azure_storage import AzureStorageBackend
+from relecloud.manifest import Manifest
+
+from .archives import tiny_files
+from .report import measure
+
+FILES = int(os.environ.get("BENCH_FILES", 1000))
+LATENCY = int(os.environ.get("BENCH_LATENCY_MS", 50)) / 1000
+FOLDER = "projects/1/deployments/bench"
+
+
+@pytest.fixture(scope="module")
+def archive(tmp_path_factory):
+    return tiny_files(tmp_path_factory.mktemp("archives") / "tiny.zip", FILES, size=2000)
+
+
+def _manifest(store, manifest_name):
+    return Manifest.from_bytes(store.blobs[("benchmarks", manifest_name)].data)
+
+
+def test_sync_upload(archive, fake_blob_store, peak_rss, settings):
+    fake_blob_store.latency = LATENCY
+    fake_blob_store.keep_data = True
+    backend = AzureStorageBackend()
+
+    with measure(f"sync_upload[{settings.STORAGE_UPLOAD_CONCURRENCY}]") as result, open(archive, "rb") as file:
+        manifest_name = backend.upload_file(file, "site.zip", is_zip=True, folder_name=FOLDER)
+    result.files, result.bytes = FILES + 1, os.path.getsize(archive)
+
+    assert len(_manifest(fake_blob_store, manifest_name)) == FILES + 1
+    result.report()
+
+
+@pytest.mark.parametrize("concurrency", [64, 256])
+def test_async_upload(archive, fake_blob_store, peak_rss, concurrency):
+    fake_blob_store.latency = LATENCY
+    fake_blob_store.keep_data = True
+
+    async def upload():
+        async with AsyncAzureStorageBackend(concurrency) as backend:
+            with open(archive, "rb") as file:
+                return await backend.upload_zip(file, FOLDER)
+
+    with measure(f"async_upload[{concurrency}]") as result:
+        manifest_name = asyncio.run(upload())
+    result.files, result.bytes = FILES + 1, os.path.getsize(archive)
+
+    manifest = _manifest(fake_blob_store, manifest_name)
+    assert len(manifest) == FILES + 1
+    # Stored exactly as the thread-pool backend stores it
+    entry = manifest.lookup("static/js/dir-0/chunk-0.js")
+    assert ("benchmarks", f"objects/{entry.digest}") in fake_blob_store.blobs
+    assert set(entry.encodings) and all(
+        ("benchmarks", f"objects/{entry.digest}.{'gz' if encoding == 'gzip' else encoding}") in fake_blob_store.blobs
+        for encoding in entry.encodings
+    )
+    result.report()
@@ -0,0 +1,45 @@
+"""Deleting a project's prefix: batch requests vs one request per blob.
+
+``BENCH_BLOBS`` blobs are stored under one project's prefix of the fake Blob
+service, with ``BENCH_LATENCY_MS`` of simulated round trip per request, and
+deleted by ``cleanup.delete_prefix``::
+
+    BENCH_BLOBS=20000 BENCH_LATENCY_MS=20 python3 -m pytest -m benchmark -s backend/tests/benchmarks/test_cleanup.py
+"""
+import os
+
+import pytest
+from relecloud.azure_storage import AzureStorageBackend
+from relecloud.cleanup import delete_prefix
+from relecloud.storage import StorageBackend
+
+from .fake_blob import FakeBlob
+from .report import measure
+
+BLOBS = int(os.environ.get("BENCH_BLOBS", 2000))
+LATENCY = int(os.environ.get("BENCH_LATENCY_MS", 5)) / 1000
+
+
+@pytest.mark.parametrize("mode", ["batch", "single"])
+def test_delete_prefix(fake_blob_store, peak_rss, monkeypatch, mode):
+    for index in range(BLOBS):
+        fake_blob_store.blobs[("benchmarks", f"projects/1/deployments/d{index % 50}/file-{index}")] = FakeBlob(1, None)
+    fake_blob_store.blobs[("benchmarks", "projects/2/deployments/d0/manifest.bin")] = FakeBlob(1, None)
+    fake_blob_store.blobs[("benchmarks", "objects/abc")] = FakeBlob(1, None)
+    fake_blob_store.latency = LATENCY
+    backend = AzureStorageBackend()
+    if mode == "single":
+        monkeypatch.setattr(backend, "delete_batch", lambda names: StorageBackend.delete_batch(backend, names))
+    requests = fake_blob_store.requests
+
+    with measure(f"delete_prefix[{mode}]") as result:
+        deleted = delete_prefix(backend, "projects/1/")
+    result.files = BLOBS
+
+    assert deleted == BLOBS
+    kept = sorted(name for _, name in fake_blob_store.blobs)
+    assert kept == ["objects/abc", "projects/2/deployments/d0/manifest.bin"]
+    pages = -(-BLOBS // StorageBackend.DELETE_BATCH_SIZE)
+    # A listing and a batch request per page, or a request per blob
+    assert fake_blob_store.requests - requests == (pages * 2 if mode == "batch" else pages + BLOBS)
+    result.report()
@@ -0,0 +1,47 @@
+"""Garbage collection throughput over a large container.
+
+``BENCH_BLOBS`` blobs are stored in the fake Blob service, a quarter of them
+orphaned objects old enough to collect, with ``BENCH_LATENCY_MS`` of
+simulated round trip per request::
+
+    BENCH_BLOBS=1000000 BENCH_LATENCY_MS=20 python3 -m pytest -m benchmark -s backend/tests/benchmarks/test_garbage.py
+"""
+import hashlib
+import os
+from email.utils import formatdate
+
+import pytest
+from relecloud.azure_storage import AzureStorageBackend
+from relecloud.garbage import run_collection
+
+from .fake_blob import FakeBlob
+from .report import measure
+
+BLOBS = int(os.environ.get("BENCH_BLOBS", 20000))
+LATENCY = int(os.environ.get("BENCH_LATENCY_MS", 5)) / 1000
+
+
+@pytest.mark.django_db
+def test_collect(fake_blob_store, peak_rss, settings):
+    settings.GC_GRACE_PERIOD = 3600
+    old = formatdate(0, usegmt=True)
+    for index in range(BLOBS):
+        digest = hashlib.sha256(str(index).encode()).hexdigest()
+        name = f"objects/{digest}" if index % 4 else f"projects/1/deployments/d{index % 50}/file-{index}"
+        blob = fake_blob_store.blobs[("benchmarks", name)] = FakeBlob(1, None)
+        blob.last_modified = old
+    fake_blob_store.latency = LATENCY
+    backend = AzureStorageBackend()
+    requests = fake_blob_store.requests
+
+    with measure("collect") as result:
+        _, collection = run_collection(backend)
+    result.files = collection.scanned
+
+    # No project exists, so everything old is orphaned
+    assert collection.scanned == collection.deleted == BLOBS
+    assert fake_blob_store.blobs == {}
+    pages = -(-BLOBS // backend.DELETE_BATCH_SIZE)
+    # A listing and a batch delete per page
+    assert fake_blob_store.requests - requests == pages * 2
+    result.report()
@@ -0,0 +1,70 @@
+"""Latency of the project list API at 10k and 1M projects.
+
+Compares the first page, a page deep into the list reached through the
+keyset cursor, and the same deep page fetched with LIMIT/OFFSET for
+reference::
+
+    BENCH_PROJECT_ROWS=10000,1000000 python3 -m pytest -m benchmark -s backend/tests/benchmarks/test_project_list.py
+"""
+import os
+import statistics
+import time
+from datetime import timedelta
+
+import pytest
+from django.test import RequestFactory
+from django.utils import timezone
+from relecloud import views
+from relecloud.models import Project
+from relecloud.pagination import KeysetPagination
+
+ROWS = [int(rows) for rows in os.environ.get("BENCH_PROJECT_ROWS", "10000,1000000").split(",")]
+REPEAT = int(os.environ.get("BENCH_REPEAT", 30))
+PAGE_SIZE = KeysetPagination.page_size
+
+
+def _populate(rows, monkeypatch):
+    # Spread creation times out, the way a real table fills up over time
+    monkeypatch.setattr(Project._meta.get_field("created_at"), "auto_now_add", False)
+    start = timezone.now() - timedelta(seconds=rows)
+    batch = []
+    for index in range(rows):
+        created_at = start + timedelta(seconds=index)
+        batch.append(Project(name=f"Site {index}", description="", file="", created_at=created_at))
+        if len(batch) == 10_000:
+            Project.objects.bulk_create(batch)
+            batch = []
+    Project.objects.bulk_create(batch)
+
+
+def _timed(fn):
+    samples = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), max(samples)
+
+
+def _list_view(**params):
+    response = views.ProjectViewSet.as_view({"get": "list"})(RequestFactory().get("/api/projects/", params))
+    response.render()
+    assert response.status_code == 200
+    return response
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("rows", ROWS)
+def test_project_list_latency(rows, monkeypatch):
+    _populate(rows, monkeypatch)
+    middle = Project.objects.order_by("-created_at", "-id")[rows // 2]
+    cursor = KeysetPagination().encode_cursor(middle)
+
+    first_page = _timed(lambda: _list_view())
+    deep_page = _timed(lambda: _list_view(cursor=cursor))
+    offset_page = _timed(lambda: list(Project.objects.order_by("-created_at", "-id")[rows // 2:rows // 2 + PAGE_SIZE]))
+
+    print(f"\nrows={rows:>8} (p50 / max ms over {REPEAT} runs)")
+    print(f"  first page          {first_page[0]:7.2f} / {first_page[1]:7.2f}")
+    print(f"  keyset, middle      {deep_page[0]:7.2f} / {deep_page[1]:7.2f}")
+    print(f"  offset, middle      {offset_page[0]:7.2f} / {offset_page[1]:7.2f}  (query only, for reference)")
@@ -0,0 +1,93 @@
+"""Staging a ZIP then deploying it vs deploying a tar.gz as it arrives.
+
+The archive arrives at ``BENCH_BANDWIDTH_MBPS`` megabytes per second, and the
+fake Blob service adds ``BENCH_LATENCY_MS`` to every request. A ZIP must be
+received whole before it can be extracted; a tar.gz is extracted and
+uploaded while it is still being received::
+
+    BENCH_FILES=2000 BENCH_BANDWIDTH_MBPS=5 python3 -m pytest -m benchmark -s \\
+        backend/tests/benchmarks/test_tar_stream.py
+"""
+import io
+import os
+import shutil
+import tarfile
+import time
+import zipfile
+
+import pytest
+from relecloud.azure_storage import AzureStorageBackend
+
+from .report import measure
+
+FILES = int(os.environ.get("BENCH_FILES", 500))
+BANDWIDTH = float(os.environ.get("BENCH_BANDWIDTH_MBPS", 5)) * 1024 * 1024
+LATENCY = int(os.environ.get("BENCH_LATENCY_MS", 5)) / 1000
+FILE_SIZE = 16 * 1024
+
+
+class _Network:
+    """Reads ``data`` no faster than ``BANDWIDTH``."""
+
+    def __init__(self, data):
+        self._file = io.BytesIO(data)
+        self._start = time.perf_counter()
+        self._received = 0
+
+    def read(self, size=-1):
+        data = self._file.read(size)
+        self._received += len(data)
+        delay = self._start + self._received / BANDWIDTH - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        return data
+
+
+def _pages():
+    # Incompressible, and of a type not stored precompressed, so both
+    # archives are about as large as the site and time goes to transfers
+    return {f"media/part-{index}.bin": os.urandom(FILE_SIZE) for index in range(FILES)}
+
+
+def _zip(pages):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, content in pages.items():
+            archive.writestr(name, content)
+    return buffer.getvalue()
+
+
+def _tar_gz(pages):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz", compresslevel=1) as archive:
+        for name, content in pages.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("archive", ["zip", "tar.gz"])
+def test_receive_and_deploy(fake_blob_store, peak_rss, tmp_path, archive):
+    pages = _pages()
+    data = _zip(pages) if archive == "zip" else _tar_gz(pages)
+    fake_blob_store.latency = LATENCY
+    backend = AzureStorageBackend()
+
+    with measure(f"receive_and_deploy[{archive}]") as result:
+        body = _Network(data)
+        if archive == "zip":
+            staged = tmp_path / "site.zip"
+            with open(staged, "wb") as file:
+                shutil.copyfileobj(body, file)
+            with open(staged, "rb") as file:
+                backend._upload_zip(file, "site")
+        else:
+            backend._upload_tar(body, "gz", "site")
+    result.files = FILES
+    result.bytes = len(data)
+
+    # Every file plus the manifest
+    assert len(fake_blob_store.blobs) == FILES + 1
+    print(f"\nreceiving alone takes {len(data) / BANDWIDTH:.2f}s")
+    result.report()
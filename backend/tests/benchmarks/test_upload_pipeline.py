@@ -0,0 +1,120 @@
+"""Throughput, memory and latency of the upload pipeline.
+
+Synthetic archives of many tiny files, a few huge files and a deep tree are
+uploaded through ``AzureStorageBackend`` against the fake Blob service, and
+archives are posted to ``upload_project`` and deployed by the job worker.
+Each run reports files/s, MB/s, peak RSS growth and p50/p90/p99 latencies
+(per file for uploads, per request for the view) against ``baselines.json``;
+see ``report.py`` for saving baselines and failing on regressions::
+
+    BENCH_TINY_FILES=20000 python3 -m pytest -m benchmark -s backend/tests/benchmarks/test_upload_pipeline.py
+"""
+import os
+import time
+import zipfile
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory
+from relecloud import views
+from relecloud.azure_storage import AzureStorageBackend
+from relecloud.jobs import run_job
+from relecloud.models import DeploymentJob
+from relecloud.storage import StorageService
+
+from .archives import deep_tree, huge_files, tiny_files
+from .report import measure
+
+TINY_FILES = int(os.environ.get("BENCH_TINY_FILES", 2000))
+HUGE_MB = [int(size) for size in os.environ.get("BENCH_HUGE_MB", "64,32").split(",")]
+DEPTH = int(os.environ.get("BENCH_DEPTH", 6))
+FANOUT = int(os.environ.get("BENCH_FANOUT", 3))
+REQUESTS = int(os.environ.get("BENCH_REQUESTS", 20))
+LATENCY = int(os.environ.get("BENCH_LATENCY_MS", 5)) / 1000
+
+
+@pytest.fixture(scope="module")
+def archives(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("archives")
+    deep, _ = deep_tree(directory / "deep.zip", DEPTH, FANOUT)
+    return {
+        "tiny": tiny_files(directory / "tiny.zip", TINY_FILES),
+        "huge": huge_files(directory / "huge.zip", HUGE_MB),
+        "deep": deep,
+    }
+
+
+@pytest.fixture
+def azure(fake_blob_store, peak_rss, settings, tmp_path):
+    settings.STORAGE_HEALTH_CHECK_INTERVAL = 0
+    settings.STAGING_ROOT = str(tmp_path / "staging")
+    settings.ASSET_CACHE_DIR = str(tmp_path / "asset-cache")
+    fake_blob_store.latency = LATENCY
+    StorageService.reset()
+    yield fake_blob_store
+    StorageService.reset()
+
+
+def _contents(archive_path):
+    with zipfile.ZipFile(archive_path) as archive:
+        members = [member for member in archive.infolist() if not member.is_dir()]
+    return len(members), sum(member.file_size for member in members)
+
+
+def _time_files(backend, latencies):
+    """Records how long each file of an upload takes, variants included."""
+    upload_object = backend._upload_object
+
+    def timed(open_file, path):
+        start = time.perf_counter()
+        try:
+            return upload_object(open_file, path)
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    backend._upload_object = timed
+
+
+@pytest.mark.parametrize("kind", ["tiny", "huge", "deep"])
+def test_archive_upload(archives, azure, settings, kind):
+    backend = AzureStorageBackend()
+    files, size = _contents(archives[kind])
+
+    with measure(f"archive_upload[{kind}]") as result, open(archives[kind], "rb") as archive:
+        _time_files(backend, result.latencies)
+        backend.upload_file(archive, "site.zip", is_zip=True, folder_name="projects/1/deployments/bench")
+    result.files, result.bytes = files, size
+
+    assert len(result.latencies) == files
+    result.report()
+
+
+@pytest.mark.django_db
+def test_upload_project_and_deploy(archives, azure):
+    azure.keep_data = True
+    with open(archives["deep"], "rb") as archive:
+        content = archive.read()
+    files, size = _contents(archives["deep"])
+    factory = RequestFactory()
+
+    with measure("upload_project") as result:
+        for _ in range(REQUESTS):
+            request = factory.post("/api/projects/", {"file": SimpleUploadedFile("site.zip", content)})
+            start = time.perf_counter()
+            response = async_to_sync(views.upload_project)(request)
+            result.latencies.append(time.perf_counter() - start)
+            assert response.status_code == 202
+    result.files, result.bytes = REQUESTS, REQUESTS * len(content)
+    result.report()
+
+    jobs = list(DeploymentJob.objects.filter(status=DeploymentJob.QUEUED))
+    with measure("deployment_job") as result:
+        for job in jobs:
+            start = time.perf_counter()
+            run_job(job)
+            result.latencies.append(time.perf_counter() - start)
+    result.files, result.bytes = len(jobs) * files, len(jobs) * size
+
+    assert DeploymentJob.objects.filter(status=DeploymentJob.SUCCEEDED).count() == REQUESTS
+    result.report()
@@ -0,0 +1,65 @@
+"""Serial vs parallel throughput of archive and folder uploads.
+
+The fake Blob service adds ``BENCH_LATENCY_MS`` to every request to stand in
+for the round trip to a storage account::
+
+    BENCH_FILES=5000 python3 -m pytest -m benchmark -s backend/tests/benchmarks/test_upload_throughput.py
+"""
+import os
+import time
+import zipfile
+
+import pytest
+from relecloud.azure_storage import AzureStorageBackend
+
+FILES = int(os.environ.get("BENCH_FILES", 1000))
+LATENCY = int(os.environ.get("BENCH_LATENCY_MS", 5)) / 1000
+
+
+@pytest.fixture(scope="module")
+def small_files_archive(tmp_path_factory):
+    path = tmp_path_factory.mktemp("archives") / "small.zip"
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for index in range(FILES):
+            archive.writestr(f"site/static/chunk-{index}.js", f"console.log({index});" * 20)
+    return path
+
+
+@pytest.fixture(scope="module")
+def small_files_folder(tmp_path_factory):
+    root = tmp_path_factory.mktemp("site")
+    for index in range(FILES):
+        directory = root / f"dir-{index % 50}"
+        directory.mkdir(exist_ok=True)
+        (directory / f"page-{index}.html").write_text(f"<p>{index}</p>")
+    return root
+
+
+@pytest.mark.parametrize("concurrency", [1, 8, 32])
+def test_zip_upload_throughput(small_files_archive, fake_blob_store, settings, concurrency):
+    settings.STORAGE_UPLOAD_CONCURRENCY = concurrency
+    fake_blob_store.latency = LATENCY
+    backend = AzureStorageBackend()
+
+    start = time.perf_counter()
+    with open(small_files_archive, "rb") as archive:
+        backend._upload_zip(archive, "site")
+    elapsed = time.perf_counter() - start
+
+    # An object per file, their contents all differing, plus the manifest
+    assert len(fake_blob_store.blobs) == FILES + 1
+    print(f"\nzip    concurrency={concurrency:>2} {FILES / elapsed:8.1f} files/s ({elapsed:.2f}s)")
+
+
+@pytest.mark.parametrize("concurrency", [1, 8, 32])
+def test_folder_upload_throughput(small_files_folder, fake_blob_store, settings, concurrency):
+    settings.STORAGE_UPLOAD_CONCURRENCY = concurrency
+    fake_blob_store.latency = LATENCY
+    backend = AzureStorageBackend()
+
+    start = time.perf_counter()
+    backend._upload_folder(str(small_files_folder), "site")
+    elapsed = time.perf_counter() - start
+
+    assert len(fake_blob_store.blobs) == FILES + 1
+    print(f"\nfolder concurrency={concurrency:>2} {FILES / elapsed:8.1f} files/s ({elapsed:.2f}s)")
@@ -13,3 +13,14 @@ def test_config_imports():
             run()
 
     assert excinfo.value.args[0] == 0
+
+
+def test_asgi_config_imports():
+    pytest.importorskip("uvicorn_worker")
+    argv = ["gunicorn", "--check-config", "project.asgi:application", "-c", "backend/gunicorn.asgi.conf.py"]
+
+    with mock.patch.object(sys, "argv", argv):
+        with pytest.raises(SystemExit) as excinfo:
+            run()
+
+    assert excinfo.value.args[0] == 0
@@ -0,0 +1,82 @@
+import io
+import json
+import logging
+
+from project.log import BackgroundHandler, JsonFormatter, SamplingFilter, parse_levels
+
+
+def _logger(name, handler):
+    logger = logging.getLogger(name)
+    logger.handlers = [handler]
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    return logger
+
+
+def test_background_handler_writes_on_its_own_thread():
+    stream = io.StringIO()
+    handler = BackgroundHandler(stream=stream)
+    handler.setFormatter(logging.Formatter("%(levelname)s %(message)s"))
+    logger = _logger("tests.log.background", handler)
+
+    logger.info("deployed %s", "site")
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        logger.exception("failed")
+    handler.stop()
+
+    lines = stream.getvalue()
+    assert lines.startswith("INFO deployed site\nERROR failed\nTraceback")
+    assert "ValueError: boom" in lines
+
+
+def test_background_handler_drops_when_full():
+    stream = io.StringIO()
+    handler = BackgroundHandler(queue_size=1, stream=stream)
+    # Not started, so nothing drains the queue
+    handler._ensure_started = lambda: None
+    logger = _logger("tests.log.full", handler)
+
+    for i in range(3):
+        logger.info("line %d", i)
+    assert handler.dropped == 2
+
+    handler.queue.get_nowait()
+    logger.info("line 3")
+    assert handler.queue.get_nowait().msg == "line 3 [2 log lines dropped]"
+
+
+def test_sampling_filter_passes_one_record_in_rate():
+    stream = io.StringIO()
+    handler = BackgroundHandler(stream=stream)
+    logger = _logger("tests.log.sampled", handler)
+    logger.filters = [SamplingFilter(rate=3)]
+
+    for i in range(7):
+        logger.debug("File uploaded: %d", i)
+    handler.stop()
+
+    assert stream.getvalue().splitlines() == [
+        "File uploaded: 2 (2 more like it)",
+        "File uploaded: 5 (2 more like it)",
+    ]
+
+
+def test_json_formatter_includes_extra_fields():
+    record = logging.makeLogRecord(
+        {"name": "relecloud.jobs", "levelname": "INFO", "msg": "job %s done", "args": (7,), "project_id": 3}
+    )
+
+    entry = json.loads(JsonFormatter().format(record))
+
+    assert entry["message"] == "job 7 done"
+    assert entry["logger"] == "relecloud.jobs"
+    assert entry["project_id"] == 3
+
+
+def test_parse_levels():
+    assert parse_levels("relecloud=debug, django.db.backends=WARNING,,bad") == {
+        "relecloud": "DEBUG",
+        "django.db.backends": "WARNING",
+    }
@@ -0,0 +1,54 @@
+import hashlib
+
+import pytest
+from relecloud.manifest import Entry, Manifest
+
+
+def _entry(path, content=b"x", content_type="text/html", encodings=None):
+    return Entry(path, len(content), hashlib.sha256(content).hexdigest(), content_type, encodings or {})
+
+
+def test_manifest_round_trip():
+    entries = [
+        _entry("index.html", b"<h1>hi</h1>", encodings={"gzip": 30, "br": 25}),
+        _entry("assets/app.js", b"console.log(1)", "text/javascript"),
+        _entry("data.bin", b"\x00", None),
+        _entry("café/menu.html", b"menu"),
+    ]
+
+    manifest = Manifest.from_bytes(Manifest.build(entries, 1700000000.5).to_bytes())
+
+    assert len(manifest) == 4
+    assert manifest.created == 1700000000.5
+    assert [entry.path for entry in manifest] == sorted(entry.path for entry in entries)
+    assert manifest.lookup("index.html") == entries[0]
+    assert manifest.lookup("café/menu.html") == entries[3]
+    assert manifest.lookup("data.bin").content_type == "application/octet-stream"
+    assert manifest.lookup("missing.html") is None
+    assert "assets/app.js" in manifest
+    assert manifest.total_size == sum(entry.size for entry in entries)
+    assert manifest.digests() == {entry.digest for entry in entries}
+
+
+def test_empty_manifest():
+    manifest = Manifest.from_bytes(Manifest.build([], 0).to_bytes())
+    assert len(manifest) == 0
+    assert manifest.lookup("index.html") is None
+
+
+def test_large_manifest_is_compact():
+    entries = [_entry(f"pages/{i:06d}/index.html", str(i).encode()) for i in range(100_000)]
+
+    data = Manifest.build(entries, 0).to_bytes()
+    manifest = Manifest.from_bytes(data)
+
+    # Path bytes plus about 60 bytes of columns per file
+    assert len(data) < sum(len(entry.path) for entry in entries) + 70 * len(entries)
+    assert manifest.lookup("pages/054321/index.html") == entries[54321]
+    assert manifest.lookup("pages/054321") is None
+
+
+@pytest.mark.parametrize("data", [b"", b"nope", Manifest.build([_entry("a")], 0).to_bytes()[:-1]])
+def test_invalid_manifest(data):
+    with pytest.raises(ValueError):
+        Manifest.from_bytes(data)
@@ -0,0 +1,78 @@
+import json
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+from project.startup import ImportProfiler
+
+BACKEND_DIR = os.path.join(os.path.dirname(__file__), "..", "..")
+# Worker boot, creating the WSGI application and loading the URL
+# configuration, must stay within this many seconds
+BUDGET = float(os.environ.get("STARTUP_BUDGET_SECONDS", 3))
+HEAVY_MODULES = ["azure.storage.blob", "azure.monitor.opentelemetry", "aiohttp"]
+
+BOOT = textwrap.dedent(
+    f"""
+    import json, sys, time
+    start = time.perf_counter()
+    import project.wsgi
+    seconds = time.perf_counter() - start
+    print(json.dumps({{"seconds": seconds, "imported": [name for name in {HEAVY_MODULES!r} if name in sys.modules]}}))
+    """
+)
+
+
+def _boot(**env):
+    environment = dict(os.environ, DJANGO_SETTINGS_MODULE="project.settings", PYTHONPATH=BACKEND_DIR, **env)
+    # The application is created twice and the second boot measured, so
+    # the time does not depend on whether the first found .pyc files on disk
+    for _ in range(2):
+        process = subprocess.run(
+            [sys.executable, "-c", BOOT], cwd=BACKEND_DIR, env=environment, capture_output=True, text=True, timeout=60
+        )
+        assert process.returncode == 0, process.stderr
+    return json.loads(process.stdout.splitlines()[-1]), process.stderr
+
+
+def test_boot_is_within_budget_and_skips_heavy_sdks():
+    result, _ = _boot(STARTUP_PROFILE="False", APPLICATIONINSIGHTS_CONNECTION_STRING="")
+
+    assert result["imported"] == []
+    assert result["seconds"] < BUDGET, f"Booting took {result['seconds']:.2f}s, the budget is {BUDGET}s"
+
+
+def test_startup_profile_is_logged():
+    _, stderr = _boot(STARTUP_PROFILE="True", APPLICATIONINSIGHTS_CONNECTION_STRING="")
+
+    assert "Startup took" in stderr
+    assert "urlconf" in stderr
+    assert "modules imported, slowest first" in stderr
+
+
+@pytest.fixture
+def package(tmp_path, monkeypatch):
+    (tmp_path / "startup_sample").mkdir()
+    (tmp_path / "startup_sample" / "__init__.py").write_text("from . import child\n")
+    (tmp_path / "startup_sample" / "child.py").write_text("import time\ntime.sleep(0.02)\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    yield "startup_sample"
+    for name in ("startup_sample", "startup_sample.child"):
+        sys.modules.pop(name, None)
+
+
+def test_import_profiler_separates_self_and_nested_time(package):
+    with ImportProfiler() as profiler:
+        with profiler.phase("import"):
+            module = __import__(package)
+
+    own, cumulative = profiler.modules["startup_sample"]
+    child_own, child_cumulative = profiler.modules["startup_sample.child"]
+    assert child_own == child_cumulative >= 0.02
+    assert cumulative >= child_cumulative > own
+    assert profiler.phases[0][0] == "import"
+    assert "startup_sample.child" in profiler.report()
+    # Once imported, modules keep their real loaders
+    assert type(module.__loader__).__name__ == "SourceFileLoader"
+    assert profiler not in sys.meta_path
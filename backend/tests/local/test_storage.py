@@ -0,0 +1,343 @@
+import gzip
+import io
+import os
+import tarfile
+import threading
+import zipfile
+
+import pytest
+from django.http import Http404
+from django.test import RequestFactory
+from relecloud import compression, views
+from relecloud.storage import (
+    AssetCache,
+    LocalStorageBackend,
+    StorageService,
+    UploadEngine,
+    UploadFailed,
+)
+
+
+def test_upload_engine_returns_results_by_name():
+    tasks = ((f"file-{i}", lambda i=i: i * 2) for i in range(50))
+    results = UploadEngine(max_workers=4).run(tasks)
+    assert results == {f"file-{i}": i * 2 for i in range(50)}
+
+
+def test_upload_engine_stops_after_first_failure():
+    started = []
+    lock = threading.Lock()
+
+    def task(i):
+        with lock:
+            started.append(i)
+        if i == 3:
+            raise RuntimeError("boom")
+        return i
+
+    tasks = ((f"file-{i}", lambda i=i: task(i)) for i in range(1000))
+    with pytest.raises(UploadFailed) as excinfo:
+        UploadEngine(max_workers=2).run(tasks)
+
+    assert list(excinfo.value.errors) == ["file-3"]
+    assert isinstance(excinfo.value, ValueError)
+    # Only the bounded look-ahead window was ever started
+    assert len(started) < 20
+
+
+class FakeBackend:
+    created = 0
+
+    def __init__(self):
+        FakeBackend.created += 1
+        self.healthy = True
+
+    def check_health(self):
+        if not self.healthy:
+            raise ValueError("Container default-container not found")
+
+
+@pytest.fixture
+def storage_service(monkeypatch, settings):
+    settings.STORAGE_HEALTH_CHECK_INTERVAL = 0
+    monkeypatch.setattr(StorageService, "_create_backend", staticmethod(FakeBackend))
+    StorageService.reset()
+    yield StorageService
+    StorageService.reset()
+
+
+def test_storage_backend_is_created_once_per_process(storage_service):
+    created = FakeBackend.created
+    backend = storage_service.get_storage_backend()
+    assert storage_service.get_storage_backend() is backend
+    assert FakeBackend.created == created + 1
+
+
+def test_unhealthy_storage_backend_is_replaced(storage_service):
+    backend = storage_service.get_storage_backend()
+    backend.healthy = False
+
+    assert not storage_service._check_health(backend)
+    assert storage_service.get_storage_backend() is not backend
+
+
+@pytest.fixture
+def local_backend(tmp_path, settings):
+    settings.MEDIA_ROOT = str(tmp_path / "media")
+    return LocalStorageBackend()
+
+
+def _write_site(path, pages):
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("assets/", "")
+        for name, content in pages.items():
+            archive.writestr(name, content)
+    return path
+
+
+def test_local_backend_uploads_zip_content_addressed(tmp_path, local_backend):
+    archive_path = _write_site(
+        tmp_path / "site.zip", {"index.html": "<html></html>", "assets/app.js": "console.log(1);"}
+    )
+
+    with open(archive_path, "rb") as archive:
+        index_name = local_backend.upload_file(archive, "site", is_zip=True)
+
+    assert index_name == "site/manifest.bin"
+    manifest = local_backend.read_manifest("site/manifest.bin")
+    assert [entry.path for entry in manifest] == ["assets/app.js", "index.html"]
+    with local_backend.open(f"objects/{manifest.lookup('assets/app.js').digest}") as file:
+        assert file.read() == b"console.log(1);"
+    # Nothing but the uploaded files is left behind
+    assert os.listdir(local_backend.path("site")) == ["manifest.bin"]
+    assert len(os.listdir(local_backend.path("objects"))) == 2
+
+
+class _ForwardOnly:
+    """A request body: it can only be read."""
+
+    def __init__(self, data):
+        self._file = io.BytesIO(data)
+
+    def read(self, size=-1):
+        return self._file.read(size)
+
+
+def _tar(pages, compression):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz" if compression == "gz" else "w") as archive:
+        directory = tarfile.TarInfo("./assets")
+        directory.type = tarfile.DIRTYPE
+        archive.addfile(directory)
+        for name, content in pages.items():
+            info = tarfile.TarInfo(f"./{name}")
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+    data = buffer.getvalue()
+    if compression == "zst":
+        zstandard = pytest.importorskip("zstandard")
+        data = zstandard.ZstdCompressor().compress(data)
+    return data
+
+
+@pytest.mark.parametrize("suffix, compression", [(".tar", ""), (".tar.gz", "gz"), (".tar.zst", "zst")])
+def test_local_backend_uploads_tar_read_forward_only(local_backend, suffix, compression):
+    # Larger than the in-memory buffer for one member
+    large = os.urandom(local_backend.TAR_MEMBER_MEMORY_MAX + 1)
+    data = _tar({"index.html": b"<html></html>", "assets/video.mp4": large}, compression)
+
+    manifest_name = local_backend.upload_file(_ForwardOnly(data), f"site{suffix}", folder_name="site")
+
+    assert manifest_name == "site/manifest.bin"
+    manifest = local_backend.read_manifest(manifest_name)
+    assert [entry.path for entry in manifest] == ["assets/video.mp4", "index.html"]
+    with local_backend.open(f"objects/{manifest.lookup('assets/video.mp4').digest}") as file:
+        assert file.read() == large
+
+
+def test_invalid_tar_is_rejected(local_backend):
+    with pytest.raises(ValueError, match="not a valid tar archive"):
+        local_backend.upload_file(_ForwardOnly(b"not a tar" * 100), "site.tar.gz", folder_name="site")
+
+
+def test_redeploy_only_uploads_changed_files(tmp_path, local_backend, monkeypatch):
+    first = _write_site(tmp_path / "v1.zip", {"index.html": "v1", "app.js": "same"})
+    second = _write_site(tmp_path / "v2.zip", {"index.html": "v2", "app.js": "same"})
+    with open(first, "rb") as archive:
+        local_backend.upload_file(archive, "site", is_zip=True)
+
+    uploaded = []
+    upload_file = local_backend._upload_file
+    monkeypatch.setattr(
+        local_backend,
+        "_upload_file",
+        lambda file, name, **kwargs: uploaded.append(name) or upload_file(file, name, **kwargs),
+    )
+    with open(second, "rb") as archive:
+        local_backend.upload_file(archive, "site", is_zip=True)
+
+    assert len(uploaded) == 2
+    assert uploaded[0].startswith("objects/")
+    assert uploaded[1] == "site/manifest.bin"
+
+
+def test_compressible_files_get_precompressed_variants(tmp_path, local_backend, settings):
+    settings.COMPRESS_MIN_SIZE = 100
+    script = "console.log('hello');\n" * 50
+    archive_path = _write_site(
+        tmp_path / "site.zip", {"app.js": script, "small.css": "a{}", "logo.png": "\x89PNG" * 100}
+    )
+
+    with open(archive_path, "rb") as archive:
+        manifest = local_backend.read_manifest(local_backend.upload_file(archive, "site", is_zip=True))
+
+    assert [bool(entry.encodings) for entry in manifest] == [True, False, False]
+    entry = manifest.lookup("app.js")
+    digest = entry.digest
+    assert sorted(entry.encodings) == sorted(compression.ENCODINGS)
+    assert entry.encodings["gzip"] == os.path.getsize(local_backend.path(f"objects/{digest}.gz"))
+    with local_backend.open(f"objects/{digest}.gz") as file:
+        assert gzip.decompress(file.read()).decode() == script
+    if "br" in compression.ENCODINGS:
+        with local_backend.open(f"objects/{digest}.br") as file:
+            assert compression.brotli.decompress(file.read()).decode() == script
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("gzip, deflate, br", "br"),
+    ("gzip", "gzip"),
+    ("br;q=0.5, gzip", "gzip"),
+    ("*", "br"),
+    ("br;q=0, gzip;q=0", None),
+    ("identity", None),
+    ("", None),
+])
+def test_negotiate_encoding(header, expected):
+    assert compression.negotiate(header, ["br", "gzip"]) == expected
+    assert compression.negotiate(header, ["gzip"]) == (expected and "gzip")
+
+
+def test_local_backend_rejects_paths_outside_root(local_backend):
+    with pytest.raises(ValueError):
+        local_backend._upload_file(io.BytesIO(b"x"), "../escape.txt")
+
+
+def test_serve_file_streams_from_local_backend(local_backend, monkeypatch):
+    local_backend._upload_file(io.BytesIO(b"<p>hi</p>"), "site/index.html")
+    monkeypatch.setattr(StorageService, "get_storage_backend", lambda: local_backend)
+
+    response = views.serve_file(RequestFactory().get("/media/site/index.html"), "site/index.html")
+
+    assert response.streaming
+    assert response["Content-Type"] == "text/html"
+    assert b"".join(response.streaming_content) == b"<p>hi</p>"
+    with pytest.raises(Http404):
+        views.serve_file(RequestFactory().get("/media/missing"), "site/missing.html")
+
+
+class Fetches:
+    """Counts fetches of cached content."""
+
+    def __init__(self, content):
+        self.content = content
+        self.count = 0
+
+    def __call__(self):
+        self.count += 1
+        return [self.content[i:i + 4] for i in range(0, len(self.content), 4)]
+
+
+@pytest.fixture
+def asset_cache(tmp_path):
+    return AssetCache(
+        memory_bytes=32, memory_entry_max=16, directory=str(tmp_path / "cache"), disk_bytes=100, disk_entry_max=64
+    )
+
+
+def test_asset_cache_serves_small_files_from_memory(asset_cache):
+    fetch = Fetches(b"<h1>hi</h1>")
+
+    for _ in range(3):
+        assert asset_cache.open("site/index.html", "v1", 11, fetch).read() == b"<h1>hi</h1>"
+
+    assert fetch.count == 1
+    assert asset_cache.stats()["hits"] == 2
+    # A new version of the blob is a different entry
+    asset_cache.open("site/index.html", "v2", 11, Fetches(b"<h1>new</h1>"))
+    assert asset_cache.stats()["misses"] == 2
+
+
+def test_asset_cache_keeps_larger_files_on_disk(asset_cache, tmp_path):
+    content = bytes(range(40))
+    fetch = Fetches(content)
+
+    with asset_cache.open("objects/abc", "abc", 40, fetch) as file:
+        assert file.read() == content
+    with asset_cache.open("objects/abc", "abc", 40, fetch) as file:
+        assert file.read() == content
+
+    assert fetch.count == 1
+    assert asset_cache.stats()["disk_hits"] == 1
+    # Too large for either tier
+    assert asset_cache.open("objects/big", "big", 65, fetch) is None
+
+    # A new process adopts the entries already on disk
+    cache = AssetCache(0, 0, str(tmp_path / "cache"), 100, 64)
+    assert cache.open("objects/abc", "abc", 40, pytest.fail).read() == content
+
+
+def test_asset_cache_evicts_within_budgets(asset_cache, tmp_path):
+    for i in range(4):
+        asset_cache.open(f"objects/{i}", str(i), 40, Fetches(bytes(40)))
+    asset_cache.open("a", "1", 16, Fetches(bytes(16)))
+    asset_cache.open("b", "1", 16, Fetches(bytes(16)))
+    asset_cache.open("c", "1", 16, Fetches(bytes(16)))
+
+    stats = asset_cache.stats()
+    assert stats["memory_bytes"] <= 32
+    assert stats["disk_bytes"] <= 100
+    assert sum(os.path.getsize(entry.path) for entry in os.scandir(tmp_path / "cache")) <= 100
+
+
+def test_asset_cache_coalesces_concurrent_misses(asset_cache):
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def slow_fetch():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return [b"shared"]
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(asset_cache.open("index.html", "v", 6, slow_fetch).read()))
+        for _ in range(5)
+    ]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    while asset_cache.stats()["coalesced"] < 4:
+        pass
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert calls == [1]
+    assert results == [b"shared"] * 5
+
+
+def test_asset_cache_invalidates_by_prefix(asset_cache):
+    asset_cache.open("site/manifest.bin", "v", 2, Fetches(b"{}"))
+    asset_cache.open("site/big.json", "v", 40, Fetches(bytes(40)))
+    asset_cache.open("other/manifest.bin", "v", 2, Fetches(b"{}"))
+
+    asset_cache.invalidate("site/")
+
+    fetch = Fetches(b"{}")
+    asset_cache.open("site/manifest.bin", "v", 2, fetch)
+    asset_cache.open("other/manifest.bin", "v", 2, fetch)
+    assert fetch.count == 1
+    assert asset_cache.stats()["disk_bytes"] == 2 + 2
@@ -0,0 +1,104 @@
+import os
+import signal
+from unittest import mock
+
+import pytest
+from project import tuning
+
+MB = tuning.MB
+
+
+def _cgroup(tmp_path, files):
+    for name, content in files.items():
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content + "\n")
+    return str(tmp_path)
+
+
+@pytest.fixture
+def four_cpus():
+    with mock.patch.object(os, "sched_getaffinity", return_value=set(range(4)), create=True):
+        yield
+
+
+@pytest.mark.parametrize(
+    "files, expected",
+    [
+        ({"cpu.max": "150000 100000"}, 2),
+        ({"cpu.max": "max 100000"}, 4),
+        ({"cpu.max": "1600000 100000"}, 4),
+        ({"cpu/cpu.cfs_quota_us": "50000", "cpu/cpu.cfs_period_us": "100000"}, 1),
+        ({"cpu/cpu.cfs_quota_us": "-1", "cpu/cpu.cfs_period_us": "100000"}, 4),
+        ({}, 4),
+    ],
+)
+def test_cpu_limit(tmp_path, four_cpus, files, expected):
+    assert tuning.cpu_limit(_cgroup(tmp_path, files)) == expected
+
+
+@pytest.mark.parametrize(
+    "files, expected",
+    [
+        ({"memory.max": str(1792 * MB)}, 1792 * MB),
+        ({"memory.max": "max"}, None),
+        ({"memory/memory.limit_in_bytes": str(512 * MB)}, 512 * MB),
+        ({"memory/memory.limit_in_bytes": str(2**63 - 4096)}, None),
+        ({}, None),
+    ],
+)
+def test_memory_limit(tmp_path, files, expected):
+    physical = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    assert tuning.memory_limit(_cgroup(tmp_path, files)) == (expected or physical)
+
+
+def test_plan_fits_workers_in_memory():
+    # An S1 instance: one core, 1.75 GB
+    s1 = tuning.plan("uploads", 1, 1792 * MB)
+    assert (s1.worker_class, s1.workers, s1.threads) == ("gthread", 2, 16)
+
+    # A large host is limited by its CPUs...
+    host = tuning.plan("api", 16, 64 * 1024 * MB)
+    assert (host.workers, host.threads) == (33, 4)
+    # ...unless the memory limit is lower
+    capped = tuning.plan("api", 16, 2048 * MB)
+    assert capped.workers == 7
+    assert capped.workers * (160 + capped.threads * 8) <= 2048 * 0.8 - 160
+
+
+def test_plan_keeps_one_worker_with_fewer_threads():
+    tuned = tuning.plan("uploads", 4, 512 * MB)
+    assert tuned.workers == 1
+    assert tuned.threads == 3
+    assert tuned.max_rss_growth == 89 * MB
+
+
+def test_plan_overrides():
+    tuned = tuning.plan("asgi", 2, 4096 * MB, workers=5, threads=3, max_rss_growth=0)
+    assert (tuned.worker_class, tuned.workers, tuned.threads, tuned.max_rss_growth) == (
+        "uvicorn_worker.UvicornWorker", 5, 3, 0
+    )
+
+
+def test_plan_unknown_profile():
+    with pytest.raises(ValueError):
+        tuning.plan("batch", 1, 1024 * MB)
+
+
+def test_rss_watchdog_recycles_worker():
+    sizes = iter([100 * MB, 150 * MB, 260 * MB])
+    watchdog = tuning.RSSWatchdog(128 * MB, interval=0, rss=lambda: next(sizes))
+
+    with mock.patch.object(os, "kill") as kill:
+        watchdog.run()
+
+    kill.assert_called_once_with(os.getpid(), signal.SIGTERM)
+
+
+def test_rss_watchdog_stops():
+    watchdog = tuning.RSSWatchdog(128 * MB, interval=0.01, rss=lambda: 100 * MB)
+    watchdog.start()
+    watchdog.stop()
+    watchdog.join(1)
+
+    assert not watchdog.is_alive()
@@ -14,4 +14,7 @@ python3 manage.py migrate
 # python3 manage.py loaddata seed_data.json
 python3 manage.py collectstatic --no-input
 
+echo "${0}: starting deployment job worker."
+python3 manage.py runjobs &
+
 python3 -m gunicorn project.wsgi:application
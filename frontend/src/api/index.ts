@@ -3,16 +3,73 @@ import axios from 'axios';
 
 const apiUrl = import.meta.env.VITE_BACKEND_URL + 'api/';
 
-export const uploadFile = async (file: any) => {
+type UploadSession = {
+  upload_id: string;
+  offset: number;
+  size: number;
+  chunk_size: number;
+  upload_url: string;
+};
+
+const CHUNK_RETRIES = 5;
+
+const sleep = (ms: number) => new Promise((resolve) => setTimeout(resolve, ms));
+
+// Remembers the session of a file, so a reload can resume its upload
+const sessionKey = (file: File) => `upload:${file.name}:${file.size}:${file.lastModified}`;
+
+const getUploadSession = async (file: File): Promise<UploadSession> => {
+  const uploadId = localStorage.getItem(sessionKey(file));
+  if (uploadId) {
+    try {
+      const response = await axios.get(`${apiUrl}projects/uploads/${uploadId}/`);
+      return response.data;
+    } catch {
+      localStorage.removeItem(sessionKey(file));
+    }
+  }
   const formData = new FormData();
-  formData.append('file', file);
-  
+  formData.append('file_name', file.name);
+  formData.append('size', String(file.size));
+  const response = await axios.post(`${apiUrl}projects/uploads/`, formData);
+  localStorage.setItem(sessionKey(file), response.data.upload_id);
+  return response.data;
+};
+
+// Sends the chunk at `offset` and returns the server's new offset. Failed
+// chunks are retried with backoff; after a conflict the upload continues
+// from whatever offset the server reports.
+const uploadChunk = async (session: UploadSession, file: File, offset: number): Promise<number> => {
+  const chunk = file.slice(offset, offset + session.chunk_size);
+  for (let attempt = 1; ; attempt++) {
+    try {
+      const response = await axios.put(`${apiUrl}projects/uploads/${session.upload_id}/`, chunk, {
+        params: { offset },
+        headers: { 'Content-Type': 'application/octet-stream' },
+      });
+      return response.data.offset;
+    } catch (error: any) {
+      if (error.response?.status === 409 && typeof error.response.data?.offset === 'number') {
+        return error.response.data.offset;
+      }
+      if (attempt >= CHUNK_RETRIES) {
+        throw error;
+      }
+      await sleep(500 * 2 ** attempt);
+    }
+  }
+};
+
+export const uploadFile = async (file: File, onProgress?: (fraction: number) => void) => {
   try {
-    const response = await axios.post(`${apiUrl}projects/`, formData, {
-      headers: {
-        'Content-Type': 'multipart/form-data',
-      },
-    });
+    const session = await getUploadSession(file);
+    let offset = session.offset;
+    while (offset < file.size) {
+      offset = await uploadChunk(session, file, offset);
+      onProgress?.(offset / file.size);
+    }
+    const response = await axios.post(`${apiUrl}projects/uploads/${session.upload_id}/complete/`);
+    localStorage.removeItem(sessionKey(file));
     return response.data;
   } catch (error) {
     console.error("Error uploading file", error);
@@ -22,7 +79,7 @@ export const uploadFile = async (file: any) => {
 
 export const assignDomain = async (projectId: number, domain: string) => {
   try {
-    const response = await axios.post(`${apiUrl}projecs/${projectId}/domain`, { domain });
+    const response = await axios.post(`${apiUrl}projects/${projectId}/domain/`, { domain });
     return response.data;
   } catch (error) {
     console.error("Error assigning domain", error);
@@ -40,20 +97,21 @@ export const deleteProject = async (projectId: number) => {
   }
 };
 
-export const getProjects = async () => {
+export type ProjectPage = {
+  projects: Project[];
+  nextCursor: string | null;
+};
+
+export const getProjects = async (cursor?: string | null): Promise<ProjectPage> => {
   try {
-    const response = await axios.get(`${apiUrl}projects/`);
-    let projects:Project[] = response.data;
+    const response = await axios.get(`${apiUrl}projects/`, {
+      params: cursor ? { cursor } : {},
+    });
+    const projects: Project[] = response.data.results;
 
     console.info('get projects')
-    projects = projects.map((project) => {
-      const fileUrl = project.file;
-
-      console.info('file url', fileUrl)
-      return project;
-    })
     console.info(JSON.stringify(projects))
-    return projects
+    return { projects, nextCursor: response.data.next_cursor };
 
   } catch (error) {
     console.error("Error fetching projects", error);
@@ -3,7 +3,7 @@ import { uploadFile } from '@/api';
 import DomainAssign from './domain-assign';
 
 const FileUpload = () => {
-  const [file, setFile] = useState(null);
+  const [file, setFile] = useState<File | null>(null);
   const [error, setError] = useState("");
   const [projectId, setProjectId] = useState(0)
 
@@ -19,7 +19,7 @@ const FileUpload = () => {
     }
 
     try {
-      const {id: projectId} = await uploadFile(file);
+      const {project_id: projectId} = await uploadFile(file);
       setError("");
       setProjectId(projectId);
       alert("File uploaded successfully!");
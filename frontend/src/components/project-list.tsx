@@ -4,6 +4,7 @@ import { Project } from '@/types';
 
 const ProjectList = () => {
   const [projects, setProjects] = useState<Project[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const [reallyDelete, setReallyDelete] = useState<number>(0); 
   
   let timeout:NodeJS.Timeout
@@ -28,10 +29,11 @@ const ProjectList = () => {
     throw new Error('Backend URL is not defined');
   }
   
-  const fetchProjects = async () => {
+  const fetchProjects = async (cursor?: string | null) => {
     try {
-      const data = await getProjects();
-      setProjects(data);
+      const page = await getProjects(cursor);
+      setProjects(cursor ? [...projects, ...page.projects] : page.projects);
+      setNextCursor(page.nextCursor);
     } catch (err) {
       throw new Error("Error fetching projects");
     }
@@ -65,7 +67,7 @@ const ProjectList = () => {
                 <span>
                   {project.name} - {project.domain}{' '}
                   </span>
-                <a href={project.file} target="_blank">Link</a>
+                {project.url && <a href={project.url} target="_blank">Link</a>}
                 </div>
                 <button onClick={() => reallyDelete===project.id ? handleDelete(project.id) : setReallyDelete(project.id)}>{reallyDelete===project.id ? 'Really delete?' : "Delete"}</button>
               </div>
@@ -76,6 +78,7 @@ const ProjectList = () => {
           ))}
         </ul>) ||
         <p>You have not uploaded a project.</p>}
+        {nextCursor && <button onClick={() => fetchProjects(nextCursor)}>Load more</button>}
       </div>
   );
 };
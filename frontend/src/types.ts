@@ -4,6 +4,7 @@ export type Project = {
     name: string;
     description: string;
     domain: string;
-    file: string;
+    active_deployment: string | null;
+    url: string | null;
     created_at: Date
 }
\ No newline at end of file
@@ -0,0 +1,274 @@
+"""Load generator for the projects API.
+
+Replays a weighted mix of project list, upload, domain assignment and delete
+calls from concurrent clients, then reports throughput, error rate and
+p50/p95/p99 latency per call and overall. Either point it at a running
+server, or let it start gunicorn with backend/gunicorn.conf.py so that
+worker and thread settings can be compared::
+
+    python scripts/loadtest.py --start-server --workers 4 --threads 8 --duration 60
+    python scripts/loadtest.py --url http://127.0.0.1:8000 --mix list=90,upload=10 --json run.json
+
+Requests carry the Origin the API accepts (WEBSITE_HOSTNAME). Uploads queue
+deployment jobs; run the job worker alongside if those should be processed
+as well.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import signal
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import uuid
+import zipfile
+
+import requests
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+OPERATIONS = ("list", "upload", "assign", "delete")
+
+
+def parse_mix(value):
+    """Parses ``"list=70,upload=10"`` into ``{operation: weight}``."""
+    mix = {}
+    for item in value.split(","):
+        name, _, weight = item.strip().partition("=")
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"Unknown operation {name!r}, expected one of {', '.join(OPERATIONS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def make_archive(files, size):
+    """A small site archive to upload, built once per run."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("index.html", "<html><body>load test</body></html>")
+        for index in range(files - 1):
+            archive.writestr(f"assets/file-{index}.txt", os.urandom(size // 2).hex())
+    return buffer.getvalue()
+
+
+class Stats:
+    """Latencies and failures per operation, shared by the clients."""
+
+    def __init__(self):
+        self.latencies = {name: [] for name in OPERATIONS}
+        self.errors = {name: 0 for name in OPERATIONS}
+        self.statuses = {}
+        self.lock = threading.Lock()
+
+    def record(self, name, seconds, status):
+        with self.lock:
+            self.latencies[name].append(seconds)
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            # Connection failures are recorded with status 0
+            if not 200 <= status < 400:
+                self.errors[name] += 1
+
+    def summary(self, elapsed):
+        def row(latencies, errors):
+            if not latencies:
+                return None
+            if len(latencies) > 1:
+                cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+                p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+            else:
+                p50 = p95 = p99 = latencies[0]
+            return {
+                "requests": len(latencies),
+                "requests_per_s": round(len(latencies) / elapsed, 1),
+                "error_rate": round(errors / len(latencies), 4),
+                "p50_ms": round(p50 * 1000, 1),
+                "p95_ms": round(p95 * 1000, 1),
+                "p99_ms": round(p99 * 1000, 1),
+            }
+
+        rows = {name: row(self.latencies[name], self.errors[name]) for name in OPERATIONS}
+        rows = {name: value for name, value in rows.items() if value is not None}
+        everything = [seconds for latencies in self.latencies.values() for seconds in latencies]
+        rows["total"] = row(everything, sum(self.errors.values()))
+        return rows
+
+
+class Client(threading.Thread):
+    """Sends requests in a loop on one keep-alive connection until ``stop``
+    is set."""
+
+    def __init__(self, args, mix, archive, projects, stats, stop):
+        super().__init__(daemon=True)
+        self.args = args
+        self.names, self.weights = zip(*mix.items())
+        self.archive = archive
+        self.projects = projects
+        self.stats = stats
+        self.stop = stop
+        self.session = requests.Session()
+        self.session.headers["Origin"] = args.origin
+        self.random = random.Random()
+
+    def run(self):
+        while not self.stop.is_set():
+            name = self.random.choices(self.names, self.weights)[0]
+            project_id = None
+            if name in ("assign", "delete"):
+                project_id = self.projects.take(name == "delete")
+                if project_id is None:
+                    # Nothing to work on yet: create something instead
+                    name = "upload"
+            start = time.perf_counter()
+            try:
+                response = getattr(self, name)(project_id)
+                status = response.status_code
+            except requests.RequestException:
+                response, status = None, 0
+            self.stats.record(name, time.perf_counter() - start, status)
+            if name == "upload" and status == 202:
+                self.projects.add(response.json()["project_id"])
+
+    def list(self, project_id):
+        return self.session.get(f"{self.args.url}/api/projects/", timeout=self.args.timeout)
+
+    def upload(self, project_id):
+        files = {"file": ("site.zip", self.archive, "application/zip")}
+        return self.session.post(f"{self.args.url}/api/projects/", files=files, timeout=self.args.timeout)
+
+    def assign(self, project_id):
+        domain = f"load-{uuid.uuid4().hex[:12]}.example.test"
+        return self.session.post(
+            f"{self.args.url}/api/projects/{project_id}/domain/", json={"domain": domain}, timeout=self.args.timeout
+        )
+
+    def delete(self, project_id):
+        return self.session.delete(f"{self.args.url}/api/projects/{project_id}/", timeout=self.args.timeout)
+
+
+class Projects:
+    """Ids of the projects this run created, for assign and delete calls."""
+
+    def __init__(self):
+        self.ids = []
+        self.lock = threading.Lock()
+
+    def add(self, project_id):
+        with self.lock:
+            self.ids.append(project_id)
+
+    def take(self, remove):
+        with self.lock:
+            if not self.ids:
+                return None
+            index = random.randrange(len(self.ids))
+            if remove:
+                # Swap with the last id so removal is O(1)
+                self.ids[index], self.ids[-1] = self.ids[-1], self.ids[index]
+                return self.ids.pop()
+            return self.ids[index]
+
+
+def start_server(args):
+    """Starts gunicorn with the repo's config and waits until it answers."""
+    command = [
+        sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "project.wsgi:application",
+        "--bind", args.bind,
+    ]
+    if args.workers:
+        command += ["--workers", str(args.workers)]
+    if args.threads:
+        command += ["--threads", str(args.threads)]
+    server = subprocess.Popen(command, cwd=BACKEND_DIR)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise SystemExit(f"gunicorn exited with status {server.returncode}")
+        try:
+            requests.get(f"{args.url}/api/projects/", headers={"Origin": args.origin}, timeout=1)
+            return server
+        except requests.RequestException:
+            time.sleep(0.5)
+    server.terminate()
+    raise SystemExit("gunicorn did not start within 60 seconds")
+
+
+def print_summary(rows, elapsed, statuses):
+    print(f"\n{elapsed:.1f}s, responses by status: {dict(sorted(statuses.items()))}")
+    print(f"{'operation':<10} {'requests':>9} {'req/s':>8} {'errors':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, row in rows.items():
+        print(
+            f"{name:<10} {row['requests']:>9} {row['requests_per_s']:>8} {row['error_rate']:>8.2%} "
+            f"{row['p50_ms']:>9} {row['p95_ms']:>9} {row['p99_ms']:>9}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Base URL of the server")
+    parser.add_argument("--origin", default=os.getenv("WEBSITE_HOSTNAME", "http://localhost:5173"),
+                        help="Origin header the API accepts (WEBSITE_HOSTNAME)")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("list=70,upload=10,assign=10,delete=10"),
+                        help="Weighted operations, e.g. list=70,upload=10,assign=10,delete=10")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent clients")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to run for")
+    parser.add_argument("--warmup", type=float, default=3, help="Seconds to run before measuring")
+    parser.add_argument("--seed-projects", type=int, default=20, help="Projects to upload before starting")
+    parser.add_argument("--archive-files", type=int, default=10, help="Files in each uploaded archive")
+    parser.add_argument("--archive-file-size", type=int, default=4096, help="Bytes per uploaded file")
+    parser.add_argument("--timeout", type=float, default=60, help="Seconds before a request counts as failed")
+    parser.add_argument("--json", help="Also write the summary to this file")
+    parser.add_argument("--start-server", action="store_true", help="Start gunicorn with backend/gunicorn.conf.py")
+    parser.add_argument("--bind", default="127.0.0.1:8000", help="Address for --start-server")
+    parser.add_argument("--workers", type=int, help="Override the gunicorn worker count")
+    parser.add_argument("--threads", type=int, help="Override the gunicorn thread count")
+    args = parser.parse_args()
+    args.url = args.url.rstrip("/")
+
+    server = start_server(args) if args.start_server else None
+    try:
+        archive = make_archive(args.archive_files, args.archive_file_size)
+        projects = Projects()
+        seeder = Client(args, {"upload": 1}, archive, projects, Stats(), threading.Event())
+        for _ in range(args.seed_projects):
+            response = seeder.upload(None)
+            if response.status_code != 202:
+                raise SystemExit(f"Seeding failed with {response.status_code}: {response.text[:200]}")
+            projects.add(response.json()["project_id"])
+
+        stop = threading.Event()
+        stats = Stats()
+        clients = [Client(args, args.mix, archive, projects, stats, stop) for _ in range(args.concurrency)]
+        for client in clients:
+            client.start()
+        time.sleep(args.warmup)
+        # Measure from here: discard what the warmup recorded
+        with stats.lock:
+            fresh = Stats()
+            stats.latencies, stats.errors, stats.statuses = fresh.latencies, fresh.errors, fresh.statuses
+        start = time.perf_counter()
+        time.sleep(args.duration)
+        stop.set()
+        elapsed = time.perf_counter() - start
+        for client in clients:
+            client.join(args.timeout)
+
+        rows = stats.summary(elapsed)
+        print_summary(rows, elapsed, stats.statuses)
+        if args.json:
+            with open(args.json, "w") as file:
+                json.dump({
+                    "url": args.url, "mix": args.mix, "concurrency": args.concurrency,
+                    "workers": args.workers, "threads": args.threads, "seconds": round(elapsed, 1),
+                    "operations": rows,
+                }, file, indent=2)
+    finally:
+        if server is not None:
+            server.send_signal(signal.SIGTERM)
+            server.wait(30)
+
+
+if __name__ == "__main__":
+    main()